@@ -24,7 +24,8 @@ The other usage of 'ability' in the rules (113.1c) (an object on the stack) is r
         return {game.battlefield}
 
     def __copy__(self):
-        a = copy_excluding(self, ["src"])
+        a = object.__new__(type(self))
+        a.__dict__.update(self.__dict__)
         a.src = None
         return a
 
@@ -128,8 +129,8 @@ def can_target(ab: EffectThatCanGoOnTheStack, controller: Player, target: game.G
     # agh; this actually requires passing around the original stack object...
     if target.zone == game.stack and (target == ab.src or (isinstance(target, _SpellAbWrapper) and target.ab_src == ab)):
         return False
-    # todo: check for protection, hexproof, etc; with general permission system
-    return True
+    import permissions
+    return permissions.can_target(ab, controller, target)
 
 
 class SpellAbility(EffectThatCanGoOnTheStack):
@@ -225,7 +226,79 @@ class TriggeredAbility(EffectThatCanGoOnTheStack):
 
 class StaticAbility(Ability):
     """A static ability"""
-    pass
+
+    def register(self):
+        """Called when this ability's source enters a zone where it is active"""
+        pass
+
+    def unregister(self):
+        """Called when this ability's source leaves the zones where it is active"""
+        pass
+
+
+class ContinuousAbility(StaticAbility):
+    """A static ability that generates continuous effects while it is active"""
+
+    def effects(self) -> list:
+        """Returns new instances of the continuous effects this ability generates"""
+        return []
+
+    def register(self):
+        import layers
+        layers.add_static(self)
+
+    def unregister(self):
+        import layers
+        layers.remove_static(self)
+
+
+class ReplacementAbility(StaticAbility):
+    """A static ability that generates replacement effects while it is active"""
+
+    def effects(self) -> list:
+        """Returns new instances of the replacement effects this ability generates"""
+        return []
+
+    def register(self):
+        import replacement
+        replacement.add_static(self)
+
+    def unregister(self):
+        import replacement
+        replacement.remove_static(self)
+
+
+class RestrictionAbility(StaticAbility):
+    """A static ability that generates restrictions while it is active"""
+
+    def effects(self) -> list:
+        """Returns new instances of the restrictions this ability generates"""
+        return []
+
+    def register(self):
+        import permissions
+        permissions.add_static(self)
+
+    def unregister(self):
+        import permissions
+        permissions.remove_static(self)
+
+
+class ProtectionAbility(KeywordAbility):
+    """Protection from a colour, given as a letter such as "R", or from a card type (702.16)"""
+
+    def __init__(self, quality: str):
+        super().__init__("protection")
+        self.quality = quality
+
+    def protects_from(self, src) -> bool:
+        """Returns true if this protects from the given source"""
+        if self.quality in "WUBRG":
+            return self.quality in src.colours
+        return src.has_type(self.quality)
+
+    def __repr__(self):
+        return f"protection from {self.quality}"
 
 
 class SimpleManaAbility(ActivatedAbility):
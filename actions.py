@@ -2,10 +2,13 @@ from dataclasses import dataclass
 
 from numpy import isin
 import game
+import limits
+import stats
 from game import Player, Card
 from objectsets import NoChoices
 import turn as T
 from abilities import ActivatedAbility, SpellAbility
+from cost import can_pay_all
 
 
 class ActionFailed(Exception):
@@ -48,7 +51,8 @@ class PlayCard(Action):
             if isinstance(ab, SpellAbility):
                 return ab.make_choices(p)
 
-    def can_take_action(self, p: Player, chocies=None):
+    def can_take_action(self, p: Player, chocies=None, affordable=None):
+        """affordable is whether p can pay the card's cost, if that's already known"""
         c = self.card
         if c.dead:
             return False
@@ -63,7 +67,7 @@ class PlayCard(Action):
             if not can_play_land(p):
                 return False
         else:
-            if not c.cost.can_pay(p):
+            if not (c.cost.can_pay(p) if affordable is None else affordable):
                 return False  # todo: alt/add costs, other choices that affect the cost like X
 
         return True
@@ -95,14 +99,32 @@ class ActivateAbility(Action):
         self.ab.activate(p, choices)
 
 
+def legal_actions(p: Player):
+    """Yields the actions p can take now, without making any choices for them: playing cards and activating abilities"""
+    hand = list(p.hand)
+    # whether p can pay for each card in their hand, all checked at once
+    affordable = dict(zip(hand, can_pay_all([c.cost for c in hand], p, hand)))
+    for card in list(game.objects.values()):
+        if card in affordable:
+            act = PlayCard(card)
+            if act.can_take_action(p, None, affordable[card]):
+                yield act
+        for ab in card.abilities:
+            if isinstance(ab, ActivatedAbility):
+                act = ActivateAbility(ab)
+                if act.can_take_action(p, None):
+                    yield act
+
+
 def start_game(first: Player = None):
     """Starts the game"""
     if first is None:
         first = game.players[0]
     for p in game.players:
         p.draw(7)
-    game.turn = T.Turn(first)
+    game.set_state("turn", T.Turn(first))
     game.turn.phase.skip_step("draw")
+    limits.turn_started()
 
 
 def do_turn():
@@ -111,6 +133,7 @@ def do_turn():
     t.start()
     while not t.finished:
         pri = t.priority
+        stats.count_decision("action")
         act = pri.decide_action()
         if act is None:
             t.pass_priority()
@@ -118,13 +141,14 @@ def do_turn():
             try:
                 ch = act.make_choices(pri)
             except NoChoices:
-                print("No possible choices")
+                pri.action_failed(act, "No possible choices")
                 continue
             if act.can_take_action(pri, ch):
                 act.take_action(pri, ch)
                 t.take_action()
             else:
-                print("Illegal action")
-    game.turn_idx += 1
-    nt = T.Turn(game.next_player(t.active_player))
-    game.turn = nt
+                pri.action_failed(act, "Illegal action")
+    game.set_state("turn_idx", game.turn_idx + 1)
+    nt = T.Turn(game.live_player(game.next_player(t.active_player)))
+    game.set_state("turn", nt)
+    limits.turn_started()
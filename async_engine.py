@@ -0,0 +1,178 @@
+"""
+Playing many games at once from an asyncio event loop, with players whose decisions are made by coroutines.
+
+The engine asks for decisions from deep inside the rules code (while paying costs, choosing targets, ordering
+replacement effects and so on), so rather than making all of it asynchronous, each game is played in a thread of its
+own. Only one game's thread runs the engine at a time, with that game's state swapped in (see game.GameState).
+When it needs a decision from an AsyncPlayer, it swaps its state out and hands the decision to the event loop,
+which awaits the player's agent while other games carry on. A slow agent, such as a human or a remote bot,
+only holds up its own game.
+
+An agent sees the game in three steps. observe is called in the game's thread with its state current, and returns what
+the agent needs to know, as plain data. decide is then awaited on the event loop, where the game state must not be
+used, and returns the answer. Finally interpret is called back in the game's thread to turn the answer into the
+decision, such as an Action or a list of objects. If decide takes longer than the game's timeout, the player makes
+the default choice instead, as a Goldfish would.
+"""
+
+import asyncio
+import threading
+import game
+from actions import start_game, do_turn
+from game import Player
+
+# held by whichever thread is running the engine
+_engine_lock = threading.Lock()
+_current = threading.local()
+
+
+class Agent:
+    """Decides for an AsyncPlayer. kind is the name of the Player method that asked, without "decide_",
+    and args are its arguments."""
+
+    def observe(self, player: Player, kind: str, args: tuple):
+        """Returns what decide needs to know. Called with the game state current."""
+        return None
+
+    async def decide(self, player: Player, kind: str, observation):
+        """Returns the answer to a decision. Called on the event loop, without the game state."""
+        return None
+
+    def interpret(self, player: Player, kind: str, args: tuple, answer):
+        """Turns the answer from decide into the decision. Called with the game state current."""
+        return answer
+
+
+class AsyncPlayer(Player):
+    """A player whose decisions are made by an agent on the event loop. It must be created in an AsyncGame's setup."""
+
+    def __init__(self, name: str, agent: Agent):
+        super().__init__(name)
+        self.agent = agent
+
+    def _decide(self, kind: str, *args):
+        g = _current.game
+        obs = self.agent.observe(self, kind, args)
+        answer = g._request(self, kind, obs)
+        if answer is _DEFAULT:
+            return getattr(Player, "decide_" + kind)(self, *args)
+        return self.agent.interpret(self, kind, args, answer)
+
+    def decide_action(self):
+        return self._decide("action")
+
+    def decide_objects(self, obs, reason=None, min: int = 1, max: int = None, order_matters=False):
+        return self._decide("objects", obs, reason, min, max, order_matters)
+
+    def decide_attacks(self):
+        return self._decide("attacks")
+
+    def decide_blocks(self, atks: dict) -> list:
+        return self._decide("blocks", atks)
+
+    def decide_order(self, objects: list, reason=None) -> list:
+        return self._decide("order", objects, reason)
+
+    def decide_damage(self, orders: dict):
+        return self._decide("damage", orders)
+
+
+# the answer when a decision times out
+_DEFAULT = object()
+
+
+class AsyncGame:
+    """
+    A game played in its own thread. setup is called with the game's state current to create its players and cards.
+    timeout is the number of seconds each decision may take; and if max_turns is given,
+    the game is stopped without a winner after that many turns.
+    """
+
+    def __init__(self, setup, timeout: float = None, max_turns: int = None):
+        self.setup = setup
+        self.timeout = timeout
+        self.max_turns = max_turns
+        # the state of this game, while it isn't running; and of whatever was current before it, while it is
+        self.state = game.GameState()
+        self.loop = None
+        self.winner = None
+        # why the game ended; see game.end_game
+        self.end_reason = None
+        self.finished = False
+
+    def _resume(self):
+        _engine_lock.acquire()
+        self.state.swap()
+
+    def _suspend(self):
+        self.state.swap()
+        _engine_lock.release()
+
+    def _request(self, pl: Player, kind: str, obs):
+        """Returns the answer to a decision, made on the event loop while this game is suspended.
+        Called in the game's thread with its state current."""
+        fut = asyncio.run_coroutine_threadsafe(self._await_decision(pl, kind, obs), self.loop)
+        self._suspend()
+        try:
+            return fut.result()
+        finally:
+            self._resume()
+
+    async def _await_decision(self, pl: Player, kind: str, obs):
+        try:
+            return await asyncio.wait_for(pl.agent.decide(pl, kind, obs), self.timeout)
+        except asyncio.TimeoutError:
+            return _DEFAULT
+
+    def _run(self):
+        _current.game = self
+        self._resume()
+        try:
+            self.setup()
+            start_game()
+            while self.max_turns is None or game.turn_idx < self.max_turns:
+                do_turn()
+            self.end_reason = "turn limit"
+        except game.GameOver:
+            self.winner = game.winner
+            self.end_reason = game.end_reason
+        finally:
+            self.finished = True
+            self._suspend()
+
+    async def play(self):
+        """Plays the game to the end, returning the winner"""
+        self.loop = asyncio.get_running_loop()
+        done = self.loop.create_future()
+
+        def run():
+            try:
+                self._run()
+            except BaseException as e:
+                self.loop.call_soon_threadsafe(done.set_exception, e)
+            else:
+                self.loop.call_soon_threadsafe(done.set_result, self.winner)
+
+        threading.Thread(target=run, daemon=True).start()
+        return await done
+
+    def view(self):
+        """Returns a context in which this game's state is current, for inspecting it once it has finished"""
+        assert self.finished
+        return _Viewing(self)
+
+
+class _Viewing:
+    def __init__(self, g: AsyncGame):
+        self.g = g
+
+    def __enter__(self):
+        self.g._resume()
+
+    def __exit__(self, *args):
+        self.g._suspend()
+
+
+async def play_games(games: list) -> list:
+    """Plays the games concurrently, returning their winners"""
+    return await asyncio.gather(*(g.play() for g in games))
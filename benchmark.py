@@ -0,0 +1,264 @@
+"""
+Benchmarks for the engine.
+
+multiplayer: plays games between players who do nothing, for increasing numbers of players, and reports the time per
+priority pass. Turn order, APNAP order and elimination don't depend on the number of players, so the time per pass
+should stay roughly flat as players are added.
+
+memory: plays many games in a row in one process, as batch runs do, clearing the state after each. After each clear
+it records the memory still traced by tracemalloc and the number of GameObjects that haven't been collected, along
+with the allocation sites that grew most during the game. A run fails if, after warming up, retained memory grows by
+more than a threshold per game, or any GameObject outlives its game.
+
+serialize: plays a few turns of a game and reports how many times a second the position reached can be serialized
+and loaded back, with the garbage collector running as usual. The rates are the best of several runs.
+
+cardpool: fills an in-memory card pool with --cards made up cards, and reports the time each of a set of typical
+queries takes, the best of several runs.
+
+Run as `python benchmark.py` for multiplayer, or `python benchmark.py memory`, `python benchmark.py serialize` or
+`python benchmark.py cardpool`.
+"""
+
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+import game
+import serialize
+import turn
+from actions import start_game, do_turn
+from cards import build_deck, forest, mountain, grizzly_bears, lightning_bolt, memnite
+from match import play_game
+from players import Goldfish, Aggressive
+
+
+def _count_passes():
+    """Wraps Turn.pass_priority to count calls. Returns the count, as a one element list, and a function to unwrap it."""
+    count = [0]
+    orig = turn.Turn.pass_priority
+
+    def counted(self):
+        count[0] += 1
+        return orig(self)
+
+    turn.Turn.pass_priority = counted
+
+    def restore():
+        turn.Turn.pass_priority = orig
+    return count, restore
+
+
+def multiplayer(num_players: int, turns: int = 40, deck_size: int = 60) -> float:
+    """Plays turns turns of a game between num_players players who do nothing.
+    Returns the average time per priority pass, in seconds."""
+    game.clear_state()
+    for i in range(num_players):
+        build_deck(Goldfish(f"P{i}"), [forest] * deck_size)
+    count, restore = _count_passes()
+    try:
+        start = time.perf_counter()
+        start_game()
+        try:
+            for _ in range(turns):
+                do_turn()
+        except game.GameOver:
+            pass
+        elapsed = time.perf_counter() - start
+    finally:
+        restore()
+    return elapsed / max(count[0], 1)
+
+
+def serialization(turns: int = 6, runs: int = 20, number: int = 50) -> tuple:
+    """Plays turns turns of a game, then serializes the position and loads it back number times in each of runs runs.
+    Returns the number of objects in the position and the best rates of dumps and loads, per second."""
+    game.clear_state()
+    pls = [Aggressive("P0"), Aggressive("P1")]
+    build_deck(pls[0], [mountain, memnite, lightning_bolt] * 20)
+    build_deck(pls[1], [forest, grizzly_bears] * 30)
+    start_game()
+    try:
+        for _ in range(turns):
+            do_turn()
+    except game.GameOver:
+        pass
+    blob = serialize.dumps()
+
+    def rate(f):
+        best = float("inf")
+        for _ in range(runs):
+            start = time.perf_counter()
+            for _ in range(number):
+                f()
+            best = min(best, time.perf_counter() - start)
+        return number / best
+    return len(game.objects), rate(serialize.dumps), rate(lambda: serialize.loads(blob, pls))
+
+
+# typical card pool queries, as keyword arguments to CardPool.query
+POOL_QUERIES = [
+    dict(types="creature", max_mv=1),
+    dict(types="instant", colours="R"),
+    dict(keywords=["flying", "lifelink"]),
+    dict(types="creature", subtypes="goblin", colours="R", max_mv=2),
+    dict(supertypes="legendary", colourless=True, min_mv=0),
+    dict(colours="WU", min_mv=3, max_mv=4),
+]
+
+
+def card_pool(cards: int = 100000, runs: int = 5, seed: int = 0) -> tuple:
+    """Fills a card pool with made up cards, then runs each of POOL_QUERIES runs times.
+    Returns the time taken to fill the pool, and the best time and number of results of each query, in seconds."""
+    import cardpool
+    import carddefs
+    rng = random.Random(seed)
+    types = ["creature"] * 5 + ["instant", "sorcery", "enchantment", "artifact", "artifact creature", "land"]
+    subtypes = ["goblin", "elf", "human", "wizard", "zombie", "angel", "knight", "beast", "spirit", "soldier"]
+    keywords = ["flying", "lifelink", "haste", "trample", "deathtouch", "vigilance", "reach", "first strike"]
+    pool = cardpool.CardPool()
+    start = time.perf_counter()
+    with pool.db:
+        for i in range(cards):
+            ty = rng.choice(types)
+            d = {"name": f"Card {i}", "types": ty, "supertypes": "legendary" if rng.random() < 0.05 else ""}
+            if ty != "land":
+                coloured = "".join(rng.sample("WUBRG", rng.choice([0, 1, 1, 1, 2])))
+                d["cost"] = (str(rng.randrange(1, 5)) if rng.random() < 0.7 or not coloured else "") + coloured
+            if "creature" in ty:
+                d.update(subtypes=" ".join(rng.sample(subtypes, rng.choice([1, 2]))), power=rng.randrange(6),
+                         toughness=rng.randrange(1, 6), keywords=rng.sample(keywords, rng.choice([0, 0, 1, 2])))
+            pool.add(carddefs.normalize(d))
+    fill = time.perf_counter() - start
+    res = []
+    for q in POOL_QUERIES:
+        best = float("inf")
+        for _ in range(runs):
+            start = time.perf_counter()
+            n = len(pool.query(**q))
+            best = min(best, time.perf_counter() - start)
+        res.append((q, best, n))
+    pool.close()
+    return fill, res
+
+
+def live_objects() -> int:
+    """Returns the number of GameObjects that are still alive after a full collection"""
+    gc.collect()
+    return sum(1 for o in gc.get_objects() if isinstance(o, game.GameObject))
+
+
+# tracemalloc's own bookkeeping, and the report, aren't the engine's
+_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+
+
+@dataclass
+class MemoryReport:
+    """What was left after each of a run of games"""
+    # the games before this are warming up: filling caches and interning
+    warmup: int
+    # the bytes still traced after each game was cleared
+    retained: list = field(default_factory=list)
+    # the number of GameObjects still alive after each game was cleared, beyond those alive before the first
+    live: list = field(default_factory=list)
+    # the allocation sites that grew most during each game, before it was cleared
+    top: list = field(default_factory=list)
+    # the allocation sites that grew most between the end of warming up and the last game
+    growth_sites: list = field(default_factory=list)
+
+    @property
+    def growth(self) -> float:
+        """The bytes retained per game after warming up"""
+        n = len(self.retained) - self.warmup
+        if n <= 1:
+            return 0.0
+        return (self.retained[-1] - self.retained[self.warmup]) / (n - 1)
+
+    def failures(self, max_growth: float) -> list:
+        """Describes what's wrong with the run: growth of more than max_growth bytes a game, or leaked objects"""
+        res = []
+        if self.growth > max_growth:
+            res.append(f"retained memory grew by {self.growth:.0f}B a game, more than {max_growth:.0f}B")
+        if any(self.live):
+            worst = max(range(len(self.live)), key=lambda k: self.live[k])
+            res.append(f"{self.live[worst]} GameObjects outlived game {worst}")
+        return res
+
+    def __str__(self):
+        lines = [f"{'game':>4} {'retained':>10} {'live':>5}  top allocation sites"]
+        for k, (r, n, top) in enumerate(zip(self.retained, self.live, self.top)):
+            lines.append(f"{k:4} {r:10} {n:5}  {top[0] if top else ''}")
+            lines += [f"{'':22}{t}" for t in top[1:]]
+        lines.append(f"growth after {self.warmup} games: {self.growth:.0f}B/game")
+        lines += ["  " + s for s in self.growth_sites]
+        return "\n".join(lines)
+
+
+def memory(decks=None, games: int = 50, warmup: int = 5, top: int = 3, player=Aggressive,
+           max_turns: int = 20) -> MemoryReport:
+    """Plays games between a pair of decks one after another, taking turns going first, and reports what each left
+    behind. top is the number of allocation sites reported for each game."""
+    if decks is None:
+        decks = ([mountain, lightning_bolt, grizzly_bears, forest, memnite], [forest] * 2 + [grizzly_bears, memnite])
+    report = MemoryReport(warmup)
+    game.clear_state()
+    baseline = live_objects()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+        warm = before
+        for k in range(games):
+            play_game(decks[0], decks[1], k % 2, player, max_turns)
+            during = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+            report.top.append([str(s) for s in during.compare_to(before, "lineno")[:top]])
+            game.clear_state()
+            report.live.append(live_objects() - baseline)
+            before = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+            report.retained.append(sum(s.size for s in before.statistics("filename")))
+            if k == warmup:
+                warm = before
+        report.growth_sites = [str(s) for s in before.compare_to(warm, "lineno")[:top]]
+    finally:
+        tracemalloc.stop()
+    return report
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("mode", nargs="?", choices=["multiplayer", "memory", "serialize", "cardpool"],
+                        default="multiplayer")
+    parser.add_argument("--cards", type=int, default=100000, help="cards in the pool, for cardpool")
+    parser.add_argument("--games", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--top", type=int, default=3, help="allocation sites to report for each game")
+    parser.add_argument("--max-growth", type=float, default=1024, help="bytes a game that retained memory may grow by")
+    args = parser.parse_args()
+
+    if args.mode == "multiplayer":
+        print("players  us/pass")
+        for n in (2, 4, 8, 16):
+            print(f"{n:7}  {multiplayer(n) * 1e6:7.1f}")
+        return
+    if args.mode == "serialize":
+        objects, dumps, loads = serialization()
+        print(f"{objects} objects: dumps {dumps:.0f}/s, loads {loads:.0f}/s")
+        return
+    if args.mode == "cardpool":
+        fill, queries = card_pool(args.cards)
+        print(f"{args.cards} cards added in {fill:.1f}s")
+        for q, t, n in queries:
+            print(f"{t * 1e3:8.1f} ms  {n:6} cards  {q}")
+        return
+    report = memory(games=args.games, warmup=args.warmup, top=args.top)
+    print(report)
+    failures = report.failures(args.max_growth)
+    for f in failures:
+        print("FAIL", f)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""
+Cards defined as data rather than code.
+
+A card definition file is a JSON list of cards, such as
+    {"name": "Shock", "cost": "R", "types": "instant",
+     "spell": [{"effect": "damage", "amount": 2, "target": "damagable"}]}
+A card has a name and optionally a cost (a mana cost such as "2R", or 0), supertypes, types and subtypes (strings of
+space separated words), colours (a string of colour letters, if not those of its cost), power, toughness and
+starting_loyalty; and abilities:
+    keywords: a list of keyword abilities, such as "flying"
+    protection: a list of qualities it has protection from; colour letters or card types
+    mana: a list of mana abilities, each {"add": colour, "amount": n, "cost": cost}; the cost defaults to "T"
+    spell: the effects of an instant or sorcery
+    activated: a list of activated abilities, each {"cost": cost, "effects": effects, "sorcery": bool}
+Ability costs are space separated parts: a mana cost, "T" to tap, and "sac" to sacrifice the object.
+
+Effects are a list of steps, done in order, each {"effect": name, ...parameters}; see EFFECTS for the vocabulary.
+A step with a "target" targets one of the objects or players it describes, and applies to that target; and if the
+target is illegal when it resolves, only that step is skipped. Without a target, a step applies to its controller,
+or to the object with the ability for steps that apply to objects. A target is the name of an object set in objectsets,
+or "your_graveyard" or "your_hand", followed by filters, such as "creatures without_keyword flying" or "permanents
+controlled_by_you".
+
+A later step can refer to the object the last earlier step targeted, as it last existed before that step (608.2h):
+an untargeted step that applies to a player can have "player": "its_controller", and an amount can be "its_power".
+Swords to Plowshares is
+    [{"effect": "move", "to": "exile", "target": "creatures"},
+     {"effect": "gain_life", "amount": "its_power", "player": "its_controller"}]
+
+Definitions are checked and normalized when a file is first loaded, and the normalized form is cached with marshal
+in __pycache__, so later loads of an unchanged file skip parsing and checking.
+"""
+
+import json
+import marshal
+import os
+import objectsets
+import effects
+from abilities import ActivatedAbility, SpellAbility, SimpleManaAbility, KeywordAbility, ProtectionAbility
+from characteristics import Characteristics
+from cost import Cost, FreeCost, NullCost, ManaCost, TapCost, SacSelfCost
+from game import Player
+import game
+import serialize
+
+CACHE_VERSION = 2
+DEFAULT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cards.json")
+
+_CARD_FIELDS = {"name", "cost", "supertypes", "types", "subtypes", "colours", "power", "toughness",
+                "starting_loyalty", "keywords", "protection", "mana", "spell", "activated"}
+_FILTERS = {"with_type", "without_type", "with_subtype", "without_subtype", "with_keyword", "without_keyword"}
+_FLAGS = {"is_tapped", "is_untapped", "controlled_by_you", "not_controlled_by_you"}
+_ZONES = {"owner_hand", "owner_library", "owner_graveyard", "battlefield", "exile"}
+
+
+class CardDefinitionError(Exception):
+    """Raised when a card definition isn't valid"""
+    pass
+
+
+class EffectStep:
+    """A step of a defined effect. Subclasses set takes to "player" or "object", the kind of thing it applies to.
+    it is the (controller, power) of the object the last earlier step targeted, as it last existed, or None."""
+    takes = "player"
+    # the parameters the step needs, and their types
+    required = {}
+
+    def __init__(self, target: str = None, **params):
+        self.target = target
+        self.params = params
+
+    def subject(self, ab, you: Player, it):
+        """What the step applies to when it has no target"""
+        if self.params.get("player") == "its_controller":
+            return it[0]
+        return you if self.takes == "player" else ab.src
+
+    def amount(self, it) -> int:
+        amt = self.params["amount"]
+        return it[1] if amt == "its_power" else amt
+
+    def perform(self, ab, you: Player, subject, it):
+        pass
+
+    def __eq__(self, other):
+        return type(self) is type(other) and vars(self) == vars(other)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.target}, {self.params})"
+
+
+class DamageEffect(EffectStep):
+    takes = "object"
+    required = {"amount": int}
+
+    def perform(self, ab, you, subject, it):
+        effects.damage(ab.src, subject, self.amount(it))
+
+
+class DrawCardsEffect(EffectStep):
+    required = {"amount": int}
+
+    def perform(self, ab, you, subject, it):
+        effects.draw_cards(subject, self.amount(it))
+
+
+class GainLifeEffect(EffectStep):
+    required = {"amount": int}
+
+    def perform(self, ab, you, subject, it):
+        effects.gain_life(subject, self.amount(it))
+
+
+class LoseLifeEffect(EffectStep):
+    required = {"amount": int}
+
+    def perform(self, ab, you, subject, it):
+        effects.lose_life(subject, self.amount(it))
+
+
+class MoveEffect(EffectStep):
+    takes = "object"
+    required = {"to": str}
+
+    def perform(self, ab, you, subject, it):
+        to = self.params["to"]
+        if to.startswith("owner_"):
+            zone = getattr(subject.owner, to[len("owner_"):])
+        else:
+            zone = getattr(game, to)
+        effects.move(subject, zone)
+
+
+class DestroyEffect(EffectStep):
+    takes = "object"
+
+    def perform(self, ab, you, subject, it):
+        effects.destroy(subject)
+
+
+class PutCountersEffect(EffectStep):
+    takes = "object"
+    required = {"counter": str, "amount": int}
+
+    def perform(self, ab, you, subject, it):
+        effects.put_counters(subject, self.params["counter"], self.amount(it))
+
+
+EFFECTS = {
+    "damage": DamageEffect,
+    "draw_cards": DrawCardsEffect,
+    "gain_life": GainLifeEffect,
+    "lose_life": LoseLifeEffect,
+    "move": MoveEffect,
+    "destroy": DestroyEffect,
+    "put_counters": PutCountersEffect,
+}
+
+
+def target_options(spec: str, you: Player) -> objectsets.ObjectSet:
+    """Returns the object set described by a target"""
+    words = spec.split()
+    name = words.pop(0)
+    if name in ("your_graveyard", "your_hand"):
+        obs = objectsets.zone(getattr(you, name[len("your_"):]))
+    else:
+        obs = getattr(objectsets, name)
+    while words:
+        w = words.pop(0)
+        if w == "controlled_by_you":
+            obs = obs.controlled_by(you)
+        elif w == "not_controlled_by_you":
+            obs = obs.not_controlled_by(you)
+        elif w in _FLAGS:
+            obs = getattr(obs, w)()
+        else:
+            obs = getattr(obs, w)(words.pop(0))
+    return obs
+
+
+class _DefinedEffect:
+    """The choices and effects of a spell or ability made of steps"""
+
+    def make_choices(self, you: Player):
+        choices = None
+        for i, s in enumerate(self.steps):
+            if s.target:
+                choices = self.choose_targets(you, target_options(s.target, you), idx=i, choices=choices)
+        return choices
+
+    def effect(self, you: Player, choices=None):
+        it = None
+        for i, s in enumerate(self.steps):
+            if s.target:
+                subject = choices['targets'][i, 0]
+                if subject is not None and not isinstance(subject, Player):
+                    it = (subject.controller, subject.power)
+            elif it is None and _refers_back(s.params):
+                # what it refers to was an illegal target
+                subject = None
+            else:
+                subject = s.subject(self, you, it)
+            # 608.2b an illegal target is unaffected
+            if subject is not None:
+                s.perform(self, you, subject, it)
+
+
+class DefinedSpellAbility(_DefinedEffect, SpellAbility):
+    def __init__(self, steps: list):
+        self.steps = steps
+
+
+class DefinedActivatedAbility(_DefinedEffect, ActivatedAbility):
+    def __init__(self, cost: Cost, steps: list, sorcery=False):
+        super().__init__(cost)
+        self.steps = steps
+        self.sorcery_only = sorcery
+
+    def __repr__(self):
+        return f"({self.cost}: {', '.join(repr(s) for s in self.steps)})"
+
+
+def _check(cond, card: str, msg: str):
+    if not cond:
+        raise CardDefinitionError(f"{card}: {msg}")
+
+
+def _normalize_cost(cost, card: str, mana_only=False) -> str:
+    _check(isinstance(cost, (str, int)), card, f"bad cost {cost!r}")
+    parts = str(cost).split()
+    _check(not mana_only or len(parts) == 1, card, f"bad cost {cost!r}")
+    for p in parts:
+        if mana_only or p not in ("T", "sac"):
+            try:
+                ManaCost(p)
+            except (KeyError, ValueError):
+                raise CardDefinitionError(f"{card}: bad cost {cost!r}")
+    return " ".join(parts)
+
+
+def _normalize_target(spec, card: str) -> str:
+    _check(isinstance(spec, str) and spec.split(), card, f"bad target {spec!r}")
+    words = spec.split()
+    _check(words[0] in ("your_graveyard", "your_hand") or
+           isinstance(getattr(objectsets, words[0], None), objectsets.ObjectSet), card, f"unknown object set {words[0]}")
+    i = 1
+    while i < len(words):
+        if words[i] in _FILTERS:
+            _check(i + 1 < len(words), card, f"{words[i]} needs an argument")
+            i += 2
+        else:
+            _check(words[i] in _FLAGS, card, f"unknown filter {words[i]}")
+            i += 1
+    return " ".join(words)
+
+
+def _refers_back(params: dict) -> bool:
+    return params.get("player") == "its_controller" or params.get("amount") == "its_power"
+
+
+def _normalize_steps(steps, card: str) -> list:
+    _check(isinstance(steps, list) and steps, card, "effects must be a non-empty list")
+    res = []
+    targeted = False
+    for s in steps:
+        _check(isinstance(s, dict) and s.get("effect") in EFFECTS, card, f"unknown effect {s!r}")
+        cls = EFFECTS[s["effect"]]
+        params = {k: v for k, v in s.items() if k not in ("effect", "target")}
+        for k, ty in cls.required.items():
+            _check(isinstance(params.get(k), ty) or (k == "amount" and params.get(k) == "its_power"),
+                   card, f"{s['effect']} needs {k}")
+        allowed = cls.required.keys() | ({"player"} if cls.takes == "player" and "target" not in s else set())
+        _check(params.keys() <= allowed, card, f"unknown parameters in {s!r}")
+        _check(params.get("player", "its_controller") == "its_controller", card, f"unknown player in {s!r}")
+        _check(targeted or not _refers_back(params), card, f"nothing for {s['effect']} to refer back to")
+        targeted = targeted or ("target" in s and cls.takes == "object")
+        if cls is MoveEffect:
+            _check(params["to"] in _ZONES, card, f"unknown zone {params['to']}")
+        if cls is DamageEffect:
+            _check("target" in s, card, "damage needs a target")
+        target = _normalize_target(s["target"], card) if "target" in s else None
+        res.append({"effect": s["effect"], "target": target, "params": params})
+    return res
+
+
+def _words(x, card: str, field: str) -> str:
+    _check(isinstance(x, (str, list)), card, f"bad {field}")
+    return " ".join(x.split() if isinstance(x, str) else x).lower()
+
+
+def normalize(d: dict) -> dict:
+    """Checks a card definition, returning it in a normal form made only of plain values"""
+    _check(isinstance(d, dict) and isinstance(d.get("name"), str), repr(d)[:40], "a card needs a name")
+    card = d["name"]
+    _check(d.keys() <= _CARD_FIELDS, card, f"unknown fields {sorted(d.keys() - _CARD_FIELDS)}")
+    res = {"name": card, "cost": _normalize_cost(d["cost"], card, True) if "cost" in d else None}
+    for f in ("supertypes", "types", "subtypes"):
+        res[f] = _words(d.get(f, ""), card, f)
+    res["colours"] = d.get("colours")
+    _check(res["colours"] is None or (isinstance(res["colours"], str) and set(res["colours"]) <= set("WUBRG")),
+           card, "bad colours")
+    for f in ("power", "toughness", "starting_loyalty"):
+        res[f] = d.get(f, 0)
+        _check(type(res[f]) is int, card, f"bad {f}")
+    res["keywords"] = [k.lower() for k in d.get("keywords", [])]
+    res["protection"] = list(d.get("protection", []))
+    res["mana"] = []
+    for m in d.get("mana", []):
+        _check(isinstance(m, dict) and m.get("add") in list("WUBRGC"), card, f"bad mana ability {m!r}")
+        _check(type(m.get("amount", 1)) is int, card, f"bad mana ability {m!r}")
+        res["mana"].append({"add": m["add"], "amount": m.get("amount", 1),
+                            "cost": _normalize_cost(m.get("cost", "T"), card)})
+    res["spell"] = _normalize_steps(d["spell"], card) if "spell" in d else None
+    if res["spell"]:
+        _check("instant" in res["types"].split() or "sorcery" in res["types"].split(), card,
+               "only instants and sorceries have spell effects")
+    res["activated"] = []
+    for a in d.get("activated", []):
+        _check(isinstance(a, dict) and "cost" in a, card, f"bad activated ability {a!r}")
+        res["activated"].append({"cost": _normalize_cost(a["cost"], card),
+                                 "effects": _normalize_steps(a.get("effects"), card),
+                                 "sorcery": bool(a.get("sorcery", False))})
+    return res
+
+
+def _ability_cost(cost: str) -> Cost:
+    res = FreeCost()
+    for p in cost.split():
+        res = res + (TapCost() if p == "T" else SacSelfCost() if p == "sac" else ManaCost(p))
+    return res
+
+
+def _steps(steps: list) -> list:
+    return [EFFECTS[s["effect"]](s["target"], **s["params"]) for s in steps]
+
+
+def compile_card(d: dict) -> Characteristics:
+    """Makes the characteristics of a card from its normalized definition"""
+    abs = [KeywordAbility(k) for k in d["keywords"]]
+    abs += [ProtectionAbility(q) for q in d["protection"]]
+    abs += [SimpleManaAbility(m["add"], m["amount"], _ability_cost(m["cost"])) for m in d["mana"]]
+    if d["spell"]:
+        abs.append(DefinedSpellAbility(_steps(d["spell"])))
+    abs += [DefinedActivatedAbility(_ability_cost(a["cost"]), _steps(a["effects"]), a["sorcery"])
+            for a in d["activated"]]
+    return Characteristics(
+        name=d["name"],
+        cost=NullCost() if d["cost"] is None else ManaCost(d["cost"]),
+        supertypes=d["supertypes"],
+        types=d["types"],
+        subtypes=d["subtypes"],
+        colours=None if d["colours"] is None else set(d["colours"]),
+        power=d["power"],
+        toughness=d["toughness"],
+        starting_loyalty=d["starting_loyalty"],
+        abilities=abs)
+
+
+def _cache_path(path: str) -> str:
+    d, f = os.path.split(os.path.abspath(path))
+    return os.path.join(d, "__pycache__", f + ".cards")
+
+
+def definitions(path: str) -> list:
+    """Returns the normalized definitions in a card definition file, from the cache if it's up to date"""
+    st = os.stat(path)
+    key = (CACHE_VERSION, st.st_mtime_ns, st.st_size)
+    cache = _cache_path(path)
+    try:
+        with open(cache, "rb") as f:
+            cached_key, defs = marshal.load(f)
+        if tuple(cached_key) == key:
+            return defs
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    with open(path) as f:
+        raw = json.load(f)
+    if not isinstance(raw, list):
+        raise CardDefinitionError(f"{path}: expected a list of cards")
+    defs = [normalize(d) for d in raw]
+    try:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        tmp = f"{cache}.{os.getpid()}"
+        with open(tmp, "wb") as f:
+            marshal.dump((key, defs), f)
+        os.replace(tmp, cache)
+    except OSError:
+        pass
+    return defs
+
+
+def load(path: str = DEFAULT_FILE) -> dict:
+    """Loads a card definition file, returning its cards by name. The cards are registered as prototypes for serialization."""
+    res = {}
+    for d in definitions(path):
+        c = res[d["name"]] = compile_card(d)
+        serialize.register_prototype(c)
+    return res
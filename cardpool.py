@@ -0,0 +1,130 @@
+"""
+A pool of cards stored in an sqlite database, for searching large pools without building every card.
+
+Each card is stored as its normalized definition (see carddefs), along with an indexed column for its mana value, its
+colours as a bitmask, and an index table of its colours, types, supertypes, subtypes and keywords. Queries are answered
+from the indexes and return card names; a card's Characteristics are only made when it's asked for with get, and are
+then kept. `python benchmark.py cardpool` times queries on a large pool.
+"""
+
+import json
+import sqlite3
+import carddefs
+import serialize
+from characteristics import Characteristics
+from cost import ManaCost
+
+_SCHEMA = """
+create table if not exists cards (
+    name text primary key,
+    mana_value integer not null,
+    colours integer not null,
+    definition text not null
+);
+create index if not exists cards_mana_value on cards (mana_value);
+create table if not exists card_words (
+    kind text not null,
+    word text not null,
+    name text not null,
+    primary key (kind, word, name)
+) without rowid;
+create index if not exists card_words_name on card_words (name);
+"""
+
+COLOURS = "WUBRG"
+# the kinds of words a card is indexed by, besides its colours
+WORD_KINDS = ("type", "supertype", "subtype", "keyword")
+
+
+def colour_mask(colours) -> int:
+    """Returns the bitmask of a string or set of colour letters"""
+    return sum(1 << COLOURS.index(c) for c in set(colours))
+
+
+class CardPool:
+    """A pool of cards stored at path; ":memory:" keeps the pool in memory"""
+
+    def __init__(self, path: str = ":memory:"):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+        self._cards = {}
+
+    def add(self, d: dict):
+        """Adds a card from its normalized definition, replacing any card with the same name"""
+        if d["cost"] is None:
+            mv, colours = 0, set()
+        else:
+            cost = ManaCost(d["cost"])
+            mv, colours = cost.mana_value(), cost.colours()
+        if d["colours"] is not None:
+            colours = set(d["colours"])
+        name = d["name"]
+        self.db.execute("delete from card_words where name = ?", (name,))
+        self.db.execute("insert or replace into cards values (?, ?, ?, ?)",
+                        (name, mv, colour_mask(colours), json.dumps(d, separators=(",", ":"))))
+        words = [(kind, w, name) for kind, field in zip(WORD_KINDS, ["types", "supertypes", "subtypes"])
+                 for w in d[field].split()]
+        words += [("keyword", k, name) for k in d["keywords"]]
+        words += [("keyword", "protection", name)] if d["protection"] else []
+        words += [("colour", c, name) for c in colours]
+        self.db.executemany("insert or ignore into card_words values (?, ?, ?)", words)
+        self._cards.pop(name, None)
+
+    def add_file(self, path: str):
+        """Adds all the cards in a card definition file"""
+        with self.db:
+            for d in carddefs.definitions(path):
+                self.add(d)
+
+    def query(self, types=(), supertypes=(), subtypes=(), keywords=(), colours: str = None, colourless=False,
+              min_mv: int = None, max_mv: int = None) -> list:
+        """Returns the names of the cards with all of the given types, supertypes, subtypes and keywords,
+        all of the given colours (or no colours if colourless is true), and mana value in the given range; in order."""
+        where = []
+        params = []
+        # the cards with every word asked for are found from the word index, one range of it per word
+        words = []
+        for kind, ws in zip(WORD_KINDS, [types, supertypes, subtypes, keywords]):
+            words += [(kind, w.lower()) for w in (ws.split() if isinstance(ws, str) else ws)]
+        words += [("colour", c) for c in sorted(set(colours or ""))]
+        if words:
+            where.append("name in (" + " intersect ".join(["select name from card_words where kind = ? and word = ?"]
+                                                          * len(words)) + ")")
+            params += [x for w in words for x in w]
+        if colourless:
+            where.append("colours = 0")
+        if min_mv is not None:
+            where.append("mana_value >= ?")
+            params.append(min_mv)
+        if max_mv is not None:
+            where.append("mana_value <= ?")
+            params.append(max_mv)
+        sql = "select name from cards c"
+        if where:
+            sql += " where " + " and ".join(where)
+        return [r[0] for r in self.db.execute(sql + " order by name", params)]
+
+    def get(self, name: str) -> Characteristics:
+        """Returns the characteristics of a card, making them the first time they're asked for.
+        Raises KeyError if there's no such card."""
+        if name not in self._cards:
+            row = self.db.execute("select definition from cards where name = ?", (name,)).fetchone()
+            if row is None:
+                raise KeyError(name)
+            c = self._cards[name] = carddefs.compile_card(json.loads(row[0]))
+            serialize.register_prototype(c)
+        return self._cards[name]
+
+    def deck(self, names: list) -> list:
+        """Returns the characteristics of each of the named cards"""
+        return [self.get(n) for n in names]
+
+    def __len__(self):
+        return self.db.execute("select count(*) from cards").fetchone()[0]
+
+    def __contains__(self, name: str):
+        return self.db.execute("select 1 from cards where name = ?", (name,)).fetchone() is not None
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
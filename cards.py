@@ -2,8 +2,9 @@
 from cost import SacSelfCost, TapCost
 from game import Card, Player
 from characteristics import Characteristics
-from abilities import SimpleManaAbility, ActivatedAbility, SpellAbility
+from abilities import SimpleManaAbility, ActivatedAbility
 from effects import *
+import carddefs
 
 
 def build_deck(pl: Player, deck: list[Characteristics]):
@@ -94,71 +95,9 @@ chronomaton = Characteristics(
 )
 
 
-class LightningBoltEffect(SpellAbility):
-    def make_choices(self, you: Player):
-        return self.choose_targets(you, objectsets.damagable)
-
-    def effect(self, you: Player, choices=None):
-        damage(self.src, choices['targets'][0, 0], 3)
-
-
-class ZapEffect(SpellAbility):
-    def make_choices(self, you: Player):
-        return self.choose_targets(you, objectsets.damagable)
-
-    def effect(self, you: Player, choices):
-        damage(self.src, choices['targets'][0, 0], 1)
-        draw_cards(you, 1)
-
-
-class ReclaimEffect(SpellAbility):
-    def make_choices(self, you: Player):
-        return self.choose_targets(you, objectsets.zone(you.graveyard))
-
-    def effect(self, you: Player, choices=None):
-        t = choices['targets'][0, 0]
-        move(t, t.owner.library)
-
-
-lightning_bolt = Characteristics(
-    name="Lightning Bolt",
-    cost="R",
-    types="instant",
-    abilities=[LightningBoltEffect()]
-)
-
-zap = Characteristics(
-    name="Zap",
-    cost="2R",
-    types="instant",
-    abilities=[ZapEffect()]
-)
-
-reclaim = Characteristics(
-    name="Reclaim",
-    cost="G",
-    types="instant",
-    abilities=[ReclaimEffect()]
-)
-
-
-class TimAbility(ActivatedAbility):
-    def __init__(self):
-        super().__init__(TapCost())
-
-    def make_choices(self, you: Player):
-        return self.choose_targets(you, objectsets.damagable)
-
-    def effect(self, you: Player, choices):
-        damage(self.src, choices['targets'][0, 0], 1)
-
-
-tim = Characteristics(
-    name="Prodigal Sorcerer",
-    cost="2U",
-    types="creature",
-    subtypes="human wizard",
-    power=1,
-    toughness=1,
-    abilities=[TimAbility()]
-)
+# cards that are defined as data (see carddefs)
+_defined = carddefs.load()
+lightning_bolt = _defined["Lightning Bolt"]
+zap = _defined["Zap"]
+reclaim = _defined["Reclaim"]
+tim = _defined["Prodigal Sorcerer"]
@@ -1,8 +1,6 @@
-from copy import copy
 from util import *
 from dataclasses import dataclass, field
 from cost import Cost, NullCost, ManaCost
-import re
 import game
 import abilities
 
@@ -45,19 +43,52 @@ class Characteristics:
             self.name = " ".join(t.title() for t in self.subtypes) + " Token"
 
         self.src = None
+        self.compute_masks()
+
+    def compute_masks(self):
+        """Computes the bitmasks of this object's types, supertypes, subtypes and keywords.
+        Must be called after changing any of them, other than while computing layers."""
+        self.type_mask = mask(self.types)
+        self.supertype_mask = mask(self.supertypes)
+        self.subtype_mask = mask(self.subtypes)
+        self.keyword_mask = mask(ab.name for ab in self.abilities if isinstance(ab, abilities.KeywordAbility))
+
+    def __getstate__(self):
+        # the bits of the masks are numbered as names are first seen, which can differ between processes,
+        # so the masks aren't pickled but computed again when unpickled
+        state = dict(self.__dict__)
+        for k in ("type_mask", "supertype_mask", "subtype_mask", "keyword_mask"):
+            state.pop(k, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.compute_masks()
 
     def has_type(self, ty: str):
         """Returns true if this object has the given type"""
+        if self.type_mask is not None:
+            return self.type_mask & bit(ty) != 0
         return ty.lower() in self.types
 
+    def has_supertype(self, ty: str):
+        """Returns true if this object has the given supertype"""
+        if self.supertype_mask is not None:
+            return self.supertype_mask & bit(ty) != 0
+        return ty.lower() in self.supertypes
+
     def has_subtype(self, ty: str):
         """Returns true if this object has the given subtype"""
+        if self.subtype_mask is not None:
+            return self.subtype_mask & bit(ty) != 0
         return ty.lower() in self.subtypes
 
     def has_keyword(self, key: str):
         """Returns true if this oject has a keyword abilitiy of the given name"""
         if isinstance(key, abilities.KeywordAbility):
             key = key.name
+        if self.keyword_mask is not None:
+            return self.keyword_mask & bit(key) != 0
         key = key.lower()
         return any(isinstance(ab, abilities.KeywordAbility) and ab.name == key for ab in self.abilities)
 
@@ -66,9 +97,18 @@ class Characteristics:
         return not (self.has_type("instant") or self.has_type("sorcery") or self.has_type("ability"))
 
     def __copy__(self):
-        c = {k: getattr(self, k) for k in Characteristics.__dataclass_fields__}
-        c = Characteristics(**c)
-        c.abilities = [copy(a) for a in c.abilities]
+        # copies the fields directly rather than going through __init__, as objects are created on every zone change
+        c = object.__new__(type(self))
+        s = self.__dict__
+        d = s.copy()
+        d["supertypes"] = s["supertypes"][:]
+        d["types"] = s["types"][:]
+        d["subtypes"] = s["subtypes"][:]
+        d["colours"] = set(s["colours"])
+        abs = s["abilities"]
+        d["abilities"] = [a.__copy__() for a in abs] if abs else []
+        d["src"] = None
+        c.__dict__ = d
         return c
 
     def bind(self, src):
@@ -77,24 +117,3 @@ class Characteristics:
         self.src = src
         for a in self.abilities:
             a.bind(src)
-
-
-class CounterChars:
-    """Temporary implementation of counters before layers are implemented"""
-
-    def __init__(self, src):
-        self.src = src
-
-    def __getattr__(self, attr):
-        if attr not in ["power", "toughness"]:
-            return getattr(self.src.base_chars, attr)
-        base = self.src.base_chars
-        pow, tou = base.power, base.toughness
-        for kind, amt in self.src.counters.items():
-            m = re.fullmatch(r'([+-]\d+)/([+-]\d+)', kind)
-            if m:
-                pow += int(m.groups()[0]) * amt
-                tou += int(m.groups()[1]) * amt
-        return {"power": pow, "toughness": tou}[attr]
-
-    __repr__ = Characteristics.__repr__
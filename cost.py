@@ -1,3 +1,5 @@
+from types import MappingProxyType
+import numpy as np
 import game
 import mana
 import effects
@@ -83,48 +85,98 @@ class FreeCost(Cost):
 
 
 class ManaCost(Cost):
-    """A mana cost"""
-
-    def __init__(self, c):
-        self.mana = mana.mana(c, True)
+    """A mana cost. Mana costs are interned: making a cost equal to an existing one returns that one."""
+    _interned = {}
+
+    def __new__(cls, c):
+        vec = mana.vector(c, True)
+        res = cls._interned.get((cls, vec))
+        if res is None:
+            res = cls._interned[(cls, vec)] = object.__new__(cls)
+            # the amount of each type of mana, then generic mana; see mana.vector
+            res.vec = vec
+            # the cost's row in the matrix of interned costs
+            res.row = len(_rows)
+            _rows.append(vec)
+            res.mana = MappingProxyType(mana.mana(vec, True))
+            res._mana_value = sum(vec)
+            res._colours = frozenset(c for c in "WUBRG" if res.mana[c] > 0)
+        return res
+
+    def __reduce__(self):
+        # unpickled costs are interned in their new process
+        return (type(self), (self.vec,))
 
     def colours(self) -> set:
-        return set(c for c in "WUBRG" if self.mana[c] > 0)
+        return set(self._colours)
 
     def mana_value(self) -> int:
-        return sum(self.mana.values())
+        return self._mana_value
 
     def can_pay(self, player, obj=None, choices=None) -> bool:
         pool = player.mana_pool.payable_for(obj)
-        total = sum(pool.values())
-        for c, x in self.mana.items():
-            if c == "gen":
-                continue
-            if pool[c] < x:
-                return False
-            total -= x
-        return total >= self.mana["gen"]
+        return all(have >= x for have, x in zip(pool, self.vec)) and sum(pool) >= self._mana_value
 
     def pay(self, player, obj=None, choices=None):
         # todo: choices for specific mana
         # innacuracy: should be able to activate mana abilities
-        for c, x in self.mana.items():
-            left = player.mana_pool.spend(c, x, obj, choices)
-            if left:
+        for c, x in zip(_SPEND_ORDER, self.vec):
+            if x and player.mana_pool.spend(c, x, obj, choices):
                 raise PaymentFailed()
 
     def __add__(self, other):
         if isinstance(other, ManaCost):
-            res = self.mana.copy()
-            for ty in res:
-                res[ty] += other[ty]
-            return ManaCost(res)
+            return ManaCost(tuple(a + b for a, b in zip(self.vec, other.vec)))
         return super().__add__(other)
 
     def __str__(self):
         return mana.mana_str(self.mana)
 
 
+# the types of mana in a mana cost's vector, in the order they're paid
+_SPEND_ORDER = tuple(mana.mana_types) + ("gen",)
+
+
+# the vectors of the interned mana costs, and them as a matrix, made when needed
+_rows = []
+_matrix = None
+# the number of mana costs from which can_pay_all checks them with numpy; for fewer, a loop is faster
+VECTORIZE_AT = 24
+
+
+def _cost_matrix():
+    global _matrix
+    if _matrix is None or len(_matrix) < len(_rows):
+        _matrix = np.array(_rows, dtype=np.int64)
+    return _matrix
+
+
+def can_pay_all(costs: list, player: Player, objs: list = None) -> list:
+    """
+    Returns whether player can pay each of costs, for the corresponding object of objs if given.
+    The mana costs are checked against what's in player's mana pool in one pass, vectorized if there are many.
+    """
+    res = [None] * len(costs)
+    idxs = [i for i, c in enumerate(costs) if isinstance(c, ManaCost)]
+    if idxs and not player.mana_pool.special:
+        # with no special mana, what can be spent on each object is the same
+        pool = player.mana_pool.payable_for(None)
+        if len(idxs) >= VECTORIZE_AT:
+            pool = np.array(pool)
+            m = _cost_matrix()[[costs[i].row for i in idxs]]
+            ok = ((m[:, :mana.GEN] <= pool).all(axis=1) & (m.sum(axis=1) <= pool.sum())).tolist()
+        else:
+            total = sum(pool)
+            ok = [all(have >= x for have, x in zip(pool, costs[i].vec)) and total >= costs[i]._mana_value
+                  for i in idxs]
+        for i, x in zip(idxs, ok):
+            res[i] = x
+    for i, c in enumerate(costs):
+        if res[i] is None:
+            res[i] = c.can_pay(player, objs[i] if objs else None)
+    return res
+
+
 class CompoundCost(Cost):
     """A combination of two or more other costs"""
 
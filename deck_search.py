@@ -0,0 +1,177 @@
+"""
+Searching for the best 3 card blind decks.
+
+Every combination of cards from a pool is played against a gauntlet of opponent decks, on each side of the table,
+and the combinations are ranked by their score: the fraction of games won, with draws counting as half a win.
+A game that hasn't finished after max_turns turns is a draw. Each player starts with their three cards in hand.
+
+Combinations are pruned before they're played if one of their cards can never be cast, because nothing in the deck
+can make the mana it costs. While the search runs, a deck stops being played once it can no longer score as well as
+the top decks found so far, even by winning every game it has left.
+
+The games are played on a process pool. The pool's cards are sent to each worker once, and decks are then referred to
+by their indices in it. Scores come with Wilson score intervals, as the players may not be deterministic.
+A game that raises counts for nothing; such games are counted separately, and a deck with any can't be among the top.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from itertools import combinations, combinations_with_replacement
+from abilities import SimpleManaAbility
+from characteristics import Characteristics
+from cost import ManaCost
+from match import init_worker, play_game, wilson_interval, worker_state
+from players import Aggressive
+
+
+@dataclass
+class Result:
+    """The result of playing a deck against the gauntlet"""
+    deck: tuple
+    wins: int = 0
+    draws: int = 0
+    games: int = 0
+    # true if the deck stopped being played because it couldn't reach the top
+    cut: bool = False
+    # games that raised, which aren't counted in games
+    errors: int = 0
+
+    @property
+    def score(self) -> float:
+        return (self.wins + self.draws / 2) / self.games if self.games else 0
+
+    def interval(self, z: float = 1.96) -> tuple:
+        """The Wilson score interval of the score"""
+        return wilson_interval(self.wins + self.draws / 2, self.games, z)
+
+    def __str__(self):
+        lo, hi = self.interval()
+        names = ", ".join(c.name for c in self.deck)
+        errors = f", {self.errors} errors" if self.errors else ""
+        return f"{self.score:.3f} [{lo:.3f}, {hi:.3f}] ({self.games} games{errors}) {names}"
+
+
+def _mana_sources(deck) -> list:
+    """Returns, for each card in the deck that has mana abilities, the colours it can make and the most mana it makes"""
+    res = []
+    for c in deck:
+        abs = [a for a in c.abilities if isinstance(a, SimpleManaAbility)]
+        if abs:
+            res.append(({a.col for a in abs}, max(a.amt for a in abs)))
+    return res
+
+
+def castable(card: Characteristics, others) -> bool:
+    """Returns false if card can never be cast with the mana the other cards in its deck can make.
+    Lands are always castable."""
+    if card.has_type("land"):
+        return True
+    if not isinstance(card.cost, ManaCost):
+        return False
+    need = card.cost.mana
+    if not card.cost.mana_value():
+        return True
+    sources = _mana_sources(others)
+    if sum(amt for _, amt in sources) < card.cost.mana_value():
+        return False
+    return all(need[c] <= sum(amt for cols, amt in sources if c in cols) for c in "WUBRGC")
+
+
+def castable_deck(deck) -> bool:
+    """Returns true if every card in deck might be cast"""
+    return all(castable(c, deck[:i] + deck[i+1:]) for i, c in enumerate(deck))
+
+
+def _evaluate(idxs: tuple, threshold: float) -> Result:
+    """Plays a deck against the gauntlet, stopping once it can't score more than threshold"""
+    st = worker_state
+    deck = [st["pool"][i] for i in idxs]
+    res = Result(idxs)
+    left = len(st["gauntlet"]) * 2
+    for opp in st["gauntlet"]:
+        for first in (0, 1):
+            left -= 1
+            try:
+                w = play_game(deck, opp, first, st["player"], st["max_turns"])
+            except Exception:
+                res.errors += 1
+                continue
+            res.games += 1
+            res.wins += w == 0
+            res.draws += w is None
+        best = (res.wins + res.draws / 2 + left) / (res.games + left) if res.games + left else 0
+        if res.errors or best < threshold:
+            res.cut = True
+            break
+    return res
+
+
+def candidates(pool: list, size: int = 3, distinct: bool = True):
+    """Yields the indices of each deck of size cards from pool whose cards might all be cast"""
+    combos = combinations(range(len(pool)), size) if distinct else combinations_with_replacement(range(len(pool)), size)
+    for idxs in combos:
+        if castable_deck([pool[i] for i in idxs]):
+            yield idxs
+
+
+def search(pool: list, gauntlet: list, top: int = 10, size: int = 3, distinct: bool = True, player=Aggressive,
+           max_turns: int = 20, workers: int = None, errors: list = None) -> list:
+    """
+    Searches the decks of size cards from pool (a list of Characteristics) against the gauntlet (a list of decks),
+    returning the results of the best top decks, best first. player is the class of both players.
+    Each deck plays each opponent once on each side. The results of decks that had games raise are appended to errors.
+    """
+    state = {"pool": pool, "gauntlet": gauntlet, "player": player, "max_turns": max_turns}
+    total = len(gauntlet) * 2
+    best = []
+    errored = []
+
+    def threshold():
+        return best[top - 1].score if len(best) >= top else -1
+
+    with ProcessPoolExecutor(workers or os.cpu_count(), initializer=init_worker, initargs=(state,)) as ex:
+        todo = candidates(pool, size, distinct)
+        running = set()
+        limit = 4 * (workers or os.cpu_count())
+        while True:
+            for idxs in todo:
+                running.add(ex.submit(_evaluate, idxs, threshold()))
+                if len(running) >= limit:
+                    break
+            if not running:
+                break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for f in done:
+                res = f.result()
+                if res.errors:
+                    errored.append(res)
+                elif res.games == total and res.score >= threshold():
+                    best.append(res)
+                    best.sort(key=lambda r: (-r.score, r.deck))
+                    del best[top:]
+    for r in best + errored:
+        r.deck = tuple(pool[i] for i in r.deck)
+    if errors is not None:
+        errors += errored
+    return best
+
+
+def main():
+    import carddefs
+    import cards
+    # some of the cards module's cards are defined cards too
+    pool = {v.name: v for v in vars(cards).values() if isinstance(v, Characteristics)}
+    pool.update(carddefs.load())
+    pool = list(pool.values())
+    gauntlet = [[cards.memnite] * 3, [cards.mountain, cards.lightning_bolt, cards.grizzly_bears],
+                [cards.forest, cards.grizzly_bears, cards.grizzly_bears]]
+    errors = []
+    for r in search(pool, gauntlet, errors=errors):
+        print(r)
+    for r in errors:
+        print("error:", r)
+
+
+if __name__ == "__main__":
+    main()
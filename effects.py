@@ -1,15 +1,68 @@
 import game
 import objectsets
 import abilities
+import layers
+import journal
+import replacement
 from game import GameObject, GameOver, Player, CardLike, Zone
 
 
+class Batch:
+    """Events that happen simultaneously.
+    Damage, moves and players losing are collected while the batch is open, and performed together when it closes.
+    Damage is grouped by target, so each target is changed once; and lifelink gains are grouped by source."""
+
+    def __init__(self):
+        self.damage = []
+        self.moves = []
+        self.losers = []
+        self.performed = 0
+
+    def __len__(self):
+        return len(self.damage) + len(self.moves) + len(self.losers)
+
+    def perform(self):
+        """Performs the collected events"""
+        self.performed += len(self)
+        if self.damage:
+            events = []
+            for src, target, amt, combat in self.damage:
+                if replacement.active(replacement.DAMAGE):
+                    for ev in replacement.replace(replacement.DamageEvent(src, target, amt, combat)):
+                        if isinstance(ev, replacement.DamageEvent):
+                            events.append((ev.src, ev.target, ev.amt))
+                        else:
+                            ev.perform()
+                else:
+                    events.append((src, target, amt))
+            _deal_damage(events)
+
+        for ob, newzone in self.moves:
+            move(ob, newzone)
+
+        if self.losers:
+            _lose_games(self.losers)
+
+
 class _Simultaneously:
-    def __enter__(self):
-        pass
+    """A context in which events happen simultaneously; see Batch. Contexts can be nested; the outermost one performs the events."""
+
+    def __init__(self):
+        self.batch = None
+        self.depth = 0
+
+    def __enter__(self) -> Batch:
+        if self.depth == 0:
+            self.batch = Batch()
+        self.depth += 1
+        return self.batch
 
-    def __exit__(self, *args):
-        pass
+    def __exit__(self, exc_type, *args):
+        self.depth -= 1
+        if self.depth == 0:
+            batch, self.batch = self.batch, None
+            if exc_type is None:
+                batch.perform()
 
 
 simultaneously = _Simultaneously()
@@ -20,27 +73,65 @@ def event(*args):
 
 
 def win_game(pl: Player):
-    game.winner = pl
-    raise GameOver()
+    game.end_game("win", pl)
 
 
 def lose_game(pl: Player):
+    if simultaneously.batch is not None:
+        simultaneously.batch.losers.append(pl)
+    else:
+        _lose_games([pl])
+
+
+def _lose_games(pls: list):
     # todo: multiplayer removing the player's stufff
-    pl.delete()
-    game.players = [p for p in game.players if p != pl]
+    pls = [p for p in dict.fromkeys(pls) if p in game.players]
+    if not pls:
+        return
+    for pl in pls:
+        game.leave_turn_order(pl)
+        game.players.remove(pl)
+        pl.delete()
+    layers.invalidate()
+    t = game.turn
+    if t is not None and game.players:
+        # 800.4i the turn goes on without a player who left, and the players after them still have to pass in succession
+        if t.last_action.dead:
+            t.last_action = game.live_player(t.last_action)
+        if t.priority.dead:
+            t.priority = game.live_player(t.priority)
     if len(game.players) == 1:
-        game.winner = game.players[0]
-        raise GameOver()
+        game.end_game("loss", game.players[0])
+    if not game.players:
+        # 104.4a if all the players lose simultaneously, the game is a draw
+        game.end_game("draw")
 
 
 def move(ob: CardLike, newzone: Zone):
     oldzone = ob.zone
     if ob.dead:
         return
+    if simultaneously.batch is not None:
+        simultaneously.batch.moves.append((ob, newzone))
+        return
     if oldzone == newzone and oldzone != game.exile:
         return
+    if replacement.may_replace_move(ob, newzone):
+        for ev in replacement.replace(replacement.MoveEvent(ob, newzone)):
+            ev.perform()
+    else:
+        _move(ob, newzone)
+
+
+def _move(ob: CardLike, newzone: Zone, as_enters=()):
+    """Moves ob to newzone without applying replacement effects. Each function in as_enters is called on the new object."""
+    oldzone = ob.zone
+    if ob.dead:
+        return
     event("move_pre", ob, oldzone, newzone)
     new = ob.direct_move(newzone)
+    for f in as_enters:
+        f(new)
     event("move_post", ob, oldzone, newzone)
 
 
@@ -55,13 +146,15 @@ def lose_life(pl: Player, amt: int):
     if amt == 0:
         return
     pl.life -= amt
+    layers.changed(layers.LIFE)
 
 
 def gain_life(pl: Player, amt: int):
     amt = max(amt, 0)
     if amt == 0:
         return
-    pl.life -= amt
+    pl.life += amt
+    layers.changed(layers.LIFE)
 
 
 def set_life(pl: Player, amt: int):
@@ -72,49 +165,123 @@ def set_life(pl: Player, amt: int):
 
 
 def put_counters(ob: GameObject, kind: str, amt: int):
+    if replacement.active(replacement.COUNTERS):
+        for ev in replacement.replace(replacement.CountersEvent(ob, kind, amt)):
+            ev.perform()
+    else:
+        _put_counters(ob, kind, amt)
+
+
+def _put_counters(ob: GameObject, kind: str, amt: int):
+    journal.record_item(ob.counters, kind)
     ob.counters[kind] += amt
+    layers.changed(layers.COUNTERS, ob)
 
 
 def remove_counters(ob: GameObject, kind: str, amt: int):
+    journal.record_item(ob.counters, kind)
     ob.counters[kind] = max(ob.counters[kind] - amt, 0)
+    layers.changed(layers.COUNTERS, ob)
 
 
 def damage(src: CardLike, target: GameObject, amt: int, combat=False):
     assert not isinstance(src, abilities.AbilityOnTheStack)
     if amt <= 0:
         return
-    if not target in objectsets.damagable:
+    if simultaneously.batch is not None:
+        simultaneously.batch.damage.append((src, target, amt, combat))
+    elif replacement.active(replacement.DAMAGE):
+        for ev in replacement.replace(replacement.DamageEvent(src, target, amt, combat)):
+            ev.perform()
+    else:
+        _damage(src, target, amt, combat)
+
+
+def _damage(src: CardLike, target: GameObject, amt: int, combat=False):
+    if amt <= 0:
         return
+    _deal_damage([(src, target, amt)])
+
+
+def _damagable(target: GameObject) -> bool:
     if isinstance(target, Player):
-        if src.has_keyword("infect"):
-            put_counters(target, "poison", amt)
-        else:
-            lose_life(target, amt)
-    else:
-        if target.has_type("creature"):
-            if src.has_keyword("infect") or src.has_keyword("wither"):
-                put_counters(target, "-1/-1", amt)
+        return target in game.players
+    return target.zone == game.battlefield and (target.has_type("creature") or target.has_type("planeswalker"))
+
+
+def _deal_damage(events: list):
+    """Deals damage from each (src, target, amt) in events simultaneously, without applying replacement effects"""
+    by_target = {}
+    for src, target, amt in events:
+        if amt > 0:
+            by_target.setdefault(target, []).append((src, amt))
+    lifelink = {}
+    for target, dealt in by_target.items():
+        if not _damagable(target):
+            continue
+        # 120.3 the results of damage depend on the source
+        normal = wither = 0
+        deathtouch = False
+        for src, amt in dealt:
+            if src.has_keyword("infect") or (src.has_keyword("wither") and not isinstance(target, Player)):
+                wither += amt
             else:
-                target.permstate.damage += amt
-            if src.has_keyword("deathtouch"):
-                target.permstate.deathtouch_damage = True
-        if target.has_type("planeswalker"):
-            remove_counters(target, "loyalty", amt)
-    if src.has_keyword("lifelink"):
+                normal += amt
+            deathtouch = deathtouch or src.has_keyword("deathtouch")
+            if src.has_keyword("lifelink"):
+                lifelink[src] = lifelink.get(src, 0) + amt
+        if isinstance(target, Player):
+            if wither:
+                put_counters(target, "poison", wither)
+            lose_life(target, normal)
+        else:
+            if target.has_type("creature"):
+                if wither:
+                    put_counters(target, "-1/-1", wither)
+                if normal:
+                    target.permstate.damage += normal
+                if deathtouch:
+                    target.permstate.deathtouch_damage = True
+                layers.changed(layers.DAMAGE, target)
+            if target.has_type("planeswalker"):
+                remove_counters(target, "loyalty", normal + wither)
+    # 120.3f each source with lifelink causes a single life gain event
+    for src, amt in lifelink.items():
         gain_life(src.controller, amt)
 
 
 def draw_cards(pl: Player, amt: int = 1):
-    pl.draw(amt)
+    if replacement.active(replacement.DRAW):
+        # 121.2 cards are drawn one at a time
+        for _ in range(amt):
+            for ev in replacement.replace(replacement.DrawEvent(pl)):
+                ev.perform()
+    else:
+        pl.draw(amt)
 
 
 def tap(ob):
     if not(ob and ob.zone == game.battlefield):
         return
     ob.permstate.tapped = True
+    layers.changed(layers.TAPPED, ob)
 
 
 def untap(ob):
     if not(ob and ob.zone == game.battlefield):
         return
     ob.permstate.tapped = False
+    layers.changed(layers.TAPPED, ob)
+
+
+def set_permstate(ob, kind: str = layers.STATE, **values):
+    """Changes the permanent state of ob, such as its damage or what it's attacking. kind is the kind of change
+    (see layers.CHANGES)."""
+    ps = ob.permstate
+    changed = False
+    for k, v in values.items():
+        if getattr(ps, k) != v:
+            setattr(ps, k, v)
+            changed = True
+    if changed:
+        layers.changed(kind, ob)
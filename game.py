@@ -9,10 +9,12 @@ if TYPE_CHECKING:
     from objectsets import ObjectSet
     from turn import Turn
 
-from collections import OrderedDict
 from copy import copy
 from dataclasses import dataclass
-from typing import Counter
+from collections import Counter
+import journal
+import stats
+from layers import FixedChars, LayeredChars
 
 
 next_id = 0
@@ -29,7 +31,7 @@ class Zone:
 
     def __init__(self, name: str):
         self.name = name
-        self.objects = OrderedDict()
+        self.objects = journal.IdOrderedDict()
 
     def __iter__(self):
         yield from self.objects.values()
@@ -45,27 +47,146 @@ class Zone:
         return self.name
 
 
-objects = {}
+class Players:
+    """The players still in the game, in the order they joined it. Players leave in constant time."""
+
+    def __init__(self):
+        self.members = journal.IdOrderedDict()
+
+    def __iter__(self):
+        yield from self.members.values()
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, p):
+        return self.members.get(getattr(p, "id", None)) is p
+
+    def __getitem__(self, i: int) -> Player:
+        for j, p in enumerate(self.members.values()):
+            if j == i:
+                return p
+        raise IndexError(i)
+
+    def add(self, p: Player):
+        """Adds p after the other players, recording the change in the journal"""
+        journal.record_item(self.members, p.id, ordered=True)
+        self.members[p.id] = p
+
+    def remove(self, p: Player):
+        """Removes p, recording the change in the journal"""
+        journal.record_item(self.members, p.id, ordered=True)
+        del self.members[p.id]
+
+    def clear(self):
+        self.members.clear()
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+objects = journal.IdOrderedDict()
 battlefield = Zone("battlefield")
 exile = Zone("exile")
 stack = Zone("stack")
-players = []
+players = Players()
 turn_idx = 0
 turn: Turn = None
 next_turns = []
 winner = None
+# why the game ended, or None while it's going on; see end_game
+end_reason = None
+# the players and objects whose state has changed in a way state-based actions look at since they were last checked
+# (see turn.check_sbas): objects that are new or whose own state changed (see layers.changed), and life totals
+sba_dirty = set()
+journal.per_game(__name__, next_id=int, objects=journal.IdOrderedDict, players=Players, turn_idx=int,
+                 turn=lambda: None, next_turns=list, winner=lambda: None, end_reason=lambda: None, sba_dirty=set)
+
+
+def set_state(name: str, value):
+    """Sets one of the global variables of the game state, such as turn, recording the change in the journal"""
+    import sys
+    journal.record_attr(sys.modules[__name__], name)
+    globals()[name] = value
 
 
 def clear_state():
-    global turn_idx, turn, next_turns, winner
-    for o in list(objects.values()):
-        if isinstance(o, CardLike):
-            o.delete()
+    """Throws away the current game, leaving an empty one. Anything still holding on to the game's players or objects
+    doesn't keep the rest of the game alive through them."""
+    global next_id, turn_idx, turn, next_turns, winner, end_reason
+    sba_dirty.clear()
+    # everything is being thrown away, so objects are marked dead without unregistering their abilities one by one
+    for o in objects.values():
+        d = o.__dict__
+        d.update(dead=True, new=None, zone=None, spell_choices=None)
+        if isinstance(o, Player):
+            for z in (o.hand, o.graveyard, o.library):
+                z.objects.clear()
+        else:
+            # without its references back to it through its characteristics, the object is freed as soon as nothing
+            # holds on to it, rather than left for the garbage collector
+            chars = d["base_chars"]
+            chars.src = None
+            for a in chars.abilities:
+                a.src = None
+            d["chars"] = FixedChars(chars, d["base_controller"])
+    objects.clear()
+    for z in [battlefield, exile, stack]:
+        z.objects.clear()
     players.clear()
+    import layers
+    import replacement
+    import permissions
+    import limits
+    layers.clear()
+    replacement.clear()
+    permissions.clear()
+    limits.clear()
+    next_id = 0
     turn_idx = 0
     turn = None
     next_turns = []
     winner = None
+    end_reason = None
+
+
+class GameState:
+    """
+    The state of a game that isn't the current one. A new GameState is an empty game.
+    The rules code works on the current game through module globals; several games can be kept in one process
+    by swapping their states in and out, which takes constant time.
+    """
+
+    def __init__(self):
+        # the rules modules declare their globals that make up the state of a game as they're imported
+        import turn
+        # the module globals that make up the state of a game, with their values for an empty game
+        self.values = {k: fresh() for k, fresh in journal.game_globals.items()}
+        self.zones = [journal.IdOrderedDict() for _ in range(3)]
+        self.batch = (None, 0)
+
+    def swap(self):
+        """Exchanges this state with the current game state: this state becomes the current one,
+        and this object holds what was current before. Swapping again switches back."""
+        import sys
+        import effects
+        import layers
+        for (m, name), v in self.values.items():
+            mod = sys.modules[m]
+            self.values[m, name] = getattr(mod, name)
+            setattr(mod, name, v)
+        for i, z in enumerate([battlefield, exile, stack]):
+            z.objects, self.zones[i] = self.zones[i], z.objects
+        sim = effects.simultaneously
+        (sim.batch, sim.depth), self.batch = self.batch, (sim.batch, sim.depth)
+        # cached characteristics may belong to either game, so none are trusted
+        layers.invalidate()
+
+
+def invalidate_chars():
+    """Marks the computed characteristics of all objects as out of date"""
+    import layers
+    layers.invalidate()
 
 
 class GameOver(Exception):
@@ -73,30 +194,60 @@ class GameOver(Exception):
     pass
 
 
-class GameObject:
+def end_game(reason: str, won_by: Player = None):
+    """
+    Ends the game, won by won_by or else drawn, recording why it ended:
+    "win" when a player won it, "loss" when every other player lost, "draw" when every player lost at once (104.4a),
+    or "repetition", "stall", "turn limit" or "priority limit" when it was ended by one of the limits (see limits).
+    """
+    set_state("winner", won_by)
+    set_state("end_reason", reason)
+    raise GameOver(reason)
+
+
+class GameObject(journal.Journaled):
     """An object, as defined by 109.1; except that players are also included for convinience."""
 
     def __init__(self, zone: Zone, chars: Characteristics, owner: Player = None, controller: Player = None):
-        from characteristics import CounterChars
-        self.id = fresh_id()
-        self.dead = False
-        self.new = None
-        self.zone = zone
-        objects[self.id] = self
+        # a new object has no previous state, so its attributes don't need to be journaled
+        id = fresh_id()
+        self.__dict__.update(id=id, dead=False, new=None, zone=zone, owner=owner,
+                             base_controller=controller if controller is not None else owner,
+                             base_chars=copy(chars), chars=LayeredChars(self),
+                             permstate=None if zone is not battlefield else PermanentState(),
+                             spell_choices=None, counters=Counter())
+        journal.record_item(objects, id, ordered=True)
+        objects[id] = self
+        stats.count(stats.OBJECTS_CREATED)
         if zone is not None:
-            zone.objects[self.id] = self
-        self.owner = owner
-        self.base_controller = controller or owner
-        self.base_chars = copy(chars)
-        self.chars = CounterChars(self)
+            journal.record_item(zone.objects, id, ordered=True)
+            zone.objects[id] = self
         self.base_chars.bind(self)
-        self.permstate = None if zone != battlefield else PermanentState()
-        self.spell_choices = None
-        self.counters = Counter()
+        for a in self.static_abilities():
+            a.register()
+        sba_dirty.add(self)
+        import layers
+        layers.changed(layers.ZONES)
 
     @property
     def controller(self) -> Player:
-        return self.base_controller
+        return self.chars.controller
+
+    def has_type(self, ty: str) -> bool:
+        return self.chars.get().has_type(ty)
+
+    def has_subtype(self, ty: str) -> bool:
+        return self.chars.get().has_subtype(ty)
+
+    def has_keyword(self, key: str) -> bool:
+        return self.chars.get().has_keyword(key)
+
+    def static_abilities(self) -> list:
+        """Returns the static abilities of this object that are active in its current zone"""
+        from abilities import StaticAbility
+        if self.zone is None:
+            return []
+        return [a for a in self.base_chars.abilities if isinstance(a, StaticAbility) and self.zone in a.active_zones()]
 
     def direct_move(self, newzone: Zone) -> GameObject:
         """
@@ -112,9 +263,14 @@ class GameObject:
         if newzone not in [battlefield, stack]:
             new_controller = self.owner
 
+        stats.count_move(oldzone, newzone)
+        for a in self.static_abilities():
+            a.unregister()
         new = type(self)(zone=newzone, chars=self.base_chars,
                          owner=self.owner, controller=new_controller)
 
+        journal.record_item(objects, self.id, ordered=True)
+        journal.record_item(oldzone.objects, self.id, ordered=True)
         del objects[self.id]
         del oldzone.objects[self.id]
         self.dead = True
@@ -134,8 +290,14 @@ class GameObject:
         """
         Deletes this object, removing it from the game entirely.
         """
+        for a in self.static_abilities():
+            a.unregister()
+        import layers
+        layers.changed(layers.ZONES)
         if self.zone:
+            journal.record_item(self.zone.objects, self.id, ordered=True)
             del self.zone.objects[self.id]
+        journal.record_item(objects, self.id, ordered=True)
         del objects[self.id]
         self.zone = None
         self.dead = True
@@ -165,10 +327,16 @@ class Player(GameObject):
         self.hand = Zone(name + " hand")
         self.graveyard = Zone(name + " graveyard")
         self.library = Zone(name + " library")
-        players.append(self)
+        _join_turn_order(self)
+        players.add(self)
         self.mana_pool = ManaPool()
         self.lands_played = 0
 
+    def __setattr__(self, name, value):
+        if name == "life":
+            sba_dirty.add(self)
+        super().__setattr__(name, value)
+
     def move_to(self, newzone: Zone):
         assert False
 
@@ -186,6 +354,11 @@ class Player(GameObject):
         """Decides a choice of objects, such as targets"""
         return None
 
+    def action_failed(self, act: Action, reason: str = None):
+        """Called when an action this player decided on couldn't be taken, such as a spell with no legal targets.
+        reason says why, for showing to a user."""
+        pass
+
     def decide_attacks(self):
         """Decides what creatures to attack with.
         Return a list to attack at the next player, or a dict to choose which players and pws are attacked.
@@ -216,7 +389,7 @@ class Player(GameObject):
 
 
 @dataclass
-class PermanentState:
+class PermanentState(journal.Journaled):
     """The additional state that a permanent can have."""
     tapped: bool = False
     summoning_sick: bool = True
@@ -261,10 +434,36 @@ class Token(CardLike):
     pass
 
 
+def _join_turn_order(p: Player):
+    """Adds p to the end of the turn order"""
+    if not players:
+        p.next_in_turn = p.prev_in_turn = p
+        return
+    first = players[0]
+    last = first.prev_in_turn
+    p.prev_in_turn, p.next_in_turn = last, first
+    last.next_in_turn = p
+    first.prev_in_turn = p
+
+
+def leave_turn_order(p: Player):
+    """Removes p from the turn order. p keeps its links, so the players next to it where it was can still be found."""
+    p.prev_in_turn.next_in_turn = p.next_in_turn
+    p.next_in_turn.prev_in_turn = p.prev_in_turn
+
+
+def live_player(p: Player) -> Player:
+    """Returns p if they're still in the game, or else the first player after them in turn order who is"""
+    while p.dead and players:
+        p = p.next_in_turn
+    return p
+
+
 def next_player(p: Player) -> Player:
     """Returns the player next in turn order after p"""
-    ps = iter(players + [players[0]])
-    for q in ps:
-        if p == q:
-            return next(ps)
-    assert False
+    return p.next_in_turn
+
+
+def prev_player(p: Player) -> Player:
+    """Returns the player before p in turn order"""
+    return p.prev_in_turn
@@ -0,0 +1,220 @@
+"""
+A vectorized simulator for goldfish questions: how fast a deck kills an opponent that does nothing.
+
+Rather than playing each game through do_turn, a deck is compiled into arrays and many shuffles are simulated at once.
+Only decks made of cards whose play can be modelled exactly are supported:
+basic lands (or other lands with a single tap mana ability), simple mana rocks, vanilla creatures, and damage spells
+(defined cards whose spell deals a fixed amount of damage to any target or player, then maybe draws cards).
+The simulated player follows the same greedy plan as Aggressive: play the first land in hand,
+cast everything it can in the order it was drawn, aim burn at the opponent's face, and attack with everything that can.
+"""
+
+from dataclasses import dataclass
+import numpy as np
+from abilities import SimpleManaAbility
+from characteristics import Characteristics
+from cost import ManaCost, TapCost
+from carddefs import DefinedSpellAbility, DamageEffect, DrawCardsEffect
+from mana import mana_types
+
+
+class UnsupportedCard(Exception):
+    """Raised when a deck contains a card that can't be simulated faithfully"""
+    pass
+
+
+LAND, ROCK, CREATURE, BURN = range(4)
+
+# index of generic mana in a cost vector; the other indices follow mana_types
+GEN = len(mana_types)
+
+
+@dataclass
+class CompiledDeck:
+    """A deck compiled into arrays indexed by position in the decklist"""
+    kind: np.ndarray
+    cost: np.ndarray
+    mana: np.ndarray
+    power: np.ndarray
+    burn: np.ndarray
+    draw: np.ndarray
+
+    def __len__(self):
+        return len(self.kind)
+
+
+def _mana_ability(c: Characteristics) -> SimpleManaAbility:
+    """Returns the only ability of c if it is a plain tap mana ability"""
+    if len(c.abilities) != 1:
+        raise UnsupportedCard(c.name)
+    ab = c.abilities[0]
+    if not isinstance(ab, SimpleManaAbility) or type(ab.cost) is not TapCost or ab.sorcery_only:
+        raise UnsupportedCard(c.name)
+    return ab
+
+
+def _cost_vector(c: Characteristics):
+    if not isinstance(c.cost, ManaCost):
+        raise UnsupportedCard(c.name)
+    return [c.cost.mana[col] for col in mana_types] + [c.cost.mana["gen"]]
+
+
+def _burn(c: Characteristics) -> tuple:
+    """Returns (damage, cards drawn) for a damage spell"""
+    if len(c.abilities) != 1 or type(c.abilities[0]) is not DefinedSpellAbility:
+        raise UnsupportedCard(c.name)
+    steps = c.abilities[0].steps
+    dmg, draw = steps[0], steps[1] if len(steps) == 2 else None
+    if type(dmg) is not DamageEffect or dmg.target not in ("damagable", "players") or len(steps) > 2 or \
+            type(dmg.params["amount"]) is not int:
+        raise UnsupportedCard(c.name)
+    if draw is None:
+        return dmg.params["amount"], 0
+    if type(draw) is not DrawCardsEffect or draw.target or draw.params.keys() != {"amount"} or \
+            type(draw.params["amount"]) is not int:
+        raise UnsupportedCard(c.name)
+    return dmg.params["amount"], draw.params["amount"]
+
+
+def _compile_card(c: Characteristics):
+    """Returns (kind, cost, mana, power, burn, draw) for a single card"""
+    cost = [0]*(GEN+1)
+    mana = [0]*GEN
+    power = burn = draw = 0
+    if c.types == ["land"]:
+        kind = LAND
+        ab = _mana_ability(c)
+        mana[mana_types.index(ab.col)] = ab.amt
+    elif c.types == ["artifact"]:
+        kind = ROCK
+        ab = _mana_ability(c)
+        mana[mana_types.index(ab.col)] = ab.amt
+        cost = _cost_vector(c)
+    elif c.has_type("creature") and not c.has_type("land"):
+        if c.abilities:
+            raise UnsupportedCard(c.name)
+        kind = CREATURE
+        power = c.power
+        cost = _cost_vector(c)
+    elif c.types in (["instant"], ["sorcery"]):
+        kind = BURN
+        burn, draw = _burn(c)
+        cost = _cost_vector(c)
+    else:
+        raise UnsupportedCard(c.name)
+    return kind, cost, mana, power, burn, draw
+
+
+def compile_deck(deck: list[Characteristics]) -> CompiledDeck:
+    """Compiles a deck into arrays. Raises UnsupportedCard if any card can't be modelled."""
+    rows = [_compile_card(c) for c in deck]
+    if not rows:
+        raise ValueError("empty deck")
+    kind, cost, mana, power, burn, draw = zip(*rows)
+    return CompiledDeck(
+        kind=np.array(kind, dtype=np.int8),
+        cost=np.array(cost, dtype=np.int32),
+        mana=np.array(mana, dtype=np.int32),
+        power=np.array(power, dtype=np.int32),
+        burn=np.array(burn, dtype=np.int32),
+        draw=np.array(draw, dtype=np.int32))
+
+
+def _simulate(deck: CompiledDeck, n: int, rng, max_turns: int, on_the_play: bool, life: int, hand_size: int):
+    """Simulates n shuffles of the deck, returning the kill turn of each (0 if it didn't kill in time)"""
+    size = len(deck)
+    order = np.argsort(rng.random((n, size)), axis=1).astype(np.int32)
+    spells = deck.kind[order] != LAND
+
+    drawn = np.full(n, min(hand_size, size), dtype=np.int32)
+    played = np.zeros((n, size), dtype=bool)
+    sources = np.zeros((n, GEN), dtype=np.int32)
+    ready = np.zeros(n, dtype=np.int32)
+    sick = np.zeros(n, dtype=np.int32)
+    opp_life = np.full(n, life, dtype=np.int32)
+    alive = np.ones(n, dtype=bool)
+    kill = np.zeros(n, dtype=np.int32)
+    positions = np.arange(size)
+
+    def check_kills(t):
+        dead = alive & (opp_life <= 0)
+        kill[dead] = t
+        alive[dead] = False
+
+    for t in range(1, max_turns+1):
+        if t > 1 or not on_the_play:
+            drawn = np.minimum(drawn + 1, size)
+        ready += sick
+        sick[:] = 0
+
+        # play the first land in hand
+        lands = (positions < drawn[:, None]) & ~played & ~spells
+        g = np.nonzero(alive & lands.any(axis=1))[0]
+        p = lands[g].argmax(axis=1)
+        played[g, p] = True
+        sources[g] += deck.mana[order[g, p]]
+
+        # cast everything that can be cast, in the order it was drawn;
+        # games that cast something get another pass in case that made more mana or drew a card
+        pool = sources.copy()
+        todo = alive.copy()
+        while todo.any():
+            changed = np.zeros(n, dtype=bool)
+            for p in range(drawn[todo].max()):
+                can = todo & spells[:, p] & ~played[:, p] & (p < drawn)
+                g = np.nonzero(can)[0]
+                if not len(g):
+                    continue
+                cards = order[g, p]
+                cost = deck.cost[cards]
+                coloured = cost[:, :GEN]
+                ok = (pool[g] >= coloured).all(axis=1)
+                ok &= pool[g].sum(axis=1) - coloured.sum(axis=1) >= cost[:, GEN]
+                g, cards, cost, coloured = g[ok], cards[ok], cost[ok], coloured[ok]
+                if not len(g):
+                    continue
+                changed[g] = True
+
+                # pay coloured mana, then generic in the same order as ManaPool.spend
+                pool[g] -= coloured
+                rem = cost[:, GEN]
+                for col in range(GEN):
+                    take = np.minimum(rem, pool[g, col])
+                    pool[g, col] -= take
+                    rem -= take
+
+                played[g, p] = True
+                pool[g] += deck.mana[cards]
+                sources[g] += deck.mana[cards]
+                sick[g] += deck.power[cards]
+                opp_life[g] -= deck.burn[cards]
+                drawn[g] = np.minimum(drawn[g] + deck.draw[cards], size)
+            todo = changed
+        check_kills(t)
+
+        # attack with everything that isn't summoning sick
+        opp_life[alive] -= ready[alive]
+        check_kills(t)
+        if not alive.any():
+            break
+    return kill
+
+
+def kill_turns(deck, games: int = 100000, max_turns: int = 20, on_the_play: bool = True, life: int = 20,
+               hand_size: int = 7, seed=None, batch_size: int = 100000) -> np.ndarray:
+    """Returns the turn on which the deck kills a goldfish in each of the given number of games, or 0 if it didn't by max_turns.
+    Turns are counted from 1 and only the deck's own turns are counted. deck is either a list of Characteristics or a CompiledDeck."""
+    if not isinstance(deck, CompiledDeck):
+        deck = compile_deck(deck)
+    rng = np.random.default_rng(seed)
+    res = []
+    for start in range(0, games, batch_size):
+        n = min(batch_size, games - start)
+        res.append(_simulate(deck, n, rng, max_turns, on_the_play, life, hand_size))
+    return np.concatenate(res) if res else np.zeros(0, dtype=np.int32)
+
+
+def kill_turn_distribution(deck, games: int = 100000, max_turns: int = 20, **kwargs) -> np.ndarray:
+    """Returns an array whose entry t is the fraction of games killed on turn t; entry 0 is the fraction not killed by max_turns."""
+    kills = kill_turns(deck, games, max_turns, **kwargs)
+    return np.bincount(kills, minlength=max_turns+1) / max(len(kills), 1)
@@ -0,0 +1,261 @@
+"""
+An undo journal for the game state.
+
+While a checkpoint is outstanding, changes to the game state are recorded so they can be rolled back
+in time proportional to the number of changes, rather than by copying the whole game state.
+This lets search explore a line of play in place: take a checkpoint, play the line, and roll back.
+Rolling back returns a Redo, which can replay the undone changes to return to the end of the line.
+When there are no checkpoints nothing is recorded, so normal play doesn't pay for it.
+
+Objects whose attributes are game state record their own attribute changes (see Journaled).
+Containers are changed through the helpers here, such as add and set_item, or record their changes with record_item.
+
+The module globals that make up the state of a game are declared by the modules they belong to with per_game,
+so that game.GameState can keep several games in one process.
+"""
+
+from contextlib import contextmanager
+
+MISSING = object()
+
+# for each module global that's part of the state of a game, as (module name, global name),
+# a function returning its value in an empty game
+game_globals = {}
+
+
+def per_game(module: str, **fresh):
+    """Declares globals of the named module as part of the state of a game.
+    Each keyword names a global, and is a function returning its value in an empty game."""
+    for name, f in fresh.items():
+        game_globals[module, name] = f
+
+
+_log = []
+_depth = 0
+_replaying = False
+per_game(__name__, _log=list, _depth=int, _replaying=bool)
+
+on_rollback = []
+
+
+def recording() -> bool:
+    """Returns true if changes are currently being recorded"""
+    return _depth > 0 and not _replaying
+
+
+class Redo:
+    """Changes that were rolled back, which can be made again with redo"""
+
+    def __init__(self, entries, next_id):
+        self.entries = entries
+        self.next_id = next_id
+
+
+def checkpoint():
+    """Starts recording changes, returning a checkpoint that can later be rolled back to"""
+    import game
+    global _depth
+    _depth += 1
+    return (len(_log), game.next_id)
+
+
+def _release():
+    global _depth
+    _depth -= 1
+    if _depth == 0:
+        _log.clear()
+
+
+def _replay(entries) -> list:
+    """Applies undo entries in order, returning the entries that would reverse them"""
+    global _replaying
+    res = []
+    _replaying = True
+    try:
+        for e in entries:
+            res.append(e[0](*e[1:]))
+    finally:
+        _replaying = False
+    for h in on_rollback:
+        h()
+    return res
+
+
+def rollback(cp) -> Redo:
+    """Undoes every change made since the checkpoint cp, and releases it.
+    Returns a Redo which can be used to make the changes again."""
+    import game
+    idx, next_id = cp
+    undone = _log[idx:]
+    del _log[idx:]
+    inverse = _replay(reversed(undone))
+    res = Redo(inverse[::-1], game.next_id)
+    game.next_id = next_id
+    _release()
+    return res
+
+
+def redo(r: Redo):
+    """Makes the changes undone by a rollback again. The game must be in the state the rollback left it in."""
+    import game
+    inverse = _replay(r.entries)
+    if _depth:
+        _log.extend(inverse)
+    game.next_id = r.next_id
+
+
+def commit(cp):
+    """Keeps the changes made since the checkpoint cp, and releases it"""
+    _release()
+
+
+@contextmanager
+def trial():
+    """A context in which changes are made tentatively, and rolled back on exit"""
+    cp = checkpoint()
+    try:
+        yield
+    finally:
+        rollback(cp)
+
+
+def record_attr(obj, name: str):
+    """Records the current value of an attribute of obj, before it is changed"""
+    if _depth and not _replaying:
+        _log.append((_undo_attr, obj, name, obj.__dict__.get(name, MISSING)))
+
+
+class IdOrderedDict(dict):
+    """A dict whose keys are ids, added in increasing order, which keeps them in that order. A key a rollback puts back
+    is put back in its place lazily, when the dict is next iterated; so the rollback takes time proportional to the
+    number of changes, and putting keys in order takes no more than the iteration that needs it."""
+
+    __slots__ = ("_misordered",)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._misordered = False
+
+    def restore(self, key, value):
+        """Puts back a key that was deleted"""
+        last = next(dict.__reversed__(self), None)
+        self[key] = value
+        if last is not None and last > key:
+            self._misordered = True
+
+    def _reorder(self):
+        items = sorted(dict.items(self))
+        dict.clear(self)
+        dict.update(self, items)
+        self._misordered = False
+
+    def __iter__(self):
+        if self._misordered:
+            self._reorder()
+        return dict.__iter__(self)
+
+    def __reversed__(self):
+        if self._misordered:
+            self._reorder()
+        return dict.__reversed__(self)
+
+    def keys(self):
+        if self._misordered:
+            self._reorder()
+        return dict.keys(self)
+
+    def values(self):
+        if self._misordered:
+            self._reorder()
+        return dict.values(self)
+
+    def items(self):
+        if self._misordered:
+            self._reorder()
+        return dict.items(self)
+
+    def clear(self):
+        dict.clear(self)
+        self._misordered = False
+
+
+def record_item(d: dict, key, ordered=False):
+    """Records the current value of d[key], before it is changed or deleted.
+    If ordered is true, d is an IdOrderedDict, and a deleted key is put back in its place when undoing."""
+    if _depth and not _replaying:
+        _log.append((_undo_item, d, key, d.get(key, MISSING), ordered))
+
+
+def record_call(undo: tuple, redo: tuple):
+    """Records a change that is undone by calling undo[0](*undo[1:]), and redone by calling redo[0](*redo[1:])"""
+    if _depth and not _replaying:
+        _log.append((_undo_call, undo, redo))
+
+
+def _undo_attr(obj, name, old):
+    d = obj.__dict__
+    cur = d.get(name, MISSING)
+    if old is MISSING:
+        d.pop(name, None)
+    else:
+        d[name] = old
+    return (_undo_attr, obj, name, cur)
+
+
+def _undo_item(d, key, old, ordered):
+    cur = d.get(key, MISSING)
+    if old is MISSING:
+        d.pop(key, None)
+        return (_undo_item, d, key, cur, ordered)
+    if ordered and cur is MISSING:
+        d.restore(key, old)
+    else:
+        d[key] = old
+    return (_undo_item, d, key, cur, ordered)
+
+
+def _undo_call(undo, redo):
+    undo[0](*undo[1:])
+    return (_undo_call, redo, undo)
+
+
+class Journaled:
+    """A mixin for objects whose attributes are game state. Attribute changes are recorded in the journal."""
+
+    def __setattr__(self, name, value):
+        if _depth and not _replaying:
+            _log.append((_undo_attr, self, name, self.__dict__.get(name, MISSING)))
+        object.__setattr__(self, name, value)
+
+
+def set_item(d: dict, key, value):
+    """Sets d[key], recording the change"""
+    record_item(d, key)
+    d[key] = value
+
+
+def del_item(d: dict, key):
+    """Deletes d[key] if it exists, recording the change"""
+    if key in d:
+        record_item(d, key)
+        del d[key]
+
+
+def add(s: set, x):
+    """Adds x to s, recording the change"""
+    if x not in s:
+        s.add(x)
+        record_call((s.discard, x), (s.add, x))
+
+
+def discard(s: set, x):
+    """Removes x from s if present, recording the change"""
+    if x in s:
+        s.discard(x)
+        record_call((s.add, x), (s.discard, x))
+
+
+def append(l: list, x):
+    """Appends x to l, recording the change"""
+    l.append(x)
+    record_call((l.pop,), (l.append, x))
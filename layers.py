@@ -0,0 +1,377 @@
+"""
+Continuous effects and the layer system (rule 613).
+
+The characteristics of each object are computed by applying every continuous effect that applies to it, layer by layer,
+on top of its base characteristics. The result is cached on the object until something that could change it happens.
+Any effect starting or ending invalidates every cache at once by bumping the epoch. Other changes to the game are
+reported through changed: a change to one object, such as tapping it or putting counters on it, only invalidates that
+object's cache, unless a current effect reads that kind of change (see ContinuousEffect.reads), in which case every
+cache is invalidated.
+
+Within a layer, effects are applied in timestamp order except where one depends on another (613.8).
+The rules are unclear on how dependency loops should interact with effects depending on them (see notes.txt),
+so the interpretation used is selectable through the `interpretation` global:
+
+INITIAL: apply the oldest effect that doesn't depend on an unapplied effect; if there is none, apply the oldest.
+LOOPS: apply the oldest effect that doesn't depend on an unapplied effect; if there is none,
+    apply the oldest effect of a dependency loop that doesn't itself depend on anything outside the loop.
+FIXED_LOOPS: dependency loops are found once among all the effects in the layer; each loop is applied as a unit
+    in timestamp order, and loops and other effects are applied in dependency order.
+In the first two, dependencies are reevaluated among the unapplied effects after each effect is applied (613.8c).
+"""
+
+from functools import lru_cache
+import re
+import game
+import journal
+
+COPY, CONTROL, TEXT, TYPE, COLOUR, ABILITY, PT_CDA, PT_SET, PT_MODIFY, PT_SWITCH = LAYERS = \
+    ["1", "2", "3", "4", "5", "6", "7a", "7b", "7c", "7d"]
+
+INITIAL = "initial"
+LOOPS = "loops"
+FIXED_LOOPS = "fixed loops"
+
+interpretation = LOOPS
+
+# the kinds of change to the game that changed is told about; STATE is any other change to a permanent's state,
+# such as it attacking or no longer being summoning sick
+ZONES, COUNTERS, TAPPED, DAMAGE, STATE, LIFE, STEP = CHANGES = \
+    ["zones", "counters", "tapped", "damage", "state", "life", "step"]
+
+epoch = 0
+# bumped by every change that could affect characteristics, including those that only invalidate one object's
+version = 0
+effects = {layer: [] for layer in LAYERS}
+_num_effects = 0
+_static = {}
+_ordered = {}
+_ordered_epoch = -1
+# how many of the current effects read each kind of change
+_reads = {kind: 0 for kind in CHANGES}
+journal.per_game(__name__, effects=lambda: {layer: [] for layer in LAYERS}, _num_effects=int, _static=dict,
+                 _ordered=dict, _ordered_epoch=lambda: -1, _reads=lambda: {kind: 0 for kind in CHANGES})
+
+
+class ContinuousEffect:
+    """A continuous effect (611) that modifies the characteristics of objects in a single layer."""
+    layer: str = PT_MODIFY
+    timestamp: int = 0
+    until_end_of_turn: bool = False
+    src = None
+    # the kinds of change (see CHANGES) to anything other than the object this is applied to that can change what it
+    # does; such as ZONES for an effect that counts the creatures on the battlefield.
+    # The object's own characteristics so far, zone, counters and permanent state are always seen.
+    reads: frozenset = frozenset()
+
+    def applies_to(self, obj, chars) -> bool:
+        """Returns true if this effect applies to obj, whose characteristics computed so far are chars"""
+        return False
+
+    def apply(self, obj, chars):
+        """Modifies chars, the characteristics of obj computed so far"""
+        pass
+
+    def depends_on(self, other) -> bool:
+        """Returns true if this effect depends on other, as defined by 613.8a"""
+        return False
+
+    def __repr__(self):
+        return f"{type(self).__name__}@{self.timestamp}"
+
+
+def invalidate():
+    """Marks all cached characteristics as out of date"""
+    global epoch, version
+    epoch += 1
+    version += 1
+
+
+journal.on_rollback.append(invalidate)
+
+
+def changed(kind: str, obj=None):
+    """Marks the characteristics that a change of the given kind (one of CHANGES) could affect as out of date.
+    obj is the object that changed, if the change is to a single object; as its own characteristics may change,
+    it's also due a check of state-based actions."""
+    global version
+    if obj is not None:
+        game.sba_dirty.add(obj)
+    if _reads[kind]:
+        invalidate()
+        return
+    version += 1
+    if obj is not None:
+        obj.chars.invalidate()
+
+
+def _count_reads(eff: ContinuousEffect, n: int):
+    for kind in eff.reads:
+        _reads[kind] += n
+
+
+def add_effect(eff: ContinuousEffect, timestamp=None):
+    """Starts a continuous effect. If no timestamp is given, it gets the current time."""
+    global _num_effects
+    eff.timestamp = game.fresh_id() if timestamp is None else timestamp
+    effects[eff.layer].append(eff)
+    _num_effects += 1
+    _count_reads(eff, 1)
+    journal.record_call((remove_effect, eff), (add_effect, eff, eff.timestamp))
+    invalidate()
+
+
+def remove_effect(eff: ContinuousEffect):
+    """Ends a continuous effect"""
+    global _num_effects
+    effects[eff.layer].remove(eff)
+    _num_effects -= 1
+    _count_reads(eff, -1)
+    journal.record_call((_readd_effect, eff), (remove_effect, eff))
+    invalidate()
+
+
+def _readd_effect(eff):
+    global _num_effects
+    effects[eff.layer].append(eff)
+    _num_effects += 1
+    _count_reads(eff, 1)
+    invalidate()
+
+
+def add_static(ab):
+    """Starts the continuous effects generated by a static ability. They get the timestamp of the ability's source."""
+    effs = ab.effects()
+    _static[ab] = effs
+    journal.record_call((_static.pop, ab, None), (_static.__setitem__, ab, effs))
+    for e in effs:
+        e.src = ab.src
+        add_effect(e, ab.src.id)
+
+
+def remove_static(ab):
+    """Ends the continuous effects generated by a static ability"""
+    effs = _static.pop(ab, [])
+    if effs:
+        journal.record_call((_static.__setitem__, ab, effs), (_static.pop, ab, None))
+    for e in effs:
+        remove_effect(e)
+
+
+def end_of_turn():
+    """Ends all "until end of turn" effects (514.2)"""
+    for layer in LAYERS:
+        for e in [e for e in effects[layer] if e.until_end_of_turn]:
+            remove_effect(e)
+
+
+def clear():
+    """Ends all continuous effects"""
+    global _num_effects
+    for layer in LAYERS:
+        effects[layer].clear()
+    _static.clear()
+    _num_effects = 0
+    for kind in CHANGES:
+        _reads[kind] = 0
+    invalidate()
+
+
+def _sccs(nodes, deps):
+    """Returns the strongly connected components of the graph where each node n has edges to deps[n], using Tarjan's algorithm.
+    Components are returned in reverse topological order; i.e. each component comes after everything it depends on."""
+    index = {}
+    low = {}
+    on_stack = set()
+    stack = []
+    res = []
+
+    def visit(v):
+        index[v] = low[v] = len(index)
+        stack.append(v)
+        on_stack.add(v)
+        for w in deps[v]:
+            if w not in index:
+                visit(w)
+                low[v] = min(low[v], low[w])
+            elif w in on_stack:
+                low[v] = min(low[v], index[w])
+        if low[v] == index[v]:
+            comp = []
+            while True:
+                w = stack.pop()
+                on_stack.remove(w)
+                comp.append(w)
+                if w == v:
+                    break
+            res.append(comp)
+
+    for v in nodes:
+        if v not in index:
+            visit(v)
+    return res
+
+
+def _dependencies(effs):
+    return {e: [f for f in effs if f is not e and e.depends_on(f)] for e in effs}
+
+
+def order_effects(effs: list, interp: str = None) -> list:
+    """Returns the order in which the given effects, all in the same layer, are applied."""
+    interp = interp or interpretation
+    effs = sorted(effs, key=lambda e: e.timestamp)
+    if len(effs) <= 1:
+        return effs
+
+    if interp == FIXED_LOOPS:
+        deps = _dependencies(effs)
+        comps = _sccs(effs, deps)
+        comp_of = {e: i for i, c in enumerate(comps) for e in c}
+        waiting = {i: {comp_of[f] for e in c for f in deps[e]} - {i}
+                   for i, c in enumerate(comps)}
+        res = []
+        left = set(range(len(comps)))
+        while left:
+            ready = [i for i in left if not waiting[i] & left]
+            i = min(ready, key=lambda i: min(e.timestamp for e in comps[i]))
+            left.remove(i)
+            res += sorted(comps[i], key=lambda e: e.timestamp)
+        return res
+
+    res = []
+    left = effs
+    while left:
+        deps = _dependencies(left)
+        chosen = next((e for e in left if not deps[e]), None)
+        if chosen is None:
+            if interp == LOOPS:
+                for comp in _sccs(left, deps):
+                    members = set(comp)
+                    if all(f in members for e in comp for f in deps[e]):
+                        c = min(comp, key=lambda e: e.timestamp)
+                        if chosen is None or c.timestamp < chosen.timestamp:
+                            chosen = c
+            else:
+                chosen = left[0]
+        res.append(chosen)
+        left = [e for e in left if e is not chosen]
+    return res
+
+
+def _ordered_effects(layer):
+    global _ordered_epoch
+    if _ordered_epoch != epoch:
+        _ordered.clear()
+        _ordered_epoch = epoch
+    if layer not in _ordered:
+        _ordered[layer] = order_effects(effects[layer])
+    return _ordered[layer]
+
+
+@lru_cache(maxsize=None)
+def pt_counter(kind: str):
+    """Returns the (power, toughness) modification of a counter kind such as "+1/+1", or None if it isn't one"""
+    m = re.fullmatch(r'([+-]\d+)/([+-]\d+)', kind)
+    if m:
+        return int(m.groups()[0]), int(m.groups()[1])
+    return None
+
+
+def _working_copy(base):
+    """A copy of a set of characteristics that effects can modify; abilities themselves aren't copied"""
+    c = object.__new__(type(base))
+    c.__dict__.update(base.__dict__)
+    c.supertypes = list(base.supertypes)
+    c.types = list(base.types)
+    c.subtypes = list(base.subtypes)
+    c.colours = set(base.colours)
+    c.abilities = list(base.abilities)
+    # effects may change any of these, so they're checked directly until the masks are recomputed
+    c.type_mask = c.supertype_mask = c.subtype_mask = c.keyword_mask = None
+    return c
+
+
+class LayeredChars:
+    """The characteristics of an object after continuous effects are applied.
+    Results are cached until the epoch changes, or they're invalidated for this object alone."""
+
+    __slots__ = ("src", "_epoch", "_chars", "_controller")
+
+    def __init__(self, src):
+        self.src = src
+        self._epoch = -1
+        self._chars = None
+        self._controller = None
+
+    def _compute(self):
+        obj = self.src
+        base = obj.base_chars
+        self._epoch = epoch
+        self._chars = base
+        self._controller = obj.base_controller
+
+        dp = dt = 0
+        has_counters = False
+        for kind, amt in obj.counters.items():
+            pt = pt_counter(kind)
+            if pt and amt:
+                has_counters = True
+                dp += pt[0] * amt
+                dt += pt[1] * amt
+        if not _num_effects and not has_counters:
+            return
+
+        # while computing, this object's own characteristics are seen as they are so far
+        chars = self._chars = _working_copy(base)
+        chars.controller = obj.base_controller
+        for layer in LAYERS:
+            if layer == PT_MODIFY:
+                # 613.4c counters apply in the same layer as other modifying effects
+                chars.power += dp
+                chars.toughness += dt
+            if effects[layer]:
+                for e in _ordered_effects(layer):
+                    if e.applies_to(obj, chars):
+                        e.apply(obj, chars)
+            if layer == CONTROL:
+                self._controller = chars.controller
+        chars.compute_masks()
+
+    def invalidate(self):
+        """Marks these characteristics as out of date"""
+        self._epoch = -1
+
+    def get(self):
+        """Returns the current characteristics"""
+        if self._epoch != epoch:
+            self._compute()
+        return self._chars
+
+    @property
+    def controller(self):
+        if self._epoch != epoch:
+            self._compute()
+        return self._controller
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.get(), attr)
+
+    def __repr__(self):
+        return repr(self.get())
+
+
+class FixedChars(LayeredChars):
+    """The characteristics of an object that's been thrown away with its game, which are its base characteristics"""
+
+    __slots__ = ()
+
+    def __init__(self, chars, controller):
+        self.src = None
+        self._epoch = -1
+        self._chars = chars
+        self._controller = controller
+
+    def _compute(self):
+        self._epoch = epoch
@@ -0,0 +1,114 @@
+"""
+Limits on how long a game can go on, so that a game that would never end is drawn rather than played forever.
+
+At the start of each turn the game is fingerprinted, and it's drawn by repetition when the same position has come up
+a given number of times: the same player's turn, with the same life totals, the same cards in the same order in every
+zone, and the same state of every permanent. Players' own state isn't part of it, so a player that plays differently
+when a position comes back only has that many tries. The game is also drawn when it stalls: when no life total and
+nothing on the battlefield has changed for a number of turns. There are hard caps on the number of turns and on the
+number of times players receive priority, which they do after every action and every pass, so even a game stuck
+within a turn ends.
+
+Whenever a game ends, game.end_reason records why (see game.end_game). The limits are process-wide settings, and can
+be overridden for a block with limited.
+"""
+
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+import game
+import journal
+
+
+@dataclass(frozen=True)
+class Limits:
+    """How long a game may go on; None means there's no limit"""
+    # the most turns a game may last
+    max_turns: int = None
+    # the most times players may receive priority in a game
+    max_priority: int = 100_000
+    # the number of times a position may come up at the start of a turn before the game is drawn
+    repetitions: int = 3
+    # the most turns in a row in which no life total nor the battlefield may change
+    stall_turns: int = 50
+
+
+settings = Limits()
+
+# how many times each position has come up at the start of a turn
+_seen = {}
+# the life totals and battlefield when they last changed, and the turn they changed in
+_progress = None
+_priority = 0
+journal.per_game(__name__, _seen=dict, _progress=lambda: None, _priority=int)
+
+_module = sys.modules[__name__]
+
+
+@contextmanager
+def limited(**kwargs):
+    """Overrides some of the settings within a block"""
+    global settings
+    old = settings
+    settings = replace(settings, **kwargs)
+    try:
+        yield settings
+    finally:
+        settings = old
+
+
+def clear():
+    """Forgets the history of the game"""
+    global _progress, _priority
+    _seen.clear()
+    _progress = None
+    _priority = 0
+
+
+def _object_key(o, pos: dict) -> tuple:
+    return (o.name, pos.get(o.controller), o.power, o.toughness, tuple(sorted(o.counters.items())))
+
+
+def board_key() -> tuple:
+    """Returns what must stay the same for the game to be stalled: the life totals, and what's on the battlefield"""
+    pos = {p: i for i, p in enumerate(game.players)}
+    return tuple(p.life for p in game.players), tuple(sorted(_object_key(o, pos) for o in game.battlefield))
+
+
+def fingerprint() -> int:
+    """Returns a hash of the position: whose turn it is, and everything about the players and the objects in each
+    zone, other than their ids"""
+    pos = {p: i for i, p in enumerate(game.players)}
+    perms = tuple(sorted(_object_key(o, pos) + (o.permstate.tapped, o.permstate.summoning_sick, o.permstate.damage)
+                         for o in game.battlefield))
+    pls = tuple((p.life, p.lands_played, p.mana_pool.amounts, tuple(sorted(c.name for c in p.hand)),
+                 tuple(c.name for c in p.library), tuple(c.name for c in p.graveyard)) for p in game.players)
+    return hash((pos.get(game.turn.active_player), pls, perms, tuple(o.name for o in game.exile),
+                 tuple(o.name for o in game.stack)))
+
+
+def turn_started():
+    """Checks the limits at the start of a turn, ending the game if any is reached"""
+    global _progress
+    if settings.max_turns is not None and game.turn_idx >= settings.max_turns:
+        game.end_game("turn limit")
+    fp = fingerprint()
+    n = _seen.get(fp, 0) + 1
+    journal.set_item(_seen, fp, n)
+    if settings.repetitions is not None and n >= settings.repetitions:
+        game.end_game("repetition")
+    key = board_key()
+    if _progress is None or _progress[0] != key:
+        journal.record_attr(_module, "_progress")
+        _progress = (key, game.turn_idx)
+    elif settings.stall_turns is not None and game.turn_idx - _progress[1] >= settings.stall_turns:
+        game.end_game("stall")
+
+
+def priority_given():
+    """Counts a player receiving priority, ending the game if that's too many times"""
+    global _priority
+    journal.record_attr(_module, "_priority")
+    _priority += 1
+    if settings.max_priority is not None and _priority > settings.max_priority:
+        game.end_game("priority limit")
@@ -1,43 +1,60 @@
 from dataclasses import dataclass
+from functools import lru_cache
+import journal
 
 mana_types = "CWUBRG"
+# mana amounts and costs are vectors of the amount of each type of mana, in the order of mana_types, and for costs,
+# then the amount of generic mana at index GEN
+GEN = len(mana_types)
+_index = {c: i for i, c in enumerate(mana_types)}
+
+
+@lru_cache(maxsize=None)
+def _parse(x: str, generic: bool) -> tuple:
+    v = [0] * (GEN + 1)
+    num = ""
+    for c in x + " ":
+        if c.isdigit():
+            num += c
+            continue
+        if num:
+            v[GEN if generic else 0] += int(num)
+            num = ""
+        if c != " ":
+            v[_index[c]] += 1
+    return tuple(v)
+
+
+def vector(x, generic=False) -> tuple:
+    """Converts a description x of a mana cost or amount into a vector of the amount of each type of mana.
+    If generic is true, numbers are interpreted as generic mana; otherwise they are colourless mana."""
+    if isinstance(x, tuple):
+        return x
+    if isinstance(x, str):
+        return _parse(x, generic)
+    if isinstance(x, int):
+        return (0,) * GEN + (x,) if generic else (x,) + (0,) * GEN
+    if isinstance(x, dict):
+        return tuple(x.get(c, 0) for c in mana_types) + (x.get("gen", 0) if generic else 0,)
+    raise TypeError(x)
 
 
 def mana(x, generic=False):
-    """Converts a description x of a mana cost or ammount into a dict for the amount of each colour. 
+    """Converts a description x of a mana cost or ammount into a dict for the amount of each colour.
     If generic is true, numbers are interpreted as generic mana and are placed in the key 'gen' of the result."""
-    if isinstance(x, dict):
-        m = {c: (x[c] if c in x else 0) for c in mana_types}
-        if generic:
-            m["gen"] = x.get("gen", 0)
-        return m
-    if isinstance(x, int):
-        m = mana({})
-        if generic:
-            m["gen"] = x
-        else:
-            m["C"] += x
-        return m
     if isinstance(x, SpecialMana):
         return x
-    if isinstance(x, str):
-        m = mana({})
-        if generic:
-            m["gen"] = 0
-        for c in x:
-            if c in "0123456789":
-                if generic:
-                    m["gen"] += int(c)
-                else:
-                    m["C"] += int(c)
-            else:
-                m[c] += 1
-        return m
-    raise TypeError(x)
+    v = vector(x, generic)
+    m = dict(zip(mana_types, v))
+    if generic:
+        m["gen"] = v[GEN]
+    return m
 
 
-def mana_str(x: dict) -> str:
-    """Returns a string representation of the given mana dict"""
+def mana_str(x) -> str:
+    """Returns a string representation of the given mana dict or vector"""
+    if isinstance(x, (tuple, list)):
+        x = dict(zip(mana_types, x), **({"gen": x[GEN]} if len(x) > GEN else {}))
     res = ""
     if "gen" in x:
         if x["gen"]:
@@ -54,50 +71,36 @@ def mana_str(x: dict) -> str:
     return res
 
 
-class ManaPool:
+class ManaPool(journal.Journaled):
     """A player's mana pool"""
 
     def __init__(self):
-        self.pool = {c: 0 for c in mana_types}
+        # the amount of each type of mana in the pool, in the order of mana_types
+        self.amounts = (0,) * GEN
         self.special = []
 
-    def __getattr__(self, name):
-        if name in mana_types:
-            return self.pool[name]
-        raise AttributeError(name)
-
-    def __setattr__(self, name: str, value: int) -> None:
-        if name in mana_types:
-            self.pool[name] = value
-        else:
-            object.__setattr__(self, name, value)
-
     def __getitem__(self, name):
-        return self.pool[name]
+        return self.amounts[_index[name]]
 
     def __setitem__(self, name, value):
-        if name in self.pool:
-            self.pool[name] = value
-        else:
-            raise KeyError(name)
+        i = _index[name]
+        if self.amounts[i] != value:
+            self.amounts = self.amounts[:i] + (value,) + self.amounts[i+1:]
 
     def empty(self):
         """Empties the mana pool. Effects that make certain types of mana not empty, convert, or cause mana burn are not implemented."""
         # todo: hooks for effects that affect mana emptying
-        for c in self.pool:
-            self.pool[c] = 0
-        nspecial = []
-        for s in self.special:
-            if not s.should_empty() and s.amt > 0:
-                nspecial.append(s)
-        self.special = nspecial
+        if any(self.amounts):
+            self.amounts = (0,) * GEN
+        if self.special:
+            self.special = [s for s in self.special if not s.should_empty() and s.amt > 0]
 
-    def payable_for(self, obj) -> dict:
-        """Returns the total amount of mana that can be spent on obj, in the form of a dict."""
-        res = {c: x for c, x in self.pool.items()}
+    def payable_for(self, obj) -> list:
+        """Returns the total amount of each type of mana that can be spent on obj, as a vector."""
+        res = list(self.amounts)
         for s in self.special:
             if s.can_spend_on(obj):
-                res[s.colour] += s.amt
+                res[_index[s.colour]] += s.amt
         return res
 
     def spend(self, col, amt, obj, choices=None) -> int:
@@ -109,15 +112,17 @@ class ManaPool:
                 if amt == 0:
                     return 0
             return amt
-        if amt <= self.pool[col]:
-            self.pool[col] -= amt
+        have = self[col]
+        if amt <= have:
+            self[col] = have - amt
             return 0
-        amt -= self.pool[col]
-        self.pool[col] = 0
+        amt -= have
+        self[col] = 0
         for s in self.special:
             if s.colour == col and s.amt >= 0 and s.can_spend_on(obj):
                 spent = min(amt, s.amt)
                 amt -= spent
+                journal.record_attr(s, "amt")
                 s.amt -= spent
                 s.on_spend(obj, spent)
             if amt == 0:
@@ -125,16 +130,14 @@ class ManaPool:
         return amt
 
     def __iadd__(self, x):
-        x = mana(x)
         if isinstance(x, SpecialMana):
-            self.special.append(x)
+            self.special = self.special + [x]
         else:
-            for c in x:
-                self.pool[c] += x.c
+            self.amounts = tuple(a + b for a, b in zip(self.amounts, vector(x)))
         return self
 
     def __str__(self):
-        res = mana_str(self.pool)
+        res = mana_str(self.amounts)
 
         if self.special:
             if res != "0":
@@ -142,8 +145,7 @@ class ManaPool:
             else:
                 res = ""
             for m in self.special:
-                res += (int(m.amt) if m.colour ==
-                        "C" else m.colour*m.amount) + "*"
+                res += (str(m.amt) if m.colour == "C" else m.colour * m.amt) + "*"
         return res
 
 
@@ -0,0 +1,254 @@
+"""
+Playing matchups between decks in batches, on a process pool, with sequential stopping.
+
+Rather than a fixed number of games, each matchup is played until its stopping rule is satisfied: an SPRT deciding
+whether the first deck wins more or less often than some margin around even, or a confidence interval on its win rate
+becoming narrow enough. Each game is dispatched to the pool on its own, and its outcome is streamed back to the
+coordinator, which only dispatches more games for matchups that haven't stopped. Matchups that are one-sided stop
+quickly, so most of the games go to the ones that are close.
+
+Outcomes are from the point of view of the first deck of a matchup: 1 for a win, 0 for a loss, and 1/2 for a draw.
+The decks take turns going first. A game that raises has no outcome: it's counted as an error, and the stopping rule
+doesn't see it.
+Each matchup's result also counts why its games ended, and adds up the engine's counters from them (see stats).
+"""
+
+import math
+import os
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import game
+import limits
+import stats
+from actions import start_game, do_turn
+from cards import build_deck
+from players import Aggressive
+
+
+def wilson_interval(successes: float, n: int, z: float = 1.96) -> tuple:
+    """Returns the Wilson score interval for a proportion, with z standard deviations either side"""
+    if n == 0:
+        return (0.0, 1.0)
+    p = successes / n
+    denom = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return (max(0.0, centre - half), min(1.0, centre + half))
+
+
+def play_game(deck0, deck1, first: int = 0, player=Aggressive, max_turns: int = 20, seed=None):
+    """Plays a game between two decks, returning the index of the winner or None for a draw.
+    If a seed is given, the decks are shuffled with it. Why the game ended is left in game.end_reason."""
+    game.clear_state()
+    pls = [player("P0"), player("P1")]
+    if seed is not None:
+        rng = random.Random(seed)
+        deck0, deck1 = rng.sample(deck0, len(deck0)), rng.sample(deck1, len(deck1))
+    build_deck(pls[0], deck0)
+    build_deck(pls[1], deck1)
+    try:
+        with limits.limited(max_turns=max_turns):
+            start_game(pls[first])
+            while True:
+                do_turn()
+    except game.GameOver:
+        pass
+    return pls.index(game.winner) if game.winner else None
+
+
+class StoppingRule:
+    """Decides when a matchup has been played enough"""
+
+    def __init__(self):
+        self.score = 0.0
+        self.games = 0
+
+    def update(self, outcome: float):
+        """Records the outcome of a game"""
+        self.score += outcome
+        self.games += 1
+
+    def done(self) -> bool:
+        return False
+
+    def decision(self):
+        """What the rule concluded: 1 if the first deck is favoured, 0 if it isn't, or None if that isn't known"""
+        return None
+
+
+class FixedGames(StoppingRule):
+    """Stops after a fixed number of games"""
+
+    def __init__(self, n: int):
+        super().__init__()
+        self.n = n
+
+    def done(self):
+        return self.games >= self.n
+
+
+class SPRT(StoppingRule):
+    """
+    Wald's sequential probability ratio test of the first deck's win rate being p0 (H0) against it being p1 (H1),
+    with error rates alpha and beta. It stops when either is accepted. A draw counts as half a win and half a loss.
+    """
+
+    def __init__(self, p0: float = 0.4, p1: float = 0.6, alpha: float = 0.05, beta: float = 0.05):
+        super().__init__()
+        self.win = math.log(p1 / p0)
+        self.loss = math.log((1 - p1) / (1 - p0))
+        self.upper = math.log((1 - beta) / alpha)
+        self.lower = math.log(beta / (1 - alpha))
+        self.llr = 0.0
+
+    def update(self, outcome):
+        super().update(outcome)
+        self.llr += outcome * self.win + (1 - outcome) * self.loss
+
+    def done(self):
+        return not self.lower < self.llr < self.upper
+
+    def decision(self):
+        if self.llr >= self.upper:
+            return 1
+        if self.llr <= self.lower:
+            return 0
+        return None
+
+
+class ConfidenceStop(StoppingRule):
+    """Stops when the Wilson interval of the win rate is at most width wide, or, if decide is true,
+    as soon as it excludes 1/2"""
+
+    def __init__(self, width: float = 0.1, z: float = 1.96, decide: bool = True):
+        super().__init__()
+        self.width = width
+        self.z = z
+        self.decide = decide
+
+    def done(self):
+        lo, hi = wilson_interval(self.score, self.games, self.z)
+        return hi - lo <= self.width or (self.decide and (lo > 0.5 or hi < 0.5))
+
+    def decision(self):
+        lo, hi = wilson_interval(self.score, self.games, self.z)
+        return 1 if lo > 0.5 else 0 if hi < 0.5 else None
+
+
+class MatchResult:
+    """The games played in a matchup"""
+
+    def __init__(self, deck0, deck1, rule: StoppingRule):
+        self.decks = (deck0, deck1)
+        self.rule = rule
+        self.wins = self.losses = self.draws = 0
+        # games that raised, which aren't counted in games
+        self.errors = 0
+        self.in_flight = 0
+        # how many games ended for each reason (see game.end_game); games that raised are counted as "error"
+        self.reasons = Counter()
+        # what the engine did in the matchup's games, added up over the workers
+        self.stats = stats.Stats()
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.losses + self.draws
+
+    @property
+    def score(self) -> float:
+        return (self.wins + self.draws / 2) / self.games if self.games else 0
+
+    def interval(self, z: float = 1.96) -> tuple:
+        return wilson_interval(self.wins + self.draws / 2, self.games, z)
+
+    @property
+    def decision(self):
+        return self.rule.decision()
+
+    def record(self, winner, reason: str = None, game_stats: stats.Stats = None):
+        self.reasons[reason] += 1
+        if game_stats is not None:
+            self.stats += game_stats
+        if reason == "error":
+            self.errors += 1
+            return
+        outcome = 1 if winner == 0 else 0 if winner == 1 else 0.5
+        self.wins += winner == 0
+        self.losses += winner == 1
+        self.draws += winner is None
+        self.rule.update(outcome)
+
+    def __str__(self):
+        lo, hi = self.interval()
+        names = [", ".join(c.name for c in d) for d in self.decks]
+        errors = f" ({self.errors} errors)" if self.errors else ""
+        return f"{names[0]} vs {names[1]}: {self.wins}-{self.losses}-{self.draws}{errors} " \
+               f"{self.score:.3f} [{lo:.3f}, {hi:.3f}] decision {self.decision}"
+
+
+# what the tasks on a process pool share, such as decks and settings; sent to each worker once, when it starts
+worker_state = {}
+
+
+def init_worker(state: dict):
+    """Initializes a process pool worker with the state its tasks share"""
+    worker_state.clear()
+    worker_state.update(state)
+
+
+def _play(m: int, d0: int, d1: int, k: int):
+    """Plays the kth game of matchup m, between the decks with indices d0 and d1"""
+    st = worker_state
+    stats.reset()
+    stats.count(stats.key("games"))
+    try:
+        seed = f"{st['seed']}:{m}:{k}" if st["shuffle"] else None
+        w = play_game(st["decks"][d0], st["decks"][d1], k % 2, st["player"], st["max_turns"], seed)
+        reason = game.end_reason
+    except Exception:
+        w, reason = None, "error"
+    return m, w, reason, stats.current.copy()
+
+
+def play_matchups(matchups: list, rule=SPRT, max_games: int = 1000, player=Aggressive, max_turns: int = 20,
+                  shuffle: bool = False, seed=0, workers: int = None) -> list:
+    """
+    Plays each matchup, a pair of decks, until a new rule() says to stop or max_games games have been played,
+    including those that raised. Returns a MatchResult for each. If shuffle is true the decks are shuffled for each game.
+    """
+    decks = []
+    ids = {}
+    for pair in matchups:
+        for d in pair:
+            if id(d) not in ids:
+                ids[id(d)] = len(decks)
+                decks.append(d)
+    results = [MatchResult(d0, d1, rule()) for d0, d1 in matchups]
+    state = {"decks": decks, "player": player, "max_turns": max_turns, "shuffle": shuffle, "seed": seed}
+    workers = workers or os.cpu_count()
+
+    def wanted(r):
+        return not r.rule.done() and r.games + r.errors + r.in_flight < max_games
+
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(state,)) as ex:
+        running = set()
+        while True:
+            # dispatch to whichever matchups that still need games have the fewest
+            while len(running) < 2 * workers:
+                open_ = [i for i, r in enumerate(results) if wanted(r)]
+                if not open_:
+                    break
+                i = min(open_, key=lambda i: results[i].games + results[i].errors + results[i].in_flight)
+                r = results[i]
+                k = r.games + r.errors + r.in_flight
+                r.in_flight += 1
+                running.add(ex.submit(_play, i, ids[id(r.decks[0])], ids[id(r.decks[1])], k))
+            if not running:
+                break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for f in done:
+                i, w, reason, game_stats = f.result()
+                results[i].in_flight -= 1
+                results[i].record(w, reason, game_stats)
+    return results
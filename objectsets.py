@@ -1,7 +1,9 @@
 from math import perm
 import game
+import stats
 from game import GameObject, Player, Zone
 from itertools import chain
+from util import bit
 
 
 class NoChoices(Exception):
@@ -31,6 +33,7 @@ class ObjectSet:
         if min == l:
             if min == 1 or not order_matters:
                 return list(self)[:min]
+        stats.count_decision("objects")
         ch = pl.decide_objects(self, reason, min, max, order_matters)
         if ch is None:
             return list(self)[:min]
@@ -43,6 +46,7 @@ class ObjectSet:
         return self.contains(x)
 
     def __iter__(self):
+        stats.count(stats.OBJECTSET_ITERATIONS)
         return iter(self.iter())
 
     def __len__(self):
@@ -52,7 +56,7 @@ class ObjectSet:
         return self.filter(lambda x: x in other)
 
     def __or__(self, other):
-        return _FObset(lambda x: x in self or x in other, lambda: set(self) | set(other))
+        return _FObset(lambda x: x in self or x in other, lambda: dict.fromkeys(chain(self, other)))
 
     def filter(self, cond):
         return _FObset(lambda x: self.contains(x) and cond(x), lambda: (x for x in self if cond(x)))
@@ -64,22 +68,22 @@ class ObjectSet:
         return self.filter(lambda x: x.controller != pl)
 
     def with_type(self, ty: str):
-        return self.filter(lambda x: x.has_type(ty))
+        return _mask_filter(self, "type_mask", "has_type", ty)
 
     def without_type(self, ty: str):
-        return self.filter(lambda x: not x.has_type(ty))
+        return _mask_filter(self, "type_mask", "has_type", ty, negate=True)
 
     def with_subtype(self, ty: str):
-        return self.filter(lambda x: x.has_subtype(ty))
+        return _mask_filter(self, "subtype_mask", "has_subtype", ty)
 
     def without_subtype(self, ty: str):
-        return self.filter(lambda x: not x.has_subtype(ty))
+        return _mask_filter(self, "subtype_mask", "has_subtype", ty, negate=True)
 
     def with_keyword(self, ty: str):
-        return self.filter(lambda x: x.has_keyword(ty))
+        return _mask_filter(self, "keyword_mask", "has_keyword", ty)
 
     def without_keyword(self, ty: str):
-        return self.filter(lambda x: not x.has_keyword(ty))
+        return _mask_filter(self, "keyword_mask", "has_keyword", ty, negate=True)
 
     def other_than(self, obj: GameObject):
         return self.filter(lambda x: x != obj)
@@ -91,6 +95,19 @@ class ObjectSet:
         return self.filter(lambda x: x.permstate and not x.permstate.tapped)
 
 
+def _mask_filter(obset: ObjectSet, mask_attr: str, method: str, name: str, negate=False):
+    """Filters obset by testing a bit of one of the masks of each object's characteristics.
+    Falls back to method for characteristics whose masks aren't computed, which happens while applying layers."""
+    b = bit(name)
+
+    def test(x):
+        c = x.chars.get()
+        m = getattr(c, mask_attr)
+        res = m & b != 0 if m is not None else getattr(c, method)(name)
+        return res != negate
+    return obset.filter(test)
+
+
 class _FObset(ObjectSet):
     def __init__(self, contains, iter=None):
         self._contains = contains
@@ -107,8 +124,19 @@ all_objects = _FObset(lambda x: not x.dead,
                       lambda: game.objects.values())
 
 
+class _ZoneSet(ObjectSet):
+    def __init__(self, z: Zone):
+        self.zone = z
+
+    def contains(self, x: GameObject):
+        return x.zone == self.zone and not x.dead
+
+    def iter(self):
+        return list(self.zone)
+
+
 def zone(z: Zone):
-    return _FObset(lambda x: x.zone == z and not x.dead, lambda: list(z))
+    return _ZoneSet(z)
 
 
 permanents = zone(game.battlefield)
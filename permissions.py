@@ -0,0 +1,146 @@
+"""
+Restrictions on what players and objects can do, such as targeting, attacking and blocking (see 101.2).
+
+Keyword abilities that restrict these (shroud, hexproof, protection, defender, flying and reach) are checked directly
+through the keyword masks of the objects involved. Other restrictions come from Restriction rules, which are registered
+by the kind of action they restrict and by the objects or players they apply to; a query only checks the rules
+registered for the objects it involves, and those that apply to everything.
+"""
+
+import journal
+
+TARGET = "target"
+ATTACK = "attack"
+BLOCK = "block"
+
+# rules that apply to any object are indexed under ANY
+ANY = None
+
+_rules = {TARGET: {}, ATTACK: {}, BLOCK: {}}
+_static = {}
+journal.per_game(__name__, _rules=lambda: {k: {} for k in _rules}, _static=dict)
+
+
+class Restriction:
+    """A rule that says something can't happen.
+    For TARGET, forbids is called with (ab, controller, target); for ATTACK with (attacker, defender), where defender
+    is None when checking whether the attacker can attack at all; and for BLOCK with (blocker, attacker)."""
+    kind: str = None
+    src = None
+
+    def affected(self) -> list:
+        """Returns the objects and players this rule can apply to, or None if it may apply to any"""
+        return None
+
+    def forbids(self, *args) -> bool:
+        """Returns true if this rule forbids the action"""
+        return False
+
+    def __repr__(self):
+        if self.src:
+            return f"{type(self).__name__} of {self.src}"
+        return type(self).__name__
+
+
+def _index_add(rule: Restriction, key):
+    _rules[rule.kind].setdefault(key, []).append(rule)
+
+
+def _index_remove(rule: Restriction, key):
+    idx = _rules[rule.kind]
+    idx[key].remove(rule)
+    if not idx[key]:
+        del idx[key]
+
+
+def register(rule: Restriction):
+    """Starts a restriction"""
+    aff = rule.affected()
+    rule.keys = [ANY] if aff is None else list(aff)
+    for k in rule.keys:
+        _index_add(rule, k)
+        journal.record_call((_index_remove, rule, k), (_index_add, rule, k))
+
+
+def unregister(rule: Restriction):
+    """Ends a restriction"""
+    for k in rule.keys:
+        _index_remove(rule, k)
+        journal.record_call((_index_add, rule, k), (_index_remove, rule, k))
+
+
+def add_static(ab):
+    """Starts the restrictions generated by a static ability"""
+    rules = ab.effects()
+    _static[ab] = rules
+    journal.record_call((_static.pop, ab, None), (_static.__setitem__, ab, rules))
+    for r in rules:
+        r.src = ab.src
+        register(r)
+
+
+def remove_static(ab):
+    """Ends the restrictions generated by a static ability"""
+    rules = _static.pop(ab, [])
+    if rules:
+        journal.record_call((_static.__setitem__, ab, rules), (_static.pop, ab, None))
+    for r in rules:
+        unregister(r)
+
+
+def clear():
+    """Ends all restrictions"""
+    for idx in _rules.values():
+        idx.clear()
+    _static.clear()
+
+
+def _forbidden(kind: str, keys, *args) -> bool:
+    idx = _rules[kind]
+    if not idx:
+        return False
+    seen = set()
+    for k in keys + (ANY,):
+        for r in idx.get(k, ()):
+            if id(r) not in seen:
+                seen.add(id(r))
+                if r.forbids(*args):
+                    return True
+    return False
+
+
+def _protected(ob, src) -> bool:
+    """Returns true if ob has protection from src (702.16)"""
+    if src is None or not ob.has_keyword("protection"):
+        return False
+    from abilities import ProtectionAbility
+    return any(isinstance(a, ProtectionAbility) and a.protects_from(src) for a in ob.chars.abilities)
+
+
+def can_target(ab, controller, target) -> bool:
+    """Returns true if no restriction stops ab, controlled by controller, from targeting target"""
+    if target.has_keyword("shroud"):
+        return False
+    if target.has_keyword("hexproof") and controller != target.controller:
+        return False
+    if _protected(target, ab.src):
+        return False
+    return not _forbidden(TARGET, (target, controller), ab, controller, target)
+
+
+def can_attack(atk, df=None) -> bool:
+    """Returns true if no restriction stops atk from attacking df; or from attacking at all if df is None"""
+    if atk.has_keyword("defender"):
+        return False
+    return not _forbidden(ATTACK, (atk, df), atk, df)
+
+
+def can_block(blk, atk) -> bool:
+    """Returns true if no restriction stops blk from blocking atk"""
+    # 702.9b flying, 702.17b reach
+    if atk.has_keyword("flying") and not (blk.has_keyword("flying") or blk.has_keyword("reach")):
+        return False
+    # 702.16e
+    if _protected(atk, blk):
+        return False
+    return not _forbidden(BLOCK, (blk, atk), blk, atk)
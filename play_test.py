@@ -17,4 +17,4 @@ try:
     while True:
         do_turn()
 except game.GameOver:
-    print(f"Game over; {game.winner} wins")
+    print(f"Game over ({game.end_reason}); {game.winner or 'nobody'} wins")
@@ -1,10 +1,12 @@
 
 from typing import Optional
 from abilities import ActivatedAbility
-from actions import PlayCard, ActivateAbility, Action
+from actions import PlayCard, ActivateAbility, Action, legal_actions
 from game import Player
 import game
+import layers
 import objectsets
+import permissions
 import turn
 
 
@@ -54,6 +56,12 @@ def print_board():
     print()
 
 
+def card_named(name, zone):
+    """Returns the first object in zone with the given name"""
+    return [c for c in zone if c.name == name][0]
+
+
+
 class Goldfish(Player):
     """A player that will take no actions and always make the default choices"""
 
@@ -138,6 +146,9 @@ class UserPlayer(Player):
             except (ValueError, IndexError, KeyError):
                 pass
 
+    def action_failed(self, act: Action, reason: str = None):
+        print(reason or "Illegal action")
+
     def decide_objects(self, obs: objectsets.ObjectSet, reason=None, min: int = 1, max: int = None, order_matters=False):
         if max == None:
             max = min
@@ -231,7 +242,9 @@ class UserPlayer(Player):
                 if atk not in atks or blk not in phase.legal_blockers(self):
                     print("Illegal block")
                     continue
-                # todo: check single block validity e.g. for flying
+                if not permissions.can_block(blk, atk):
+                    print("Illegal block")
+                    continue
                 if (atk, blk) in blks:
                     blks = [x for x in blks if x != (atk, blk)]
                 else:
@@ -244,21 +257,19 @@ class UserPlayer(Player):
 class PlayCards(Player):
     """A player that will always try to play any cards and activate any abilities it can during its main phase"""
 
+    def __init__(self, name: str):
+        super().__init__(name)
+        # actions that couldn't be taken, and the layers version when they failed; nothing has changed if it's the same
+        self.failed = []
+
     def decide_action(self) -> Optional[Action]:
         if not isinstance(game.turn.phase, turn.MainPhase):
             return None
 
-        for card in game.objects.values():
-            act = PlayCard(card)
-            if act.can_take_action(self, None):
-                return act
-            for ab in card.abilities:
-                if isinstance(ab, ActivatedAbility):
-                    act = ActivateAbility(ab)
-                    if act.can_take_action(self, None):
-                        return act
+        return next((a for a in legal_actions(self) if (a, layers.version) not in self.failed), None)
 
-        return None
+    def action_failed(self, act: Action, reason: str = None):
+        self.failed = [(a, v) for a, v in self.failed if v == layers.version] + [(act, layers.version)]
 
 
 class Aggressive(PlayCards):
@@ -266,3 +277,60 @@ class Aggressive(PlayCards):
 
     def decide_attacks(self):
         return list(game.turn.phase.legal_attackers(self))
+
+
+class TestPlayer(Player):
+    """
+    A player following a script of actions. Each action is None to pass priority, a (turn, step name) tuple to pass
+    until that step, "p Card" to play a card from hand, or "a Card.n" to activate a permanent's nth ability (the
+    first by default); either can end in ">Target;Target..." to choose targets by name.
+    """
+
+    def __init__(self, name: str, actions, verbose):
+        super().__init__(name)
+        self.actions = iter(actions)
+        self.wait = None
+        self.verbose = verbose
+
+    def decide_action(self):
+        if self.verbose:
+            print_board()
+        if self.wait:
+            t, st = self.wait
+            if not (t == game.turn_idx and st == game.turn.step.name):
+                return None
+            self.wait = None
+        try:
+            actd = next(self.actions)
+        except StopIteration:
+            return None
+        if actd is None:
+            return None
+        if type(actd) == tuple:
+            self.wait = actd
+            return None
+
+        _actd = actd
+        kind = actd[0]
+        actd = actd[1:].strip()
+        ab = 0
+        if '>' in actd:
+            actd, target = actd.split(">")
+            self.target = target.split(";")
+        if '.' in actd:
+            actd, ab = actd.split('.')
+            ab = int(ab.strip())
+        actd = actd.strip()
+        if kind == "p":
+            act = PlayCard(card_named(actd, self.hand))
+        elif kind == "a":
+            act = ActivateAbility(card_named(
+                actd, game.battlefield).abilities[ab])
+        if self.verbose:
+            print(actd, act)
+        assert act.can_take_action(self, None), _actd
+        return act
+
+    def decide_objects(self, obs: objectsets.ObjectSet, reason=None, min: int = 1, max: int = None, order_matters=False):
+        ts, self.target = self.target, None
+        return [card_named(t, obs) for t in ts]
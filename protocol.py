@@ -0,0 +1,174 @@
+"""
+A JSON protocol for agents outside the engine, such as bots written in other languages.
+
+Each decision a player makes (the Player.decide_ methods) is sent as an observation: a JSON object describing what
+the player can see of the game, along with the options for that decision. Objects are referred to by their ids.
+The agent replies with an answer, which is checked here; an answer that isn't a legal decision is treated as no answer,
+and the player makes the default choice.
+
+The observation has these fields for every decision:
+    kind: "action", "objects", "attacks", "blocks", "order" or "damage"
+    you: the player's id; turn: the turn number; active: the active player's id; step: the name of the step
+    players: [id, name, life, cards in hand, cards in library, [ids of cards in graveyard]] for each player
+    hand: [id, name] for each card in the player's hand
+    battlefield: [id, name, controller, tapped, power, toughness, damage] for each permanent
+    stack: [id, name, controller] for each object on the stack
+and for each kind of decision, with the answer expected:
+    action: options, a list of ["play", card] or ["activate", source, i] for the ith activated ability of source.
+        Answer the index of an option, or null to pass priority.
+    objects: choices, min, max, ordered, reason. Answer a list of ids from among choices.
+    attacks: attackers, defenders. Answer a list of attacker ids, to attack the next player,
+        or an object mapping attacker ids to defender ids.
+    blocks: attackers, as [attacker, defender] pairs; blockers. Answer a list of [attacker, blocker] pairs.
+    order: objects, as ids or, for things that aren't objects, descriptions; reason. Answer a permutation of their indices.
+    damage: orders, as [attacker, [blockers in damage assignment order]] pairs.
+        Answer a list of [source, target, amount] assignments.
+"""
+
+import json
+import game
+import turn
+from actions import PlayCard, legal_actions
+from async_engine import Agent
+from game import GameObject, Player
+from abilities import ActivatedAbility
+
+
+def encode(msg) -> bytes:
+    """Encodes a message as a line of JSON"""
+    return json.dumps(msg, separators=(",", ":")).encode() + b"\n"
+
+
+def decode(line: bytes):
+    """Decodes a line of JSON"""
+    return json.loads(line)
+
+
+def _id(x):
+    return x.id if isinstance(x, GameObject) else str(x)
+
+
+def _reason(reason):
+    if reason is None:
+        return None
+    if isinstance(reason, tuple):
+        return [_id(x) if isinstance(x, GameObject) else str(x) for x in reason]
+    return str(reason)
+
+
+def _objects(ids) -> list:
+    """Looks up objects by id, raising KeyError if any don't exist"""
+    return [game.objects[i] for i in ids]
+
+
+def state(pl: Player) -> dict:
+    """Returns what pl can see of the game"""
+    t = game.turn
+    return {
+        "you": pl.id,
+        "turn": game.turn_idx,
+        "active": t.active_player.id if t else None,
+        "step": str(t.phase.step) if t else None,
+        "players": [[p.id, p.name, p.life, len(p.hand), len(p.library), [c.id for c in p.graveyard]]
+                    for p in game.players],
+        "hand": [[c.id, c.name] for c in pl.hand],
+        "battlefield": [[o.id, o.name, o.controller.id, o.permstate.tapped, o.power, o.toughness, o.permstate.damage]
+                        for o in game.battlefield],
+        "stack": [[o.id, o.name, o.controller.id] for o in game.stack],
+    }
+
+
+def _describe_action(act) -> list:
+    if isinstance(act, PlayCard):
+        return ["play", act.card.id]
+    src = act.ab.src
+    return ["activate", src.id, [a for a in src.abilities if isinstance(a, ActivatedAbility)].index(act.ab)]
+
+
+def _options(pl: Player, kind: str, args: tuple) -> dict:
+    if kind == "action":
+        return {"options": [_describe_action(a) for a in legal_actions(pl)]}
+    if kind == "objects":
+        obs, reason, min, max, order_matters = args
+        return {"choices": [x.id for x in obs], "min": min, "max": min if max is None else max,
+                "ordered": order_matters, "reason": _reason(reason)}
+    phase = game.turn.phase
+    if kind == "attacks":
+        return {"attackers": [x.id for x in phase.legal_attackers(pl)],
+                "defenders": [x.id for x in phase.legal_attackables(pl)]}
+    if kind == "blocks":
+        atks, = args
+        return {"attackers": [[a.id, d.id] for a, d in atks.items()],
+                "blockers": [x.id for x in phase.legal_blockers(pl)]}
+    if kind == "order":
+        objects, reason = args
+        return {"objects": [_id(x) for x in objects], "reason": _reason(reason)}
+    if kind == "damage":
+        orders, = args
+        return {"orders": [[src.id, [x.id for x in ord]] for src, ord in orders.items()]}
+    raise ValueError(f"unknown decision {kind}")
+
+
+def observe(pl: Player, kind: str, args: tuple) -> dict:
+    """Returns the observation sent to an agent deciding for pl"""
+    res = {"kind": kind}
+    res.update(state(pl))
+    res.update(_options(pl, kind, args))
+    return res
+
+
+def _interpret(pl: Player, kind: str, args: tuple, answer):
+    if kind == "action":
+        if type(answer) is not int or answer < 0:
+            return None
+        return list(legal_actions(pl))[answer]
+    if kind == "objects":
+        obs, reason, min, max, order_matters = args
+        ch = _objects(answer)
+        if not (min <= len(ch) == len(set(ch)) <= (min if max is None else max) and all(x in obs for x in ch)):
+            return None
+        return ch
+    if kind == "attacks":
+        if isinstance(answer, dict):
+            return dict(zip(_objects(int(k) for k in answer), _objects(answer.values())))
+        return _objects(answer)
+    if kind == "blocks":
+        atks, = args
+        blocks = [tuple(_objects(pair)) for pair in answer]
+        phase = game.turn.phase
+        if not all(len(b) == 2 and b[0] in atks for b in blocks) or not phase.is_legal_block_set(pl, blocks):
+            return None
+        return blocks
+    if kind == "order":
+        objects, reason = args
+        if sorted(answer) != list(range(len(objects))):
+            return None
+        return [objects[i] for i in answer]
+    if kind == "damage":
+        orders, = args
+        assign = [(game.objects[src], game.objects[target], amt) for src, target, amt in answer]
+        if not all(type(amt) is int for _, _, amt in assign) or not turn.DamageStep.is_legal_assignment(assign, orders):
+            return None
+        return assign
+    raise ValueError(f"unknown decision {kind}")
+
+
+def interpret(pl: Player, kind: str, args: tuple, answer):
+    """Turns an agent's answer into pl's decision. Answers that aren't legal decisions are treated as null."""
+    if answer is None:
+        return None
+    try:
+        return _interpret(pl, kind, args, answer)
+    except (AttributeError, KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+class ProtocolAgent(Agent):
+    """An agent that sees the game as observations, and answers as described above.
+    Subclasses implement decide, which is given an observation and returns an answer."""
+
+    def observe(self, player, kind, args):
+        return observe(player, kind, args)
+
+    def interpret(self, player, kind, args, answer):
+        return interpret(player, kind, args, answer)
@@ -0,0 +1,232 @@
+"""
+Replacement and prevention effects (614, 615, 616).
+
+Events that replacement effects can modify are described by Event objects. Replacement effects are registered by the
+kind of event they replace, so an event only checks the effects that could apply to it; and if none are registered for
+its kind, the effects module doesn't build an event at all.
+
+Some replacement effects modify how a permanent enters the battlefield (614.12). Whether they apply depends on the
+permanent as it would exist on the battlefield, with its own static abilities and other continuous effects applied.
+To check these, the object is moved onto the battlefield as a trial while the move is recorded in the journal,
+and the move is rolled back once the replacement effects have been chosen. The entering object is available to
+effects as MoveEvent.entering while they are checked.
+"""
+
+import game
+import journal
+import stats
+import effects
+from game import Player
+
+MOVE = "move"
+DAMAGE = "damage"
+DRAW = "draw"
+COUNTERS = "counters"
+
+_effects = {MOVE: [], DAMAGE: [], DRAW: [], COUNTERS: []}
+_static = {}
+journal.per_game(__name__, _effects=lambda: {k: [] for k in _effects}, _static=dict)
+
+
+class Event:
+    """An event that replacement effects can modify"""
+    kind: str
+
+    def affected_player(self) -> Player:
+        """Returns the player who chooses the order replacement effects are applied in (616.1)"""
+        return None
+
+    def perform(self):
+        """Makes the event happen, without applying replacement effects"""
+        pass
+
+
+class MoveEvent(Event):
+    """An object moving from one zone to another"""
+    kind = MOVE
+
+    def __init__(self, ob, newzone):
+        self.ob = ob
+        self.newzone = newzone
+        self.as_enters = []
+        self.entering = None
+
+    def affected_player(self):
+        return self.ob.controller
+
+    def perform(self):
+        effects._move(self.ob, self.newzone, self.as_enters)
+
+    def __repr__(self):
+        return f"MoveEvent({self.ob} -> {self.newzone})"
+
+
+class DamageEvent(Event):
+    """A source dealing damage to a player or permanent"""
+    kind = DAMAGE
+
+    def __init__(self, src, target, amt: int, combat=False):
+        self.src = src
+        self.target = target
+        self.amt = amt
+        self.combat = combat
+
+    def affected_player(self):
+        return self.target if isinstance(self.target, Player) else self.target.controller
+
+    def perform(self):
+        effects._damage(self.src, self.target, self.amt, self.combat)
+
+    def __repr__(self):
+        return f"DamageEvent({self.src} -> {self.target}, {self.amt})"
+
+
+class DrawEvent(Event):
+    """A player drawing a single card"""
+    kind = DRAW
+
+    def __init__(self, pl: Player):
+        self.pl = pl
+
+    def affected_player(self):
+        return self.pl
+
+    def perform(self):
+        self.pl.draw(1)
+
+    def __repr__(self):
+        return f"DrawEvent({self.pl})"
+
+
+class CountersEvent(Event):
+    """Counters being put on an object"""
+    kind = COUNTERS
+
+    def __init__(self, ob, counter: str, amt: int):
+        self.ob = ob
+        self.counter = counter
+        self.amt = amt
+
+    def affected_player(self):
+        return self.ob.controller
+
+    def perform(self):
+        effects._put_counters(self.ob, self.counter, self.amt)
+
+    def __repr__(self):
+        return f"CountersEvent({self.ob}, {self.counter}, {self.amt})"
+
+
+class ReplacementEffect:
+    """A replacement effect (614). Prevention effects (615) are replacement effects that replace an event with nothing."""
+    kind: str = None
+    self_replacement: bool = False
+    etb: bool = False
+    src = None
+
+    def applies(self, event: Event) -> bool:
+        """Returns true if this effect applies to the event"""
+        return False
+
+    def replace(self, event: Event) -> list:
+        """Returns the events that happen instead of event. These may include event itself, modified."""
+        return [event]
+
+    def __repr__(self):
+        if self.src:
+            return f"{type(self).__name__} of {self.src}"
+        return type(self).__name__
+
+
+def register(eff: ReplacementEffect):
+    """Starts a replacement effect"""
+    _effects[eff.kind].append(eff)
+    journal.record_call((_effects[eff.kind].remove, eff), (_effects[eff.kind].append, eff))
+
+
+def unregister(eff: ReplacementEffect):
+    """Ends a replacement effect"""
+    _effects[eff.kind].remove(eff)
+    journal.record_call((_effects[eff.kind].append, eff), (_effects[eff.kind].remove, eff))
+
+
+def add_static(ab):
+    """Starts the replacement effects generated by a static ability"""
+    effs = ab.effects()
+    _static[ab] = effs
+    journal.record_call((_static.pop, ab, None), (_static.__setitem__, ab, effs))
+    for e in effs:
+        e.src = ab.src
+        register(e)
+
+
+def remove_static(ab):
+    """Ends the replacement effects generated by a static ability"""
+    effs = _static.pop(ab, [])
+    if effs:
+        journal.record_call((_static.__setitem__, ab, effs), (_static.pop, ab, None))
+    for e in effs:
+        unregister(e)
+
+
+def clear():
+    """Ends all replacement effects"""
+    for effs in _effects.values():
+        effs.clear()
+    _static.clear()
+
+
+def active(kind: str) -> bool:
+    """Returns true if any replacement effects of the given kind exist"""
+    return bool(_effects[kind])
+
+
+def _own_replacement_abilities(ob) -> bool:
+    from abilities import ReplacementAbility
+    return any(isinstance(a, ReplacementAbility) for a in ob.base_chars.abilities)
+
+
+def may_replace_move(ob, newzone) -> bool:
+    """Returns true if moving ob to newzone might be replaced"""
+    return bool(_effects[MOVE]) or (newzone == game.battlefield and _own_replacement_abilities(ob))
+
+
+def replace(event: Event) -> list:
+    """Applies replacement effects to event, returning the events that happen instead"""
+    if isinstance(event, MoveEvent) and event.newzone == game.battlefield and \
+            (any(e.etb for e in _effects[MOVE]) or _own_replacement_abilities(event.ob)):
+        with journal.trial():
+            event.entering = event.ob.direct_move(game.battlefield)
+            res = _replace(event, [])
+        for ev in res:
+            if isinstance(ev, MoveEvent):
+                ev.entering = None
+        return res
+    return _replace(event, [])
+
+
+def _replace(event: Event, applied: list) -> list:
+    # 616.1 each replacement effect is applied at most once to an event and the events replacing it
+    applicable = [e for e in _effects[event.kind]
+                  if e not in applied and e.applies(event)]
+    if not applicable:
+        return [event]
+
+    # 616.1a self-replacement effects are applied first
+    # todo: 616.1b control changing and 616.1c copy effects
+    applicable = [e for e in applicable if e.self_replacement] or applicable
+
+    chosen = applicable[0]
+    if len(applicable) > 1:
+        pl = event.affected_player()
+        ord = None
+        if pl:
+            stats.count_decision("order")
+            ord = pl.decide_order(applicable, ("replacement", event))
+        if ord:
+            chosen = ord[0]
+
+    res = []
+    for ev in chosen.replace(event):
+        res += _replace(ev, applied + [chosen])
+    return res
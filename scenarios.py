@@ -0,0 +1,207 @@
+"""
+A corpus of scenarios, for catching engine changes that break games or slow them down.
+
+A scenario is a game with given decks, some players following scripts of actions (see players.TestPlayer), played for
+a number of turns, with an expected end state and a time budget. Scenarios are stored as a JSON list of objects like
+    {"name": "cast", "turns": 5, "budget": 0.05,
+     "players": [{"name": "P0", "deck": ["Forest", "2 Memnite"], "actions": [null, "p Forest", [2, "main"], ...]},
+                 {"name": "P1", "player": "Goldfish", "deck": []}],
+     "expect": {"winner": null, "turn": 5, "life": {"P1": 16}, "power": {"Chronomaton": [3, 3]},
+                "zones": {"P0": {"battlefield": ["Forest", "Memnite"], "hand": [], "library": 1}}}}
+A scenario may also have a description. A player with actions is a TestPlayer, and any other is of the named class from players (Aggressive by default).
+A zone is expected to hold exactly the named cards, in any order, or just to hold the given number of them. The power
+and toughness are those of the first permanent with the name. The budget is the most seconds the scenario may take.
+
+The runner plays each scenario on a process pool, checks its end state, and records its wall time, taking the fastest
+of a few runs, and the memory it allocated, from a further run under tracemalloc. A scenario fails if its end state
+isn't as expected or it takes longer than its budget. Timings compete with each other for CPUs, so budgets should have
+some slack. `python scenarios.py` runs the corpus, and exits with status 1 if any scenario fails.
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+import game
+import players
+import serialize
+from actions import start_game, do_turn
+from cards import build_deck
+
+DEFAULT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios.json")
+
+
+class ScenarioError(Exception):
+    """Raised when a scenario can't be set up"""
+    pass
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    # what wasn't as expected, or the error that stopped the scenario
+    failures: list = field(default_factory=list)
+    seconds: float = 0.0
+    budget: float = None
+    # the peak memory traced while playing, and the number of blocks still allocated afterwards
+    peak_bytes: int = 0
+    blocks: int = 0
+
+    @property
+    def passed(self) -> bool:
+        return not self.failures
+
+    def __str__(self):
+        status = "ok" if self.passed else "FAIL"
+        budget = f"/{self.budget * 1000:.0f}" if self.budget is not None else ""
+        res = f"{status:4} {self.name:30} {self.seconds * 1000:8.1f}{budget}ms {self.peak_bytes / 1024:8.0f}KiB " \
+              f"{self.blocks:6} blocks"
+        return "\n".join([res] + ["     " + f for f in self.failures])
+
+
+def load(path: str = DEFAULT_FILE) -> list:
+    """Returns the scenarios in a file"""
+    with open(path) as f:
+        return json.load(f)
+
+
+def _card(name: str):
+    c = serialize.prototype(name)
+    if c is None:
+        import carddefs
+        c = carddefs.load().get(name)
+    if c is None:
+        raise ScenarioError(f"no card named {name}")
+    return c
+
+
+def parse_deck(entries: list) -> list:
+    """Returns the cards of a decklist, in which each entry is a card name optionally preceded by a count"""
+    deck = []
+    for e in entries:
+        n, _, name = e.partition(" ")
+        if n.isdigit():
+            deck += [_card(name)] * int(n)
+        else:
+            deck.append(_card(e))
+    return deck
+
+
+def play(scenario: dict, verbose: bool = False) -> list:
+    """Sets up and plays a scenario, leaving the game in its end state. Returns its players."""
+    game.clear_state()
+    pls = []
+    for d in scenario["players"]:
+        if "actions" in d:
+            pl = players.TestPlayer(d["name"], [tuple(a) if isinstance(a, list) else a for a in d["actions"]], verbose)
+        else:
+            pl = getattr(players, d.get("player", "Aggressive"))(d["name"])
+        build_deck(pl, parse_deck(d["deck"]))
+        pls.append(pl)
+    start_game()
+    try:
+        for _ in range(scenario["turns"]):
+            do_turn()
+    except game.GameOver:
+        pass
+    return pls
+
+
+def check(expect: dict, pls: list) -> list:
+    """Compares the current game, between players pls, with an expected end state,
+    returning a description of each difference"""
+    res = []
+    pls = {p.name: p for p in pls}
+    if "winner" in expect:
+        winner = game.winner.name if game.winner else None
+        if winner != expect["winner"]:
+            res.append(f"winner is {winner}, not {expect['winner']}")
+    if "turn" in expect and game.turn_idx != expect["turn"]:
+        res.append(f"turn is {game.turn_idx}, not {expect['turn']}")
+    for name, life in expect.get("life", {}).items():
+        if pls[name].life != life:
+            res.append(f"{name} has {pls[name].life} life, not {life}")
+    for name, zones in expect.get("zones", {}).items():
+        p = pls[name]
+        for zone, want in zones.items():
+            if zone == "battlefield":
+                have = [o.name for o in game.battlefield if o.controller == p]
+            else:
+                have = [o.name for o in getattr(p, zone)]
+            if isinstance(want, int) and len(have) != want:
+                res.append(f"{name}'s {zone} has {len(have)} cards, not {want}")
+            elif not isinstance(want, int) and sorted(have) != sorted(want):
+                res.append(f"{name}'s {zone} is {sorted(have)}, not {sorted(want)}")
+    for card, pt in expect.get("power", {}).items():
+        perm = next((o for o in game.battlefield if o.name == card), None)
+        if perm is None:
+            res.append(f"{card} isn't on the battlefield")
+        elif [perm.power, perm.toughness] != pt:
+            res.append(f"{card} is {perm.power}/{perm.toughness}, not {pt[0]}/{pt[1]}")
+    return res
+
+
+def run_scenario(scenario: dict, repeat: int = 3, memory: bool = True, scale: float = 1.0) -> ScenarioResult:
+    """Plays a scenario repeat times and checks how it ended. If memory is true, it's played once more to trace
+    its allocations. Its budget is multiplied by scale."""
+    res = ScenarioResult(scenario["name"])
+    if "budget" in scenario:
+        res.budget = scenario["budget"] * scale
+    try:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            pls = play(scenario)
+            times.append(time.perf_counter() - start)
+        res.seconds = min(times)
+        res.failures += check(scenario.get("expect", {}), pls)
+        if memory:
+            game.clear_state()
+            tracemalloc.start()
+            try:
+                before = tracemalloc.take_snapshot()
+                play(scenario)
+                after = tracemalloc.take_snapshot()
+                res.peak_bytes = tracemalloc.get_traced_memory()[1]
+                res.blocks = sum(s.count_diff for s in after.compare_to(before, "filename"))
+            finally:
+                tracemalloc.stop()
+    except Exception as e:
+        res.failures.append(f"{type(e).__name__}: {e}")
+    if res.budget is not None and res.seconds > res.budget:
+        res.failures.append(f"took {res.seconds * 1000:.1f}ms, over its budget of {res.budget * 1000:.1f}ms")
+    return res
+
+
+def run(scenarios: list, workers: int = None, repeat: int = 3, memory: bool = True, scale: float = 1.0) -> list:
+    """Runs scenarios on a process pool, returning their results in order"""
+    with ProcessPoolExecutor(workers or os.cpu_count()) as ex:
+        futs = [ex.submit(run_scenario, s, repeat, memory, scale) for s in scenarios]
+        return [f.result() for f in futs]
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-k", dest="pattern", default="", help="only run scenarios whose names contain this")
+    parser.add_argument("-j", "--workers", type=int)
+    parser.add_argument("--file", default=DEFAULT_FILE)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget by this")
+    parser.add_argument("--no-memory", dest="memory", action="store_false")
+    args = parser.parse_args()
+
+    scenarios = [s for s in load(args.file) if args.pattern in s["name"]]
+    results = run(scenarios, args.workers, args.repeat, args.memory, args.scale)
+    for r in results:
+        print(r)
+    failed = sum(not r.passed for r in results)
+    print(f"{len(results) - failed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,575 @@
+"""
+Serialization of the whole game state to a compact binary blob, without pickle.
+
+The state is written as a flat array of integers, along with a table of the strings it uses, and compressed.
+Cards are written as a reference to their prototype (the Characteristics they were made from, looked up by name)
+plus whichever of their characteristics differ from it. Abilities aren't written, so an object's abilities must be
+those of its prototype. Everything that refers to other objects, such as combat and targets, refers to them by id.
+Objects are recreated with the same ids, so static abilities get their effects back with the same timestamps.
+Objects are written zone by zone, so loading can put them straight into their zones, and only the few with permanent
+state, counters or choices have those written. Loading makes the objects directly rather than through their
+constructors; `python benchmark.py serialize` measures both directions.
+
+Things that can't be written faithfully raise SerializationError rather than being silently dropped:
+continuous and replacement effects that don't come from static abilities, special mana,
+and object sets or values of types that aren't known here.
+
+Loading replaces the current game state. Players are recreated from their class, keeping whichever of their own
+attributes are plain values; alternatively the player objects to use can be given.
+"""
+
+import abilities
+import importlib
+import zlib
+from array import array
+from collections import Counter
+from copy import copy
+from operator import itemgetter
+import game
+import journal
+from journal import MISSING
+import layers
+import replacement
+import permissions
+import objectsets
+from characteristics import Characteristics
+from game import GameObject, Player, Zone, PermanentState
+from abilities import AbilityOnTheStack, StaticAbility, Targets
+from layers import LayeredChars
+
+MAGIC = b"MTG\x02"
+
+NONE, FALSE, TRUE, INT, STR, OBJ, GHOST, DEAD, LIST, TUPLE, SET, DICT, ZONE, TARGETS, OBSET = range(15)
+
+OVERLAY_FIELDS = ["name", "supertypes", "types", "subtypes", "colours", "power", "toughness", "starting_loyalty"]
+_overlay_fields = itemgetter(*OVERLAY_FIELDS)
+_GLOBAL_ZONES = ["battlefield", "exile", "stack"]
+_PLAYER_ZONES = ["hand", "graveyard", "library"]
+_PLAYER_ATTRS = {"id", "dead", "new", "zone", "owner", "base_controller", "base_chars", "chars", "permstate",
+                 "spell_choices", "counters", "life", "hand", "graveyard", "library", "mana_pool", "lands_played",
+                 "next_in_turn", "prev_in_turn"}
+
+prototypes = {}
+_cards_loaded = False
+_classes = {}
+
+
+class SerializationError(Exception):
+    """Raised when part of the game state can't be serialized"""
+    pass
+
+
+def register_prototype(chars: Characteristics):
+    """Registers a card that objects can be written as a reference to. Every card defined in the cards module is registered."""
+    prototypes[chars.name] = chars
+
+
+def prototype(name: str) -> Characteristics:
+    """Returns the registered card with the given name, or None if there isn't one"""
+    global _cards_loaded
+    if not _cards_loaded:
+        import cards
+        for v in vars(cards).values():
+            if isinstance(v, Characteristics):
+                prototypes.setdefault(v.name, v)
+        _cards_loaded = True
+    return prototypes.get(name)
+
+
+def _class_path(cls) -> str:
+    return f"{cls.__module__}:{cls.__qualname__}"
+
+
+def _class(path: str):
+    if path not in _classes:
+        mod, name = path.split(":")
+        res = importlib.import_module(mod)
+        for part in name.split("."):
+            res = getattr(res, part)
+        _classes[path] = res
+    return _classes[path]
+
+
+def _zone_code(z: Zone) -> int:
+    """0 for no zone, 1-3 for the shared zones, and 4*id + i for the ith zone of the player with the given id"""
+    if z is None:
+        return 0
+    for i, name in enumerate(_GLOBAL_ZONES):
+        if z is getattr(game, name):
+            return i+1
+    for p in game.players:
+        for i, name in enumerate(_PLAYER_ZONES):
+            if z is getattr(p, name):
+                return 4*p.id + i
+    raise SerializationError(f"unknown zone {z}")
+
+
+def _same_cost(a, b) -> bool:
+    return a is b or (type(a) is type(b) and vars(a) == vars(b))
+
+
+def _same_abilities(a: list, b: list) -> bool:
+    if not a and not b:
+        return True
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        if type(x) is not type(y):
+            return False
+        vx, vy = vars(x), vars(y)
+        if len(vx) - ("src" in vx) != len(vy) - ("src" in vy):
+            return False
+        for k, v in vx.items():
+            if k != "src":
+                u = vy.get(k, MISSING)
+                if v is not u and not _same_cost(v, u) and v != u:
+                    return False
+    return True
+
+
+def _sort_key(x):
+    return (0, x.id) if isinstance(x, GameObject) else (1, repr(x))
+
+
+class _Writer:
+    def __init__(self):
+        self.ints = array("q")
+        self.strings = {}
+        self.ghosts = set()
+        self.zones = {}
+        # for the name of each set of characteristics written, its prototype, the prototype's fields,
+        # the prototype's overlay fields and the index written for it
+        self.protos = {}
+
+    def int(self, x: int):
+        self.ints.append(x)
+
+    def str(self, s: str):
+        self.ints.append(self.strings.setdefault(s, len(self.strings)))
+
+    def zone(self, z: Zone):
+        if z not in self.zones:
+            self.zones[z] = _zone_code(z)
+        self.ints.append(self.zones[z])
+
+    def chars(self, chars: Characteristics):
+        """Writes a set of characteristics as a prototype name and an overlay"""
+        d = vars(chars)
+        name = d["name"]
+        p = self.protos.get(name)
+        if p is None:
+            proto = prototype(name)
+            if proto is None:
+                proto, idx = Characteristics(), -1
+            else:
+                idx = self.strings.setdefault(name, len(self.strings))
+            p = self.protos[name] = (proto, vars(proto), _overlay_fields(vars(proto)), idx)
+        proto, pd, fields, idx = p
+        self.ints.append(idx)
+        if not _same_abilities(d["abilities"], pd["abilities"]) or not _same_cost(d["cost"], pd["cost"]):
+            raise SerializationError(f"{name} differs from its prototype in more than its characteristics")
+        if _overlay_fields(d) == fields:
+            self.ints.append(NONE)
+        else:
+            self.value({f: d[f] for f in OVERLAY_FIELDS if d[f] != pd[f]})
+
+    def ability(self, ab):
+        src = ab.src
+        idx = next((i for i, a in enumerate(src.base_chars.abilities) if a is ab), None)
+        if idx is None:
+            raise SerializationError(f"{ab} isn't an ability of its source")
+        self.value(src)
+        self.int(idx)
+
+    def value(self, v):
+        w = self.ints.append
+        t = type(v)
+        if v is None:
+            w(NONE)
+        elif v is False:
+            w(FALSE)
+        elif v is True:
+            w(TRUE)
+        elif t is int:
+            w(INT)
+            w(v)
+        elif t is str:
+            w(STR)
+            self.str(v)
+        elif isinstance(v, GameObject):
+            if v.id in game.objects:
+                w(OBJ)
+                w(v.id)
+            elif isinstance(v, AbilityOnTheStack):
+                w(NONE)
+            elif v.id in self.ghosts:
+                w(DEAD)
+                w(v.id)
+            else:
+                # an object that has left the game, kept with its last known information
+                self.ghosts.add(v.id)
+                w(GHOST)
+                w(v.id)
+                self.str(_class_path(t))
+                self.value(v.owner)
+                self.chars(v.base_chars)
+        elif t is list or t is tuple:
+            w(LIST if t is list else TUPLE)
+            w(len(v))
+            for x in v:
+                self.value(x)
+        elif t is set or t is frozenset:
+            w(SET)
+            w(len(v))
+            for x in sorted(v, key=_sort_key):
+                self.value(x)
+        elif isinstance(v, dict):
+            w(DICT)
+            w(len(v))
+            for k, x in v.items():
+                self.value(k)
+                self.value(x)
+        elif t is Zone:
+            w(ZONE)
+            self.zone(v)
+        elif t is Targets:
+            w(TARGETS)
+            w(len(v.targets))
+            for idx, (ch, options, ab, order_matters) in v.targets.items():
+                self.value(idx)
+                self.value(ch)
+                self.value(options)
+                self.ability(ab)
+                self.value(order_matters)
+        elif isinstance(v, objectsets.ObjectSet):
+            w(OBSET)
+            if t is objectsets._ZoneSet:
+                self.value(v.zone)
+                return
+            name = next((k for k, x in vars(objectsets).items() if x is v), None)
+            if name is None:
+                raise SerializationError(f"can't serialize object set {v}")
+            self.value(name)
+        else:
+            raise SerializationError(f"can't serialize {t.__name__}")
+
+    def attrs(self, ob, exclude=()):
+        self.value({k: v for k, v in vars(ob).items() if k not in exclude})
+
+    def blob(self) -> bytes:
+        strings = "\0".join(self.strings).encode()
+        ints = self.ints.tobytes()
+        return MAGIC + zlib.compress(len(ints).to_bytes(4, "little") + ints + strings, 1)
+
+
+class _Reader:
+    def __init__(self, blob: bytes):
+        if blob[:len(MAGIC)] != MAGIC:
+            raise SerializationError("not a serialized game state")
+        data = zlib.decompress(blob[len(MAGIC):])
+        n = int.from_bytes(data[:4], "little")
+        ints = array("q")
+        ints.frombytes(data[4:4+n])
+        self.strings = data[4+n:].decode().split("\0")
+        self.next = iter(ints).__next__
+        self.objs = {}
+        self.players = {}
+        # the prototypes read so far, by the index of their name
+        self.protos = {}
+
+    def str(self) -> str:
+        return self.strings[self.next()]
+
+    def zone(self) -> Zone:
+        code = self.next()
+        if code == 0:
+            return None
+        if code < 4:
+            return getattr(game, _GLOBAL_ZONES[code-1])
+        return getattr(self.players[code // 4], _PLAYER_ZONES[code % 4])
+
+    def chars(self) -> Characteristics:
+        idx = self.next()
+        proto = self.protos.get(idx)
+        if proto is None:
+            proto = self.protos[idx] = Characteristics() if idx < 0 else prototype(self.strings[idx])
+            if proto is None:
+                raise SerializationError(f"unknown card {self.strings[idx]}")
+        tag = self.next()
+        if tag == NONE:
+            # objects copy the characteristics they're made from anyway
+            return proto
+        overlay = self.value(tag)
+        chars = copy(proto)
+        for f, v in overlay.items():
+            setattr(chars, f, v)
+        chars.compute_masks()
+        return chars
+
+    def ability(self):
+        src = self.value()
+        return src.base_chars.abilities[self.next()]
+
+    def value(self, tag: int = None):
+        if tag is None:
+            tag = self.next()
+        if tag == NONE:
+            return None
+        if tag == FALSE:
+            return False
+        if tag == TRUE:
+            return True
+        if tag == INT:
+            return self.next()
+        if tag == STR:
+            return self.str()
+        if tag == OBJ or tag == DEAD:
+            return self.objs[self.next()]
+        if tag == LIST or tag == TUPLE:
+            res = [self.value() for _ in range(self.next())]
+            return res if tag == LIST else tuple(res)
+        if tag == SET:
+            return {self.value() for _ in range(self.next())}
+        if tag == DICT:
+            res = {}
+            for _ in range(self.next()):
+                k = self.value()
+                res[k] = self.value()
+            return res
+        if tag == ZONE:
+            return self.zone()
+        if tag == TARGETS:
+            res = Targets()
+            for _ in range(self.next()):
+                idx = self.value()
+                ch = self.value()
+                options = self.value()
+                ab = self.ability()
+                res.targets[idx] = (ch, options, ab, self.value())
+            return res
+        if tag == OBSET:
+            x = self.value()
+            return objectsets.zone(x) if isinstance(x, Zone) else getattr(objectsets, x)
+        if tag == GHOST:
+            id = self.next()
+            cls = _class(self.str())
+            owner = self.value()
+            chars = self.chars()
+            self.objs[id] = ob = _create(id, lambda: cls(zone=None, chars=chars, owner=owner))
+            ob.delete()
+            return ob
+        raise SerializationError(f"bad tag {tag}")
+
+
+def _create(id: int, make):
+    """Creates an object with the given id"""
+    game.next_id = id - 1
+    ob = make()
+    assert ob.id == id
+    return ob
+
+
+def _restore(cls, id: int, zone: Zone, chars: Characteristics, owner: Player, controller: Player) -> GameObject:
+    """Makes a card with the given id as GameObject.__init__ does, but without journaling or counting it.
+    It isn't added to its zone, its static abilities aren't registered, and cached characteristics aren't invalidated;
+    loads does all of these itself."""
+    ob = object.__new__(cls)
+    chars = chars.__copy__()
+    ob.__dict__.update(id=id, dead=False, new=None, zone=zone, owner=owner, base_controller=controller,
+                       base_chars=chars, chars=LayeredChars(ob), permstate=None, spell_choices=None,
+                       counters=Counter.__new__(Counter))
+    game.objects[id] = ob
+    chars.bind(ob)
+    return ob
+
+
+def _zones(pls) -> list:
+    """The zones objects other than players can be in, in the order they're serialized"""
+    return [game.battlefield, game.exile] + [getattr(p, name) for p in pls for name in _PLAYER_ZONES] + [game.stack]
+
+
+def _check_effects():
+    static = {id(e) for effs in layers._static.values() for e in effs}
+    if any(id(e) not in static for effs in layers.effects.values() for e in effs):
+        raise SerializationError("continuous effects that don't come from static abilities can't be serialized")
+    static = {id(e) for effs in replacement._static.values() for e in effs}
+    if any(id(e) not in static for effs in replacement._effects.values() for e in effs):
+        raise SerializationError("replacement effects that don't come from static abilities can't be serialized")
+    static = {id(r) for rules in permissions._static.values() for r in rules}
+    if any(id(r) not in static for idx in permissions._rules.values() for rules in idx.values() for r in rules):
+        raise SerializationError("restrictions that don't come from static abilities can't be serialized")
+
+
+def dumps() -> bytes:
+    """Serializes the current game state"""
+    _check_effects()
+    w = _Writer()
+    w.int(game.next_id)
+    w.int(game.turn_idx)
+
+    pls = list(game.players)
+    w.int(len(pls))
+    for p in pls:
+        if p.mana_pool.special:
+            raise SerializationError("special mana can't be serialized")
+        w.int(p.id)
+        w.str(_class_path(type(p)))
+        w.str(p.base_chars.name)
+        w.int(p.life)
+        w.int(p.lands_played)
+        for x in p.mana_pool.amounts:
+            w.int(x)
+        w.value({k: v for k, v in vars(p).items() if k not in _PLAYER_ATTRS and
+                 (v is None or type(v) in (bool, int, str))})
+    for p in pls:
+        w.int(p.next_in_turn.id)
+        w.int(p.prev_in_turn.id)
+
+    # the other objects, zone by zone, each in the order of its zone; the stack comes last, as abilities on it refer
+    # to their sources. Each kind of object, by class, owner and controller, is written out the first time it's seen.
+    kinds = {}
+    written = 0
+    ints = w.ints
+    for z in _zones(pls):
+        ints.append(len(z))
+        written += len(z)
+        for c in z:
+            ints.append(c.id)
+            kind = (type(c), c.owner, c.base_controller)
+            k = kinds.get(kind)
+            if k is None:
+                k = kinds[kind] = (len(kinds), isinstance(c, AbilityOnTheStack))
+                ints.append(k[0])
+                w.str(_class_path(type(c)))
+                ints.append(c.owner.id)
+                ints.append(c.base_controller.id)
+            else:
+                ints.append(k[0])
+            if k[1]:
+                w.ability(c.ab_src)
+            else:
+                w.chars(c.base_chars)
+    if written != len(game.objects) - len(pls):
+        raise SerializationError("objects outside of any zone can't be serialized")
+
+    # only the objects with permanent state, counters or choices have anything more written for them
+    pos = len(ints)
+    ints.append(0)
+    for id, o in sorted(game.objects.items()):
+        counters = {k: v for k, v in o.counters.items() if v} if o.counters else None
+        flags = bool(o.permstate) | bool(counters) << 1 | (o.spell_choices is not None) << 2
+        if not flags:
+            continue
+        ints[pos] += 1
+        ints.append(id)
+        ints.append(flags)
+        if o.permstate:
+            w.value(vars(o.permstate))
+        if counters:
+            w.value(counters)
+        if o.spell_choices is not None:
+            w.value(o.spell_choices)
+
+    w.value(game.winner)
+    w.value(game.next_turns)
+
+    t = game.turn
+    w.value(t is not None)
+    if t:
+        w.attrs(t, ["combat"])
+        w.value(t.combat is not None)
+        if t.combat:
+            w.attrs(t.combat)
+    return w.blob()
+
+
+def loads(blob: bytes, players: list = None):
+    """Replaces the current game state with a serialized one.
+    If players is given, those player objects are used, in the order they were created in the serialized game."""
+    if journal._depth:
+        raise SerializationError("can't load a game state while a checkpoint is outstanding")
+    r = _Reader(blob)
+    next_id = r.next()
+    game.clear_state()
+
+    turn_idx = r.next()
+    for i in range(r.next()):
+        pid = r.next()
+        path = r.str()
+        name = r.str()
+        p = players[i] if players else object.__new__(_class(path))
+        _create(pid, lambda: Player.__init__(p, name) or p)
+        p.life = r.next()
+        p.lands_played = r.next()
+        p.mana_pool.amounts = tuple(r.next() for _ in p.mana_pool.amounts)
+        for k, v in r.value().items():
+            if not players:
+                setattr(p, k, v)
+        r.objs[pid] = r.players[pid] = p
+    for p in r.players.values():
+        p.next_in_turn = r.players[r.next()]
+        p.prev_in_turn = r.players[r.next()]
+
+    nxt = r.next
+    objs = r.objs
+    kinds = []
+    # whether each set of characteristics read has static abilities, and the objects made with those that do
+    statics = {}
+    with_statics = []
+    for z in _zones(r.players.values()):
+        zd = z.objects
+        for _ in range(nxt()):
+            oid = nxt()
+            k = nxt()
+            if k == len(kinds):
+                cls = _class(r.str())
+                kinds.append((cls, objs[nxt()], objs[nxt()], issubclass(cls, AbilityOnTheStack)))
+            cls, owner, controller, on_stack = kinds[k]
+            if on_stack:
+                ab = r.ability()
+                objs[oid] = _create(oid, lambda: cls(ab, None, owner=owner, controller=controller))
+            else:
+                chars = r.chars()
+                objs[oid] = zd[oid] = ob = _restore(cls, oid, z, chars, owner, controller)
+                if chars.abilities:
+                    # the characteristics are kept, so their ids aren't reused
+                    st = statics.get(id(chars))
+                    if st is None:
+                        st = statics[id(chars)] = (chars, any(isinstance(a, StaticAbility) for a in chars.abilities))
+                    if st[1]:
+                        with_statics.append(ob)
+
+    # players, cards and the objects that have left the game were made in separate runs of ids
+    order = sorted(game.objects.items())
+    game.objects.clear()
+    game.objects.update(order)
+    for o in sorted(with_statics, key=lambda o: o.id):
+        for a in o.static_abilities():
+            a.register()
+
+    for _ in range(nxt()):
+        d = objs[nxt()].__dict__
+        flags = nxt()
+        if flags & 1:
+            d["permstate"] = PermanentState(**r.value())
+        if flags & 2:
+            d["counters"].update(r.value())
+        if flags & 4:
+            d["spell_choices"] = r.value()
+
+    game.winner = r.value()
+    game.next_turns = r.value()
+    game.turn_idx = turn_idx
+    game.next_id = next_id
+
+    game.turn = None
+    if r.value():
+        import turn
+        t = object.__new__(turn.Turn)
+        vars(t).update(r.value())
+        t.combat = None
+        if r.value():
+            t.combat = object.__new__(turn.Combat)
+            vars(t.combat).update(r.value())
+        game.turn = t
+    layers.invalidate()
@@ -0,0 +1,255 @@
+"""
+A local server that hosts games between agents that connect to it, over TCP on localhost or a Unix socket.
+
+Agents speak the protocol described in protocol.py, one JSON message per line. An agent connects and says hello:
+    {"type": "hello", "name": name, "deck": [card names]}
+where the deck is optional. Once two agents are waiting, the server plays a match of games between them, many at once,
+taking turns to go first. For each decision it sends
+    {"type": "decide", "id": n, "game": g, ...observation}
+and the agent replies {"id": n, "answer": answer}. Requests from different games are interleaved, and can be answered
+in any order. After each game the server sends {"type": "result", "game": g, "winner": name or null}, and when the
+match is over {"type": "done", "stats": stats}, with the number of games and decisions played and their rates.
+If an agent disconnects, its players make the default choice for the rest of the match.
+
+A stand-in client, which takes the first option it's given and attacks with everything, is included for testing.
+`python server.py bench` plays a match between two of them and reports throughput.
+"""
+
+import asyncio
+import random
+import time
+from async_engine import AsyncGame, AsyncPlayer
+from cards import build_deck
+from protocol import ProtocolAgent, encode, decode
+import serialize
+
+DEFAULT_DECK = ["Memnite"] * 7
+
+
+class ProtocolError(Exception):
+    """Raised when an agent sends something that doesn't follow the protocol"""
+    pass
+
+
+class Connection:
+    """A connected agent. Decisions from any number of games are sent over the same connection."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.name = None
+        self.deck = None
+        self.decisions = 0
+        self.closed = False
+        self._pending = {}
+        self._next_id = 0
+
+    def send(self, msg):
+        if not self.closed:
+            self.writer.write(encode(msg))
+
+    async def hello(self):
+        """Reads the agent's hello message"""
+        line = await self.reader.readline()
+        if not line:
+            raise ProtocolError("disconnected before hello")
+        msg = decode(line)
+        if msg.get("type") != "hello":
+            raise ProtocolError("expected hello")
+        self.name = str(msg.get("name", "agent"))
+        deck = [serialize.prototype(name) for name in msg.get("deck") or DEFAULT_DECK]
+        if None in deck:
+            raise ProtocolError("unknown card in deck")
+        self.deck = deck
+
+    async def listen(self):
+        """Reads answers until the agent disconnects"""
+        try:
+            while line := await self.reader.readline():
+                msg = decode(line)
+                fut = self._pending.pop(msg.get("id"), None)
+                if fut is not None and not fut.done():
+                    fut.set_result(msg.get("answer"))
+        except (ConnectionError, ValueError):
+            pass
+        self.closed = True
+        for fut in self._pending.values():
+            if not fut.done():
+                fut.set_result(None)
+        self._pending.clear()
+
+    async def request(self, msg):
+        """Sends a decision to the agent, and returns its answer"""
+        if self.closed:
+            return None
+        self._next_id += 1
+        self.decisions += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[self._next_id] = fut
+        self.send({"type": "decide", "id": self._next_id, **msg})
+        return await fut
+
+    def close(self):
+        self.closed = True
+        self.writer.close()
+
+
+class RemoteAgent(ProtocolAgent):
+    """An agent deciding for a player in one game, over a connection"""
+
+    def __init__(self, conn: Connection, game_no: int):
+        self.conn = conn
+        self.game_no = game_no
+
+    async def decide(self, player, kind, observation):
+        return await self.conn.request({"game": self.game_no, **observation})
+
+
+class Server:
+    """
+    Hosts matches of games games between pairs of connected agents, playing up to concurrency games of each match at once.
+    timeout is the number of seconds each decision may take, and games are stopped without a winner after max_turns turns.
+    """
+
+    def __init__(self, games: int = 100, concurrency: int = 50, timeout: float = None, max_turns: int = 100,
+                 seed: int = 0):
+        self.games = games
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_turns = max_turns
+        self.seed = seed
+        self.waiting = []
+        self.matches = []
+        self.stats = []
+
+    async def _handle(self, reader, writer):
+        conn = Connection(reader, writer)
+        try:
+            await conn.hello()
+        except (ProtocolError, ConnectionError, ValueError) as e:
+            conn.send({"type": "error", "message": str(e)})
+            conn.close()
+            return
+        asyncio.create_task(conn.listen())
+        self.waiting.append(conn)
+        if len(self.waiting) >= 2:
+            a, b = self.waiting[:2]
+            del self.waiting[:2]
+            self.matches.append(asyncio.create_task(self.match(a, b)))
+
+    def _setup(self, i: int, first: Connection, second: Connection):
+        def setup():
+            rng = random.Random(f"{self.seed}:{i}")
+            for conn in (first, second):
+                p = AsyncPlayer(conn.name, RemoteAgent(conn, i))
+                deck = list(conn.deck)
+                rng.shuffle(deck)
+                build_deck(p, deck)
+        return setup
+
+    async def match(self, a: Connection, b: Connection) -> dict:
+        """Plays a match between two agents, returning its stats"""
+        sem = asyncio.Semaphore(self.concurrency)
+        start = time.perf_counter()
+        wins = {a.name: 0, b.name: 0, None: 0}
+
+        async def play(i):
+            first, second = (a, b) if i % 2 == 0 else (b, a)
+            async with sem:
+                g = AsyncGame(self._setup(i, first, second), self.timeout, self.max_turns)
+                winner = await g.play()
+            name = winner.name if winner else None
+            wins[name] = wins.get(name, 0) + 1
+            for conn in (a, b):
+                conn.send({"type": "result", "game": i, "winner": name})
+
+        await asyncio.gather(*(play(i) for i in range(self.games)))
+        secs = time.perf_counter() - start
+        decisions = a.decisions + b.decisions
+        stats = {"games": self.games, "decisions": decisions, "seconds": secs,
+                 "games_per_second": self.games / secs, "decisions_per_second": decisions / secs,
+                 "wins": [[a.name, wins[a.name]], [b.name, wins[b.name]]], "draws": wins[None]}
+        for conn in (a, b):
+            conn.send({"type": "done", "stats": stats})
+            conn.close()
+        self.stats.append(stats)
+        return stats
+
+    async def serve_tcp(self, host: str = "127.0.0.1", port: int = 0):
+        """Starts listening on a TCP port on localhost, returning the asyncio server"""
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def serve_unix(self, path: str):
+        """Starts listening on a Unix socket, returning the asyncio server"""
+        return await asyncio.start_unix_server(self._handle, path)
+
+
+def stand_in_answer(obs: dict):
+    """The stand-in client's answer to a decision"""
+    if obs["kind"] == "action":
+        return 0 if obs["options"] else None
+    if obs["kind"] == "attacks":
+        return obs["attackers"]
+    return None
+
+
+async def stand_in_client(reader, writer, name: str = "stand-in", deck: list = None) -> dict:
+    """Plays as the stand-in client over a connection to a server, returning the stats of its match"""
+    writer.write(encode({"type": "hello", "name": name, "deck": deck}))
+    stats = None
+    while line := await reader.readline():
+        msg = decode(line)
+        if msg["type"] == "decide":
+            writer.write(encode({"id": msg["id"], "answer": stand_in_answer(msg)}))
+        elif msg["type"] == "done":
+            stats = msg["stats"]
+        elif msg["type"] == "error":
+            raise ProtocolError(msg["message"])
+    writer.close()
+    return stats
+
+
+async def bench(games: int = 200, concurrency: int = 50) -> dict:
+    """Plays a match between two stand-in clients over TCP, returning its stats"""
+    server = Server(games, concurrency)
+    srv = await server.serve_tcp()
+    port = srv.sockets[0].getsockname()[1]
+    clients = [stand_in_client(*await asyncio.open_connection("127.0.0.1", port), name=name)
+               for name in ("A", "B")]
+    stats = (await asyncio.gather(*clients))[0]
+    srv.close()
+    return stats
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("mode", choices=["serve", "client", "bench"])
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--unix", help="use a Unix socket at this path rather than TCP")
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--timeout", type=float)
+    parser.add_argument("--name", default="stand-in")
+    args = parser.parse_args()
+
+    async def run():
+        if args.mode == "bench":
+            stats = await bench(args.games, args.concurrency)
+        elif args.mode == "serve":
+            server = Server(args.games, args.concurrency, args.timeout)
+            srv = await (server.serve_unix(args.unix) if args.unix else server.serve_tcp(port=args.port))
+            async with srv:
+                await srv.serve_forever()
+        else:
+            conn = await (asyncio.open_unix_connection(args.unix) if args.unix
+                          else asyncio.open_connection("127.0.0.1", args.port))
+            stats = await stand_in_client(*conn, name=args.name)
+        print(f"{stats['games']} games, {stats['decisions']} decisions in {stats['seconds']:.2f}s: "
+              f"{stats['games_per_second']:.1f} games/s, {stats['decisions_per_second']:.0f} decisions/s")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Counters of the work the engine does, for spotting decks and players that make it do a pathological amount of it,
+such as hundreds of priority passes a turn.
+
+The engine counts into current as it goes: objects created, direct moves by the kinds of zone they're from and to,
+passes of state-based action checks and the actions they perform, actions taken by players, priority passes, stack
+resolutions, iterations of object sets, and decisions asked of players by decide_* hook. A count is a dictionary
+increment, so counting is always on. Each game kept in a game.GameState counts into its own current; reset it at
+the start of a game to count just that game. Stats from several workers can be added together, and written in the Prometheus text format.
+"""
+
+import os
+from collections import Counter
+import journal
+
+
+def key(metric: str, **labels) -> tuple:
+    """Returns the key of a counter: its metric's name and its labels"""
+    return (metric, tuple(sorted(labels.items())))
+
+
+OBJECTS_CREATED = key("objects_created")
+SBA_CHECKS = key("sba_checks")
+SBA_ACTIONS = key("sba_actions")
+ACTIONS = key("actions")
+PRIORITY_PASSES = key("priority_passes")
+RESOLUTIONS = key("stack_resolutions")
+OBJECTSET_ITERATIONS = key("objectset_iterations")
+
+HELP = {
+    "objects_created": "Game objects created, including by moving between zones",
+    "moves": "Objects moved directly from one kind of zone to another",
+    "sba_checks": "Passes of checking state-based actions",
+    "sba_actions": "State-based actions performed",
+    "actions": "Actions taken by players",
+    "priority_passes": "Times a player passed priority",
+    "stack_resolutions": "Objects resolved from the stack",
+    "objectset_iterations": "Iterations over object sets",
+    "decisions": "Decisions asked of players, by decide_ hook",
+    "games": "Games counted",
+}
+
+
+def _zone_kind(zone) -> str:
+    # players' zones are named after them, which would make a label per player
+    return zone.name.rsplit(" ", 1)[-1]
+
+
+class Stats:
+    """Counts of engine events, keyed by (metric, labels)"""
+
+    def __init__(self, counts=None):
+        self.counts = Counter(counts or {})
+
+    def get(self, metric: str, **labels) -> int:
+        """Returns a counter; or, with no labels, the total of the metric over all its labels"""
+        if labels:
+            return self.counts[key(metric, **labels)]
+        return sum(n for (m, _), n in self.counts.items() if m == metric)
+
+    def reset(self):
+        self.counts.clear()
+
+    def copy(self) -> "Stats":
+        return Stats(self.counts)
+
+    def __iadd__(self, other: "Stats"):
+        self.counts.update(other.counts)
+        return self
+
+    def __add__(self, other: "Stats"):
+        res = self.copy()
+        res += other
+        return res
+
+    def to_prometheus(self, prefix: str = "mtg_", **labels) -> str:
+        """Returns the counters in the Prometheus text exposition format, each with the given labels added"""
+        lines = []
+        by_metric = {}
+        for (metric, lbls), n in sorted(self.counts.items()):
+            by_metric.setdefault(metric, []).append((dict(labels, **dict(lbls)), n))
+        for metric, samples in by_metric.items():
+            name = f"{prefix}{metric}_total"
+            lines.append(f"# HELP {name} {HELP.get(metric, metric)}")
+            lines.append(f"# TYPE {name} counter")
+            for lbls, n in samples:
+                lbl = ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(lbls.items()))
+                lines.append(f"{name}{{{lbl}}} {n}" if lbl else f"{name} {n}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, prefix: str = "mtg_", **labels):
+        """Writes the counters to a file in the Prometheus text format, replacing it all at once so that a collector
+        reading it never sees half of it"""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.to_prometheus(prefix, **labels))
+        os.replace(tmp, path)
+
+    def __repr__(self):
+        return f"Stats({dict(self.counts)})"
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+current = Stats()
+journal.per_game(__name__, current=Stats)
+
+
+def count(k: tuple, n: int = 1):
+    """Adds n to a counter of the current stats"""
+    current.counts[k] += n
+
+
+def count_move(old, new):
+    count(("moves", (("from", _zone_kind(old)), ("to", _zone_kind(new)))))
+
+
+_decision_keys = {}
+
+
+def count_decision(hook: str):
+    k = _decision_keys.get(hook)
+    if k is None:
+        k = _decision_keys[hook] = key("decisions", hook=hook)
+    count(k)
+
+
+def reset():
+    """Resets the current stats"""
+    current.reset()
@@ -0,0 +1,257 @@
+"""
+Agents that are external programs, driven over their stdin and stdout, in the spirit of UCI chess engines.
+
+An engine is started once and serves any number of games. Messages are lines of JSON, using the observations and
+answers described in protocol.py. The engine is started with
+    > {"type": "hello", "protocol": 1}
+    < {"type": "ready", "name": name}
+and is then sent the decisions of all its games. Decisions are batched, as each game's thread runs the rules code on
+its own between decisions: the engines of a match hold on to their decisions until every game in flight is waiting for
+one (see InFlight), or until they've lingered for a while, and then send all they have, each as one message,
+    > {"type": "decide", "batch": [{"id": n, "game": g, ...observation}, ...]}
+and the engine streams back its answers, in any order, as they're ready, each as
+    < {"id": n, "answer": answer}
+or several at once as {"answers": [[n, answer], ...]}. It's asked to exit with {"type": "quit"}.
+
+`python subprocess_agent.py engine` runs a stand-in engine, which answers like server.py's stand-in client,
+and `python subprocess_agent.py bench` plays a match between two of them and reports throughput.
+"""
+
+import asyncio
+import sys
+import time
+from async_engine import AsyncGame, AsyncPlayer
+from cards import build_deck
+from protocol import ProtocolAgent, encode, decode
+import serialize
+
+
+class EngineError(Exception):
+    """Raised when an engine doesn't start properly"""
+    pass
+
+
+class InFlight:
+    """The games in flight on a set of engines, and how many of them are waiting for a decision.
+    Once every game is waiting, none can add to a batch until some are answered, so the engines send what they have."""
+
+    def __init__(self, engines: list):
+        self.engines = engines
+        self.games = 0
+        self.waiting = 0
+        for e in engines:
+            e.in_flight = self
+
+    def started(self):
+        self.games += 1
+
+    async def finished(self):
+        self.games -= 1
+        await self.check()
+
+    async def check(self):
+        """Sends every engine's batch if all the games are waiting"""
+        if self.waiting >= self.games:
+            for e in self.engines:
+                await e._send()
+
+
+class Engine:
+    """A running engine process. If it exits early, the decisions it hasn't answered get no answer."""
+
+    def __init__(self, args: list, linger: float = 0.05):
+        self.args = args
+        # the longest a decision waits to be sent, in case games are waiting on something other than the engines
+        self.linger = linger
+        # the games this engine decides for, if they're tracked
+        self.in_flight = None
+        self.name = None
+        self.proc = None
+        self.decisions = 0
+        self.messages = 0
+        self.closed = False
+        self._pending = {}
+        self._batch = []
+        self._timer = None
+        self._sending = None
+        self._next_id = 0
+        self._reader = None
+
+    async def start(self):
+        """Starts the engine and waits for it to be ready"""
+        self.proc = await asyncio.create_subprocess_exec(*self.args, stdin=asyncio.subprocess.PIPE,
+                                                         stdout=asyncio.subprocess.PIPE)
+        self.proc.stdin.write(encode({"type": "hello", "protocol": 1}))
+        await self.proc.stdin.drain()
+        line = await self.proc.stdout.readline()
+        msg = decode(line) if line else {}
+        if msg.get("type") != "ready":
+            raise EngineError(f"{self.args} didn't start")
+        self.name = str(msg.get("name", self.args[0]))
+        self._reader = asyncio.create_task(self._read())
+        return self
+
+    async def _read(self):
+        try:
+            while line := await self.proc.stdout.readline():
+                msg = decode(line)
+                if "answers" in msg:
+                    for id, answer in msg["answers"]:
+                        self._answer(id, answer)
+                else:
+                    self._answer(msg.get("id"), msg.get("answer"))
+        except (ConnectionError, ValueError):
+            pass
+        self.closed = True
+        for id in list(self._pending):
+            self._answer(id, None)
+
+    def _answer(self, id, answer):
+        fut = self._pending.pop(id, None)
+        if fut is not None:
+            if self.in_flight is not None:
+                self.in_flight.waiting -= 1
+            if not fut.done():
+                fut.set_result(answer)
+
+    async def _send(self):
+        """Sends the decisions waiting to be sent as one message"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._batch = self._batch, []
+        if batch and not self.closed:
+            self.messages += 1
+            self.proc.stdin.write(encode({"type": "decide", "batch": batch}))
+            try:
+                await self.proc.stdin.drain()
+            except ConnectionError:
+                pass
+
+    def _linger_over(self):
+        self._timer = None
+        self._sending = asyncio.ensure_future(self._send())
+
+    async def request(self, msg):
+        """Sends a decision to the engine, along with any others waiting, and returns its answer"""
+        if self.closed:
+            return None
+        loop = asyncio.get_running_loop()
+        if not self._batch:
+            self._timer = loop.call_later(self.linger, self._linger_over)
+        self._next_id += 1
+        self.decisions += 1
+        id = self._next_id
+        fut = loop.create_future()
+        self._pending[id] = fut
+        self._batch.append({"id": id, **msg})
+        try:
+            if self.in_flight is not None:
+                self.in_flight.waiting += 1
+                await self.in_flight.check()
+            return await fut
+        finally:
+            # a decision that timed out no longer has its game waiting
+            if id in self._pending:
+                self._answer(id, None)
+
+    async def close(self):
+        """Asks the engine to exit, and waits for it to"""
+        if not self.closed:
+            self.proc.stdin.write(encode({"type": "quit"}))
+            self.closed = True
+            try:
+                await self.proc.stdin.drain()
+            except ConnectionError:
+                pass
+        self.proc.stdin.close()
+        await self.proc.wait()
+        await self._reader
+
+
+class EngineAgent(ProtocolAgent):
+    """An agent deciding for a player in one game, by asking an engine"""
+
+    def __init__(self, engine: Engine, game_no: int):
+        self.engine = engine
+        self.game_no = game_no
+
+    async def decide(self, player, kind, observation):
+        return await self.engine.request({"game": self.game_no, **observation})
+
+
+async def play_match(a: Engine, b: Engine, decks: list, games: int = 100, concurrency: int = 50,
+                     timeout: float = None, max_turns: int = 100) -> dict:
+    """Plays a match between two started engines, with the given decks (lists of Characteristics), taking turns
+    to go first. Returns its stats, including the average number of decisions sent per message."""
+    sem = asyncio.Semaphore(concurrency)
+    in_flight = InFlight([a, b] if a is not b else [a])
+    wins = {}
+    start = time.perf_counter()
+
+    def setup(i):
+        def f():
+            seats = [(a, decks[0]), (b, decks[1])][::1 if i % 2 == 0 else -1]
+            for eng, deck in seats:
+                build_deck(AsyncPlayer(eng.name, EngineAgent(eng, i)), deck)
+        return f
+
+    async def play(i):
+        async with sem:
+            in_flight.started()
+            try:
+                winner = await AsyncGame(setup(i), timeout, max_turns).play()
+            finally:
+                await in_flight.finished()
+        name = winner.name if winner else None
+        wins[name] = wins.get(name, 0) + 1
+
+    await asyncio.gather(*(play(i) for i in range(games)))
+    secs = time.perf_counter() - start
+    decisions = a.decisions + b.decisions
+    return {"games": games, "decisions": decisions, "messages": a.messages + b.messages, "seconds": secs,
+            "games_per_second": games / secs, "decisions_per_second": decisions / secs,
+            "decisions_per_message": decisions / max(a.messages + b.messages, 1), "wins": wins}
+
+
+def run_stand_in_engine(name: str = "stand-in"):
+    """Runs the stand-in engine on stdin and stdout"""
+    from server import stand_in_answer
+    out = sys.stdout
+    for line in sys.stdin:
+        msg = decode(line)
+        if msg["type"] == "hello":
+            out.write(encode({"type": "ready", "name": name}).decode())
+        elif msg["type"] == "decide":
+            out.write(encode({"answers": [[d["id"], stand_in_answer(d)] for d in msg["batch"]]}).decode())
+        elif msg["type"] == "quit":
+            break
+        out.flush()
+
+
+async def bench(games: int = 200, concurrency: int = 50) -> dict:
+    """Plays a match between two stand-in engines, returning its stats"""
+    engines = [await Engine([sys.executable, __file__, "engine", name]).start() for name in ("A", "B")]
+    deck = [serialize.prototype("Memnite")] * 7
+    try:
+        return await play_match(*engines, [deck, deck], games, concurrency)
+    finally:
+        for e in engines:
+            await e.close()
+
+
+def main():
+    if sys.argv[1:2] == ["engine"]:
+        run_stand_in_engine(*sys.argv[2:3])
+    elif sys.argv[1:2] == ["bench"]:
+        games = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+        stats = asyncio.run(bench(games))
+        print(f"{stats['games']} games, {stats['decisions']} decisions in {stats['messages']} messages "
+              f"({stats['decisions_per_message']:.1f} per message), {stats['seconds']:.2f}s: "
+              f"{stats['games_per_second']:.1f} games/s, {stats['decisions_per_second']:.0f} decisions/s")
+    else:
+        print("usage: python subprocess_agent.py engine [name] | bench [games]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""
+Endgame tablebases for small boards of vanilla creatures, as 3 card blind games often come down to.
+
+A position is the start of a turn: the creatures of the player whose turn it is, which untap, the creatures of their
+opponent and which of those are tapped, and both life totals. Nothing else is part of a position, so a game is only in
+the tablebase when nothing else could matter: every other permanent is a land that only makes mana, and neither player
+has anything but lands in hand. Creatures may have flying, reach, vigilance, defender and haste, and nothing else.
+
+A turn is a combat. The player whose turn it is chooses attackers, their opponent chooses blocks, and the attacking
+player chooses the damage assignment order of each attacker that's blocked by several creatures. The tablebase is
+generated backwards: positions where some attack wins this turn are won, and then, repeatedly, positions where some
+attack forces positions already known to be lost for the opponent are won, and positions where every attack lets the
+opponent reach a position already known to be won for them are lost, until nothing changes. What's left are draws.
+
+Each position's result is a score from the point of view of the player whose turn it is: WIN - n for winning on the
+nth turn from now, counting both players' turns, -(WIN - n) for losing on it, and 0 for a draw. Scores are stored in an
+.npy file of int16s indexed by (board, life - 1, opponent's life - 1), with the board's metadata in a JSON file beside
+it. The table is memory-mapped when it's opened, and a board's index is found by a dictionary lookup of its canonical
+form, the sorted kinds of creature on each side, so probing takes constant time.
+"""
+
+import itertools
+import json
+from dataclasses import dataclass
+import numpy as np
+import game
+import serialize
+from abilities import KeywordAbility, SimpleManaAbility
+from characteristics import Characteristics
+from players import Aggressive
+
+WIN = 1000
+KEYWORDS = ("flying", "reach", "vigilance", "defender", "haste")
+VERSION = 1
+
+
+class TablebaseError(Exception):
+    """Raised when a tablebase can't be made from some cards, or can't be opened"""
+    pass
+
+
+@dataclass(frozen=True)
+class _Creature:
+    power: int
+    toughness: int
+    flying: bool
+    reach: bool
+    vigilance: bool
+    defender: bool
+
+    def can_block(self, atk) -> bool:
+        return not atk.flying or self.flying or self.reach
+
+
+def _creature(c: Characteristics) -> _Creature:
+    if not c.has_type("creature") or c.has_type("land") or c.toughness <= 0:
+        raise TablebaseError(f"{c.name} isn't a creature")
+    if any(type(a) is not KeywordAbility or a.name not in KEYWORDS for a in c.abilities):
+        raise TablebaseError(f"{c.name} has abilities that can't be modelled")
+    return _Creature(c.power, c.toughness, *(c.has_keyword(k) for k in ("flying", "reach", "vigilance", "defender")))
+
+
+def _flip(s):
+    """Turns the scores of positions into the scores of the positions a turn before them, for the other player"""
+    return np.sign(s) - s
+
+
+def result(score: int) -> tuple:
+    """Returns ("win", n), ("loss", n) or ("draw", None) for a score, where n is the number of turns it takes"""
+    if score > 0:
+        return ("win", WIN - score)
+    if score < 0:
+        return ("loss", WIN + score)
+    return ("draw", None)
+
+
+def _kills(power: int, toughnesses: list) -> dict:
+    """Returns each set of blockers, as a tuple of positions in toughnesses, that an attacker with power can kill,
+    mapped to a damage assignment order that kills them when damage is assigned like DamageStep.default_assignment"""
+    res = {}
+    for order in itertools.permutations(range(len(toughnesses))):
+        pow = power
+        killed = []
+        for i, b in enumerate(order):
+            if pow <= 0:
+                break
+            if (pow if i == len(order) - 1 else min(toughnesses[b], pow)) >= toughnesses[b]:
+                killed.append(b)
+            pow -= toughnesses[b]
+        res.setdefault(tuple(sorted(killed)), order)
+    return res
+
+
+def _combat(attackers: list, blockers: list, blocks: tuple):
+    """
+    Resolves a combat between _Creatures, where blocks[j] is the position in attackers of the creature blockers[j]
+    blocks, or -1. Yields (dead attackers, dead blockers, damage to the defending player, damage assignment orders)
+    for each choice of orders, with positions in attackers and blockers.
+    """
+    damage = 0
+    dead = []
+    choices = []
+    for i, atk in enumerate(attackers):
+        bs = [j for j, a in enumerate(blocks) if a == i]
+        if not bs:
+            damage += atk.power
+            continue
+        if sum(blockers[j].power for j in bs) >= atk.toughness:
+            dead.append(i)
+        kills = _kills(atk.power, [blockers[j].toughness for j in bs])
+        choices.append([(tuple(bs[k] for k in killed), (i, [bs[k] for k in order]))
+                        for killed, order in kills.items()])
+    for choice in itertools.product(*choices):
+        yield tuple(dead), tuple(sorted(j for killed, _ in choice for j in killed)), damage, dict(o for _, o in choice)
+
+
+class Tablebase:
+    """The results of every position of up to max_creatures creatures a side, of the kinds in cards, with each
+    player's life at most max_life. table is indexed by (board, life - 1, opponent's life - 1)."""
+
+    def __init__(self, cards: list, max_creatures: int, max_life: int, table=None):
+        self.cards = sorted({c.name: c for c in cards}.values(), key=lambda c: c.name)
+        self.creatures = [_creature(c) for c in self.cards]
+        self.max_creatures = max_creatures
+        self.max_life = max_life
+        self._kinds = {c.name: k for k, c in enumerate(self.cards)}
+        sides = [t for n in range(max_creatures + 1)
+                 for t in itertools.combinations_with_replacement(range(len(self.cards)), n)]
+        states = [(k, tapped) for k in range(len(self.cards)) for tapped in (False, True)]
+        tapped_sides = [t for n in range(max_creatures + 1) for t in itertools.combinations_with_replacement(states, n)]
+        self._sides = sides
+        self._tapped_sides = tapped_sides
+        self._side_idx = {t: i for i, t in enumerate(sides)}
+        self._tapped_idx = {t: i for i, t in enumerate(tapped_sides)}
+        self.boards = len(sides) * len(tapped_sides)
+        self._moves = {}
+        self.table = table
+
+    def board(self, idx: int) -> tuple:
+        """Returns the canonical form of a board: a sorted tuple of the kinds of creature of the player whose turn it
+        is, and a sorted tuple of (kind, tapped) for their opponent's"""
+        return self._sides[idx // len(self._tapped_sides)], self._tapped_sides[idx % len(self._tapped_sides)]
+
+    def board_index(self, mine: tuple, theirs: tuple):
+        """Returns the index of a board in canonical form, or None if it isn't in the tablebase"""
+        i, j = self._side_idx.get(mine), self._tapped_idx.get(theirs)
+        if i is None or j is None:
+            return None
+        return i * len(self._tapped_sides) + j
+
+    def _next(self, mine, theirs, attacking, dead_atk, dead_blk) -> int:
+        """Returns the board after a combat, from the other player's point of view. Positions are in mine and theirs."""
+        nxt_mine = tuple(sorted(k for j, (k, _) in enumerate(theirs) if j not in dead_blk))
+        nxt_theirs = tuple(sorted((k, i in attacking and not self.creatures[k].vigilance)
+                                  for i, k in enumerate(mine) if i not in dead_atk))
+        return self.board_index(nxt_mine, nxt_theirs)
+
+    def block_options(self, board: int, attacking: tuple):
+        """Yields each way the opponent can block an attack, as a tuple with the position in mine of the attacker each
+        of their creatures blocks, or -1; along with a list of (next board, damage, orders) for each choice of
+        damage assignment orders, which map positions in attacking to lists of positions in theirs."""
+        mine, theirs = self.board(board)
+        atks = [self.creatures[mine[i]] for i in attacking]
+        blks = [self.creatures[k] for k, _ in theirs]
+        choices = [[-1] + ([] if tapped else [i for i, a in enumerate(atks) if blks[j].can_block(a)])
+                   for j, (_, tapped) in enumerate(theirs)]
+        for blocks in itertools.product(*choices):
+            outs = []
+            for dead_atk, dead_blk, damage, orders in _combat(atks, blks, blocks):
+                nxt = self._next(mine, theirs, attacking, {attacking[i] for i in dead_atk}, set(dead_blk))
+                outs.append((nxt, damage, orders))
+            yield tuple(-1 if b < 0 else attacking[b] for b in blocks), outs
+
+    def moves(self, board: int) -> dict:
+        """Returns the distinct attacks on a board, as tuples of positions in mine, each mapped to the distinct sets
+        of (next board, damage) the opponent can choose between by blocking"""
+        if board not in self._moves:
+            mine, _ = self.board(board)
+            can_attack = [i for i, k in enumerate(mine) if not self.creatures[k].defender]
+            res = {}
+            seen = set()
+            for n in range(len(can_attack) + 1):
+                for attacking in itertools.combinations(can_attack, n):
+                    kinds = tuple(mine[i] for i in attacking)
+                    if kinds in seen:
+                        continue
+                    seen.add(kinds)
+                    res[attacking] = list({frozenset((nxt, d) for nxt, d, _ in outs)
+                                           for _, outs in self.block_options(board, attacking)})
+            self._moves[board] = res
+        return self._moves[board]
+
+    def _value(self, options: list, W: np.ndarray):
+        """Returns the scores, for every pair of life totals, of an attack whose blocks lead to options"""
+        L = self.max_life
+        worst = None
+        for outs in options:
+            best = None
+            for nxt, d in outs:
+                d = min(d, L)
+                v = W[nxt, :, L - d:2 * L - d]
+                best = v if best is None else np.maximum(best, v)
+            worst = best if worst is None else np.minimum(worst, best)
+        return worst
+
+    def solve(self):
+        """Fills in the table"""
+        n, L = self.boards, self.max_life
+        moves = [self.moves(b) for b in range(n)]
+        preds = [set() for _ in range(n)]
+        for b, ms in enumerate(moves):
+            for options in ms.values():
+                for outs in options:
+                    for nxt, _ in outs:
+                        preds[nxt].add(b)
+        S = np.zeros((n, L, L), np.int32)
+        # W[b, a - 1, L + b' - 1] is the score of the position before b, with lives a and b', for the player whose turn
+        # it was; to its left are the positions where the damage dealt won
+        W = np.zeros((n, L, 2 * L), np.int32)
+        W[:, :, :L] = WIN - 1
+        dirty = range(n)
+        while dirty:
+            new = {}
+            for b in dirty:
+                new[b] = np.array(np.max([self._value(opts, W) for opts in moves[b].values()], axis=0))
+            changed = [b for b, v in new.items() if not np.array_equal(v, S[b])]
+            for b in changed:
+                S[b] = new[b]
+                W[b, :, L:] = _flip(S[b].T)
+            dirty = sorted({p for b in changed for p in preds[b]})
+        self.table = S.astype(np.int16)
+
+    @classmethod
+    def generate(cls, cards: list, max_creatures: int = 2, max_life: int = 20, path: str = None):
+        """Generates the tablebase for cards, saving it to path if one is given, and returns it.
+        Raises TablebaseError if any of the cards can't be in one."""
+        tb = cls(cards, max_creatures, max_life)
+        tb.solve()
+        if path is not None:
+            out = np.lib.format.open_memmap(path, mode="w+", dtype=np.int16, shape=tb.table.shape)
+            out[:] = tb.table
+            out.flush()
+            del out
+            meta = {"version": VERSION, "cards": [c.name for c in tb.cards], "max_creatures": max_creatures,
+                    "max_life": max_life}
+            with open(path + ".json", "w") as f:
+                json.dump(meta, f)
+            return cls.open(path)
+        return tb
+
+    @classmethod
+    def open(cls, path: str):
+        """Opens a saved tablebase, memory-mapping its table"""
+        with open(path + ".json") as f:
+            meta = json.load(f)
+        if meta["version"] != VERSION:
+            raise TablebaseError(f"{path} is version {meta['version']}, not {VERSION}")
+        cards = []
+        for name in meta["cards"]:
+            c = serialize.prototype(name)
+            if c is None:
+                import carddefs
+                c = carddefs.load().get(name)
+            if c is None:
+                raise TablebaseError(f"no card named {name}")
+            cards.append(c)
+        tb = cls(cards, meta["max_creatures"], meta["max_life"], np.load(path, mmap_mode="r"))
+        if tb.table.shape != (tb.boards, tb.max_life, tb.max_life):
+            raise TablebaseError(f"{path} doesn't match its metadata")
+        return tb
+
+    def score(self, board: int, life: int, their_life: int):
+        """Returns the score of a position, or None if it isn't in the tablebase"""
+        if board is None or not (0 < life <= self.max_life and 0 < their_life <= self.max_life):
+            return None
+        return int(self.table[board, life - 1, their_life - 1])
+
+    def probe(self, mine: list, theirs: list, life: int, their_life: int):
+        """Returns the score of the position where the player whose turn it is has creatures with the names in mine,
+        and their opponent has creatures given as (name, tapped) in theirs; or None if it isn't in the tablebase"""
+        if any(n not in self._kinds for n in mine) or any(n not in self._kinds for n, _ in theirs):
+            return None
+        board = self.board_index(tuple(sorted(self._kinds[n] for n in mine)),
+                                 tuple(sorted((self._kinds[n], t) for n, t in theirs)))
+        return self.score(board, life, their_life)
+
+    def outcome_score(self, nxt: int, damage: int, life: int, their_life: int) -> int:
+        """Returns the score, for the attacking player, of a combat that leads to board nxt dealing damage"""
+        if damage >= their_life:
+            return WIN - 1
+        return int(_flip(self.table[nxt, their_life - damage - 1, life - 1]))
+
+    def _matches(self, o, k: int) -> bool:
+        c = self.cards[k]
+        return o.power == c.power and o.toughness == c.toughness and len(o.abilities) == len(c.abilities) and \
+            all(o.has_keyword(a.name) for a in c.abilities) and not o.permstate.damage and not o.counters
+
+    def game_position(self, pl: game.Player):
+        """
+        Returns the current game as a position from pl's point of view, as (board, pl's life, their opponent's life,
+        pl's creatures, their opponent's creatures), where the creatures are listed in the order of the board's
+        canonical form; or None if the game isn't in the tablebase. If pl's turn has started, pl's untapped creatures
+        must all be able to attack.
+        """
+        if len(game.players) != 2 or pl not in game.players:
+            return None
+        opp = game.next_player(pl)
+        sides = {pl: [], opp: []}
+        for o in game.battlefield:
+            if o.has_type("creature"):
+                k = self._kinds.get(o.name)
+                if k is None or o.controller not in sides or not self._matches(o, k):
+                    return None
+                if o.controller is pl and game.turn.active_player is pl and game.turn.started and \
+                        not o.permstate.tapped and not o.can_tap():
+                    return None
+                sides[o.controller].append((k, o.controller is opp and o.permstate.tapped, o))
+            elif not (o.has_type("land") and all(isinstance(a, SimpleManaAbility) for a in o.abilities)):
+                return None
+        if any(not c.has_type("land") for p in sides for c in p.hand):
+            return None
+        mine = sorted(sides[pl], key=lambda x: x[:2])
+        theirs = sorted(sides[opp], key=lambda x: x[:2])
+        board = self.board_index(tuple(k for k, _, _ in mine), tuple((k, t) for k, t, _ in theirs))
+        if self.score(board, pl.life, opp.life) is None:
+            return None
+        return board, pl.life, opp.life, [o for _, _, o in mine], [o for _, _, o in theirs]
+
+    def probe_game(self, pl: game.Player):
+        """Returns the score of the current game for pl, as if it were the start of pl's turn, or None"""
+        pos = self.game_position(pl)
+        return None if pos is None else self.score(*pos[:3])
+
+
+class TablebasePlayer(Aggressive):
+    """A player that plays perfectly by a tablebase once the game is in it, and like Aggressive otherwise"""
+    tablebase: Tablebase = None
+
+    def __init__(self, name: str, tablebase: Tablebase = None):
+        super().__init__(name)
+        if tablebase is not None:
+            self.tablebase = tablebase
+
+    def decide_attacks(self):
+        tb = self.tablebase
+        pos = tb and tb.game_position(self)
+        if pos is None:
+            return super().decide_attacks()
+        board, life, their_life, mine, _ = pos
+
+        def score(item):
+            return min(max(tb.outcome_score(nxt, d, life, their_life) for nxt, d in outs) for outs in item[1])
+        attacking, _ = max(tb.moves(board).items(), key=score)
+        return [mine[i] for i in attacking]
+
+    def decide_blocks(self, atks: dict) -> list:
+        tb = self.tablebase
+        pos = tb and tb.game_position(game.turn.active_player)
+        if pos is None:
+            return super().decide_blocks(atks)
+        board, life, their_life, attackers, blockers = pos
+        attacking = tuple(i for i, o in enumerate(attackers) if o in atks)
+        blocks, _ = min(tb.block_options(board, attacking),
+                        key=lambda x: max(tb.outcome_score(nxt, d, life, their_life) for nxt, d, _ in x[1]))
+        return [(attackers[a], blockers[j]) for j, a in enumerate(blocks) if a >= 0]
+
+    def decide_order(self, objects: list, reason=None) -> list:
+        tb = self.tablebase
+        if not (tb and isinstance(reason, tuple) and reason[0] == "combat" and game.turn.active_player is self):
+            return super().decide_order(objects, reason)
+        pos = tb.game_position(self)
+        if pos is None:
+            return super().decide_order(objects, reason)
+        board, life, their_life, attackers, blockers = pos
+        combat = game.turn.combat
+        attacking = tuple(i for i, o in enumerate(attackers) if o in combat.attackers)
+        blocked = {b: a for a, b in combat.blocks}
+        blocks = tuple(attackers.index(blocked[o]) if o in blocked else -1 for o in blockers)
+        for option, outs in tb.block_options(board, attacking):
+            if option == blocks:
+                _, _, orders = max(outs, key=lambda x: tb.outcome_score(x[0], x[1], life, their_life))
+                order = orders.get(attacking.index(attackers.index(reason[1])))
+                return None if order is None else [blockers[j] for j in order]
+        return super().decide_order(objects, reason)
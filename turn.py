@@ -4,6 +4,12 @@ from typing import Counter
 import game
 import effects
 import objectsets
+import layers
+import limits
+import journal
+import permissions
+import replacement
+import stats
 from game import Player
 
 # 117.3. Which player has priority is determined by the following rules:
@@ -29,12 +35,13 @@ from game import Player
 
 
 class Step:
-    """A step of a turn"""
+    """A step of a turn. Steps hold no state, so each step of the step table is shared by every turn."""
     name: str
 
     def __init__(self, name=None):
         self.name = name or self.__class__.name
-        self.skipped = False
+        # the step's index in STEPS
+        self.idx = None
 
     def start(self):
         """Called when this step starts"""
@@ -51,132 +58,184 @@ class Step:
 
 
 class Phase:
-    """A phase of a turn"""
+    """A phase of a turn: a run of steps in the step table. Like steps, phases hold no state."""
     name: str
 
-    def __init__(self):
-        self.steps = self.init_steps()
-        self.cur_step_idx = 0
-
-    def init_steps(self):
-        """Returns the steps in this phase"""
-        return []
+    def __init__(self, *steps):
+        self.steps = steps
+        # a bit for each of the phase's steps, by index in STEPS
+        self.mask = 0
 
     @property
     def step(self):
         """Gets the current step"""
-        return self.steps[self.cur_step_idx]
-
-    def next_step(self):
-        """Moves to the next step"""
-        self.step.end()
-        while True:
-            self.cur_step_idx += 1
-            if self.cur_step_idx >= len(self.steps):
-                return False
-            if not self.step.skipped:
-                self.step.start()
-                return True
+        return game.turn.step
 
     def skip_step(self, name):
-        """Skips each upcoming occurence of the named step"""
-        for s in self.steps:
-            if s.name == name:
-                s.skipped = True
+        """Skips each upcoming occurence of the named step in this phase"""
+        game.turn.skip_step(name, self.mask)
 
     def step_has_started(self, name):
-        """Returns true if the step with the given name has started"""
-        return any(s.name == name and not s.skipped for s in self.steps[:self.cur_step_idx+1])
+        """Returns true if the step with the given name in this phase has started"""
+        t = game.turn
+        return bool(_step_masks[name] & self.mask & ((2 << t.step_idx) - 1) & ~t.skipped)
 
     def __str__(self):
         return self.name
 
 
-class Turn:
-    """A turn. This class manages priority and turn based actions."""
+class Turn(journal.Journaled):
+    """
+    A turn. This class manages priority and turn based actions.
+    The turn's position is the index of its step in STEPS, and a bit for each step that will be skipped. Combat state
+    is only made when creatures attack.
+    """
 
     def __init__(self, active_player):
         self.active_player = active_player
         self.priority = active_player
         self.last_action = active_player
-        self.phases = [BeginningPhase(), PrecombatMainPhase(),
-                       CombatPhase(), PostcombatMainPhase(), EndPhase()]
-        self.phase_idx = 0
+        self.step_idx = 0
+        self.skipped = 0
         self.started = False
         self.finished = False
+        self.combat = None
+
+    def copy(self) -> "Turn":
+        """Returns a copy of this turn, with its own combat state"""
+        t = object.__new__(Turn)
+        vars(t).update(vars(self))
+        if self.combat:
+            object.__setattr__(t, "combat", self.combat.copy())
+        return t
+
+    @property
+    def position(self) -> int:
+        """The turn's position, packed into an int: the step index in the low bits, and the skipped steps above"""
+        return self.skipped << 8 | self.step_idx
 
     def start(self):
         """Starts the turn"""
         if not self.started:
             self.started = True
-            self.phase.step.start()
+            self.step.start()
 
-    @ property
+    @property
     def phase(self) -> Phase:
         """Gets the current phase"""
-        return self.phases[self.phase_idx]
+        return STEP_PHASES[self.step_idx]
 
-    @ property
-    def step(self):
+    @property
+    def phase_idx(self) -> int:
+        """Gets the index of the current phase in PHASES"""
+        return PHASES.index(self.phase)
+
+    @property
+    def step(self) -> Step:
         """Gets the current step"""
-        return self.phase.step
+        return STEPS[self.step_idx]
+
+    def skip_step(self, name, within=-1):
+        """Skips each upcoming occurence of the named step, within the steps whose bits are set in within"""
+        self.skipped |= _step_masks[name] & within & ~((2 << self.step_idx) - 1)
+
+    def begin_combat(self) -> "Combat":
+        """Returns the turn's combat state, making it if there isn't any yet"""
+        if self.combat is None:
+            self.combat = Combat()
+        return self.combat
 
     def give_priority(self, player):
-        """Gives priority to the given player"""
+        """Gives priority to the given player, or if they've left the game, to the next player who hasn't (800.4i)"""
         check_sbas()
-        self.priority = player
+        self.priority = game.live_player(player)
+        limits.priority_given()
 
     def next_step(self):
         """Moves to the next step of the turn"""
-        if not self.phase.next_step():
-            self.phase_idx += 1
-            if self.phase_idx >= len(self.phases):
-                self.finished = True
-                return False
-            self.phase.step.start()
-        self.last_action = self.active_player
+        layers.changed(layers.STEP)
+        self.step.end()
+        idx = self.step_idx + 1
+        while idx < len(STEPS) and self.skipped >> idx & 1:
+            idx += 1
+        self.step_idx = idx
+        if idx >= len(STEPS):
+            self.finished = True
+            return False
+        self.step.start()
+        self.last_action = game.live_player(self.active_player)
         return True
 
     def pass_priority(self):
         """Has the active player pass priority. When all players pass, the top object of the stack resolves, or the step ends."""
+        stats.count(stats.PRIORITY_PASSES)
         next = game.next_player(self.priority)
         if next == self.last_action:
             if len(game.stack):
                 top = game.stack.get_top()
+                stats.count(stats.RESOLUTIONS)
                 top.resolve()
                 assert top.dead
                 self.give_priority(self.active_player)
             else:
                 self.next_step()
-            self.last_action = self.active_player
+            self.last_action = game.live_player(self.active_player)
         else:
             self.give_priority(next)
 
     def take_action(self):
         """Marks the last action as having been taken by the player with priority"""
         player = self.priority
+        stats.count(stats.ACTIONS)
         self.last_action = player
         self.give_priority(player)
 
     def apnap_order(self):
         """Yields the plerers in turn order starting from the actie player"""
-        pl = self.active_player
+        start = pl = self.active_player
+        if start.dead:
+            # the active player has left the game; start from the player after them
+            if not game.players:
+                return
+            start = pl = game.live_player(start)
         while True:
             yield pl
             pl = game.next_player(pl)
-            if pl == self.active_player:
+            if pl == start:
                 return
 
 
+_sbas_checked_epoch = -1
+journal.per_game(__name__, _sbas_checked_epoch=lambda: -1)
+
+
 def check_sbas():
+    """Performs state-based actions (704.3) until there are none to perform.
+    Only the players and objects in game.sba_dirty are looked at, as nothing else has changed in a way that could make
+    a state-based action apply; unless the layer epoch has changed since the last check, when characteristics such as
+    toughness may have changed for every object, and everything is looked at."""
+    global _sbas_checked_epoch
+    if layers.epoch == _sbas_checked_epoch and not game.sba_dirty:
+        return
     cont = True
-    did_anything = False
+    nested = effects.simultaneously.batch is not None
     while cont:
-        cont = False
-        with effects.simultaneously:
+        stats.count(stats.SBA_CHECKS)
+        if layers.epoch != _sbas_checked_epoch:
+            pls = list(game.players)
+            obs = [ob for ob in game.objects.values() if not isinstance(ob, game.Player)]
+        else:
+            dirty = sorted(game.sba_dirty, key=lambda ob: ob.id)
+            pls = [ob for ob in dirty if isinstance(ob, game.Player) and ob in game.players]
+            obs = [ob for ob in dirty if not isinstance(ob, game.Player) and game.objects.get(ob.id) is ob]
+        game.sba_dirty.clear()
+        _sbas_checked_epoch = layers.epoch
+        # all applicable state-based actions are performed simultaneously, as a single event
+        with effects.simultaneously as batch:
+            before = batch.performed
             # 704.5. The state-based actions are as follows:
 
-            for pl in list(game.players):
+            for pl in pls:
                 # 704.5a If a player has 0 or less life, that player loses the game.
                 if pl.life <= 0:
                     effects.lose_game(pl)
@@ -192,11 +251,12 @@ def check_sbas():
             # 704.5e If a copy of a spell is in a zone other than the stack, it ceases to exist. If a copy of a card is in
             # any zone other than the stack or the battlefield, it ceases to exist.
 
-            for ob in list(game.objects):
+            for ob in obs:
                 if isinstance(ob, game.Token) and ob.zone not in [game.battlefield, game.stack]:
                     ob.delete()
 
-            for cr in objectsets.creatures:
+            perms = [ob for ob in obs if ob.zone == game.battlefield and not ob.dead]
+            for cr in [ob for ob in perms if ob.has_type("creature")]:
                 # 704.5f If a creature has toughness 0 or less, it’s put into its owner’s graveyard. Regeneration can’t
                 # replace this event.
                 if cr.toughness <= 0:
@@ -213,8 +273,8 @@ def check_sbas():
                         # Regeneration can replace this event.
                         if cr.permstate.deathtouch_damage:
                             effects.destroy(cr)
-                        cr.deathtouch_damage = False
-            for pw in objectsets.permanents.with_type("planeswalker"):
+                            effects.set_permstate(cr, layers.DAMAGE, deathtouch_damage=False)
+            for pw in [ob for ob in perms if ob.has_type("planeswalker")]:
                 if not pw.counters["loyalty"]:
                     # 704.5i If a planeswalker has loyalty 0, it’s put into its owner’s graveyard.
                     effects.move(pw, pw.owner.graveyard)
@@ -241,7 +301,7 @@ def check_sbas():
             # 704.5q If a permanent has both a +1/+1 counter and a -1/-1 counter on it, N +1/+1 and N -1/-1
             # counters are removed from it, where N is the smaller of the number of +1/+1 and -1/-1 counters
             # on it.
-            for per in objectsets.permanents:
+            for per in perms:
                 n = min(per.counters["+1/+1"], per.counters["-1/-1"])
                 if n > 0:
                     effects.remove_counters(per, "+1/+1", n)
@@ -258,16 +318,14 @@ def check_sbas():
             # card isn’t the source of a room ability that has triggered but not yet left the stack, the dungeon
             # card’s owner removes it from the game. See rule 309, “Dungeons.”
             pass  # not yet implemented
-        # todo: check whether we did anything
-        # for now we just have one pass [but we also don't have cts effects that can make multiple passes needed]
+        # 704.3 repeat until no state-based actions are performed
+        cont = not nested and batch.performed > before
+        stats.count(stats.SBA_ACTIONS, batch.performed - before)
 
 
 class BeginningPhase(Phase):
     name = "beginning"
 
-    def init_steps(self):
-        return [UntapStep(), Step("upkeep"), DrawStep()]
-
     def skip_draw(self):
         self.skip_step("draw")
 
@@ -280,8 +338,8 @@ class UntapStep(Step):
             for perm in game.battlefield:
                 if perm.controller == game.turn.active_player:
                     effects.untap(perm)
-                    perm.permstate.summoning_sick = False
-                perm.permstate.used_loyalty = False
+                    effects.set_permstate(perm, summoning_sick=False)
+                effects.set_permstate(perm, used_loyalty=False)
         for pl in game.players:
             pl.lands_played = 0
         check_sbas()
@@ -292,16 +350,13 @@ class DrawStep(Step):
     name = "draw"
 
     def start(self):
-        game.turn.active_player.draw()
+        effects.draw_cards(game.turn.active_player)
         super().start()
 
 
 class MainPhase(Phase):
     name = "main"
 
-    def init_steps(self):
-        return [Step("main")]
-
 
 class PrecombatMainPhase(MainPhase):
     name = "precombat main"
@@ -311,11 +366,10 @@ class PostcombatMainPhase(MainPhase):
     name = "postcombat main"
 
 
-class CombatPhase(Phase):
-    name = "combat"
+class Combat(journal.Journaled):
+    """The state of a turn's combat"""
 
     def __init__(self):
-        super().__init__()
         self.attackers = set()
         self.blockers = set()
         self.attacks = {}
@@ -323,40 +377,68 @@ class CombatPhase(Phase):
         self.attacks_unblocked = set()
         self.blocks = []
         self.damage_orders = {}
+        # the creatures that dealt damage in the first strike damage step, if there was one
+        self.first_strikers = None
+
+    def copy(self) -> "Combat":
+        c = object.__new__(Combat)
+        for k, v in vars(self).items():
+            object.__setattr__(c, k, v.copy() if isinstance(v, (set, dict, list)) else v)
+        return c
+
 
-    def init_steps(self):
-        return [Step("begin_combat"), AttackStep(), BlockStep(), DamageStep(), Step("end_combat")]
+# the combat state of a turn in which nothing has attacked; it's never changed
+_NO_COMBAT = Combat()
+
+
+def _combat_attr(name):
+    return property(lambda self: (game.turn.combat or _NO_COMBAT).__dict__[name])
+
+
+class CombatPhase(Phase):
+    name = "combat"
+
+    attackers = _combat_attr("attackers")
+    blockers = _combat_attr("blockers")
+    attacks = _combat_attr("attacks")
+    attacks_blocked = _combat_attr("attacks_blocked")
+    attacks_unblocked = _combat_attr("attacks_unblocked")
+    blocks = _combat_attr("blocks")
+    damage_orders = _combat_attr("damage_orders")
 
     def remove_pw_from_combat(self, pw):
-        for at, df in self.attacks:
+        for at, df in list(self.attacks.items()):
             if df == pw:
-                self.attacks[at] = None
+                journal.set_item(self.attacks, at, None)
 
     def remove_cr_from_combat(self, cr):
-        if cr in self.attacks:
-            del self.attacks[cr]
-        self.attackers -= {cr}
-        self.attacks_blocked -= {cr}
-        self.attacks_unblocked -= {cr}
-        self.blocks = [(at, bl)
-                       for at, bl in self.blocks if cr not in [at, bl]]
-        del self.damage_orders[cr]
-        for other, ord in self.damage_orders.items():
-            self.damage_orders[other] = [x for x in ord if x != cr]
+        combat = game.turn.combat
+        if combat is None:
+            return
+        journal.del_item(combat.attacks, cr)
+        journal.discard(combat.attackers, cr)
+        journal.discard(combat.blockers, cr)
+        journal.del_item(combat.attacks_blocked, cr)
+        journal.discard(combat.attacks_unblocked, cr)
+        combat.blocks = [(at, bl)
+                         for at, bl in combat.blocks if cr not in [at, bl]]
+        journal.del_item(combat.damage_orders, cr)
+        for other, ord in list(combat.damage_orders.items()):
+            journal.set_item(combat.damage_orders, other, [x for x in ord if x != cr])
 
     def remove_from_combat(self, cr_or_pw):
-        self.remove_cr_from_combat(self, cr_or_pw)
-        self.remove_pw_from_combat(self, cr_or_pw)
+        self.remove_cr_from_combat(cr_or_pw)
+        self.remove_pw_from_combat(cr_or_pw)
 
     def legal_attackers(self, you):
-        return objectsets.creatures.controlled_by(you).filter(lambda x: x.can_tap())
+        return objectsets.creatures.controlled_by(you).filter(lambda x: x.can_tap() and permissions.can_attack(x))
 
     def legal_attackables(self, you):
         return objectsets.players.other_than(you) | objectsets.permanents.not_controlled_by(you).with_type("planeswalker")
 
     def is_legal_attack_set(self, atks):
-        # todo: attacking restrictions
-        return True
+        # todo: attacking requirements
+        return all(permissions.can_attack(atk, df) for atk, df in atks.items())
 
     def enter_attacking(self, atk, df=None):
         """Has at become attacking after the attackers have been declared.
@@ -370,16 +452,17 @@ class CombatPhase(Phase):
             df = you.choose_objects(self.legal_attackables(
                 you), reason=("attacking", atk))
         assert df in self.legal_attackables(you)
-        self.attacks[atk] = df
-        self.attackers.add(atk)
+        combat = game.turn.begin_combat()
+        journal.set_item(combat.attacks, atk, df)
+        journal.add(combat.attackers, atk)
         if self.step_has_started("blocks"):
-            self.attacks_unblocked.add(atk)
+            journal.add(combat.attacks_unblocked, atk)
 
     def add_attack(self, atk, df):
-        self.attacks[atk] = df
-        self.attackers.add(atk)
-        atk.permstate.attacked_obj = df
-        atk.permstate.defending_player = df.controller
+        combat = game.turn.begin_combat()
+        journal.set_item(combat.attacks, atk, df)
+        journal.add(combat.attackers, atk)
+        effects.set_permstate(atk, attacked_obj=df, defending_player=df.controller)
 
     def legal_blockers(self, def_pl):
         return objectsets.creatures.controlled_by(def_pl).is_untapped()
@@ -393,6 +476,8 @@ class CombatPhase(Phase):
                 return False
             if blk not in self.legal_blockers(atk.permstate.defending_player):
                 return False
+            if not permissions.can_block(blk, atk):
+                return False
         c = Counter(blk for atk, blk in blocks)
         for blk, n in c.items():
             if n > 1:
@@ -401,17 +486,17 @@ class CombatPhase(Phase):
         return True
 
     def add_block(self, atk, blk):
-        self.blockers.add(blk)
-        self.blocks.append((atk, blk))
-        self.attacks_unblocked -= {atk}
+        combat = game.turn.combat
+        journal.add(combat.blockers, blk)
+        journal.append(combat.blocks, (atk, blk))
+        journal.discard(combat.attacks_unblocked, atk)
 
 
 class AttackStep(Step):
     name = "attacks"
 
     def start(self):
-        self.phase = game.turn.phase
-        phase: CombatPhase = self.phase
+        phase: CombatPhase = game.turn.phase
         you = game.turn.active_player
         # 508.1. First, the active player declares attackers. This turn-based action doesn’t use the stack. To
         # declare attackers, the active player follows the steps below, in order. If at any point during the
@@ -429,6 +514,7 @@ class AttackStep(Step):
         #     attack multiple other players, the active player announces which player or planeswalker each of
         #     the chosen creatures is attacking.
 
+        stats.count_decision("attacks")
         atks = you.decide_attacks()
         if atks == None:
             atks = {}
@@ -438,7 +524,8 @@ class AttackStep(Step):
                 datks[atk] = game.next_player(you)
             atks = datks
         atks = {at: df for (at, df) in atks.items()
-                if at in phase.legal_attackers(you) and df in phase.legal_attackables(you)}  # silently ignore bad attacks
+                if at in phase.legal_attackers(you) and df in phase.legal_attackables(you)
+                and permissions.can_attack(at, df)}  # silently ignore bad attacks
 
         #     508.1c The active player checks each creature they control to see whether it’s affected by any
         #     restrictions [...]
@@ -497,9 +584,11 @@ class AttackStep(Step):
         super().start()
 
     def end(self):
-        phase = self.phase
+        super().end()
+        phase = game.turn.phase
         if not phase.attackers:
             phase.skip_step("blocks")
+            phase.skip_step("first strike damage")
             phase.skip_step("damage")
 
 
@@ -507,9 +596,9 @@ class BlockStep(Step):
     name = "blocks"
 
     def start(self):
-        self.phase = game.turn.phase
-        phase: CombatPhase = self.phase
-        phase.attacks_unblocked = set(phase.attackers)
+        phase: CombatPhase = game.turn.phase
+        combat = game.turn.combat
+        combat.attacks_unblocked = set(combat.attackers)
         dfs = defaultdict(dict)
 
         for atk, df in phase.attacks.items():
@@ -529,6 +618,7 @@ class BlockStep(Step):
                 #     creatures must be untapped. For each of the chosen creatures, the defending player chooses one
                 #     creature for it to block that’s attacking that player or a planeswalker they control.
 
+                stats.count_decision("blocks")
                 blocks = def_pl.decide_blocks(atks)
                 if not blocks:
                     blocks = []
@@ -593,11 +683,15 @@ class BlockStep(Step):
             # first will be the active player; then the defending players in the correct order
             for cr, dmg in orders.items():
                 if cr.controller == pl:
-                    if len(dmg) <= 1 or (ord := pl.decide_order(dmg, ("combat", cr))) == None:
-                        phase.damage_orders[cr] = dmg
+                    ord = None
+                    if len(dmg) > 1:
+                        stats.count_decision("order")
+                        ord = pl.decide_order(dmg, ("combat", cr))
+                    if ord is None:
+                        journal.set_item(phase.damage_orders, cr, dmg)
                     else:
                         assert sorted(dmg, key=id) == sorted(ord, key=id)
-                        phase.damage_orders[cr] = ord
+                        journal.set_item(phase.damage_orders, cr, ord)
 
         # 509.4. Fourth, the active player gets priority. (See rule 117, “Timing and Priority.”)
 
@@ -605,56 +699,72 @@ class BlockStep(Step):
 
         super().start()
 
+    def end(self):
+        super().end()
+        # 510.4 there's a first strike damage step only if a creature in combat has first strike or double strike
+        combat = game.turn.combat
+        if not any(cr.has_keyword("first strike") or cr.has_keyword("double strike")
+                   for cr in combat.attackers | combat.blockers):
+            game.turn.phase.skip_step("first strike damage")
+
+
+# whether combats that don't need the general path are resolved directly; see DamageStep.vanilla_damage
+fast_combat = True
+
 
 class DamageStep(Step):
     name = "damage"
+    # keywords that change when combat damage is dealt, how it's assigned, or what it does
+    special_keywords = ("first strike", "double strike", "deathtouch", "trample", "lifelink", "infect", "wither")
 
-    def __init__(self, already_damaged=None):
-        super().__init__()
-        self.already_damaged = already_damaged
+    def __init__(self, first_strike=False):
+        super().__init__("first strike damage" if first_strike else None)
+        self.first_strike = first_strike
 
     def start(self):
         # todo: annotate with rules
         phase = game.turn.phase
         assert isinstance(phase, CombatPhase)
-
-        in_combat = phase.attackers | phase.blockers
-
-        if not self.already_damaged:
-            to_damage = []
-            for cr in in_combat:
-                if cr.has_keyword("first strike") or cr.has_keyword("double strike"):
-                    to_damage.append(cr)
-            if to_damage:
-                phase.steps.insert(phase.cur_step_idx+1, DamageStep(True))
-            else:
-                to_damage = list(in_combat)
+        combat = game.turn.combat
+
+        in_combat = combat.attackers | combat.blockers
+
+        if self.first_strike:
+            to_damage = [cr for cr in in_combat if cr.has_keyword("first strike") or cr.has_keyword("double strike")]
+            combat.first_strikers = set(to_damage)
+        elif combat.first_strikers is not None:
+            to_damage = [cr for cr in in_combat if cr not in combat.first_strikers or cr.has_keyword("double strike")]
+        elif fast_combat and (events := self.vanilla_damage(combat, in_combat)) is not None:
+            with effects.simultaneously as batch:
+                batch.damage += events
+            super().start()
+            return
         else:
-            to_damage = []
-            for cr in in_combat:
-                if cr not in self.already_damaged or cr.has_keyword("double strike"):
-                    to_damage.append(cr)
+            to_damage = list(in_combat)
 
         overall_assign = []
         for pl in game.turn.apnap_order():
             my_orders = {}
             for cr in to_damage:
                 if cr.controller == pl and cr.power > 0:
-                    if cr in phase.attacks_unblocked and phase.attacks[cr]:
-                        my_orders[cr] = [phase.attacks[cr]]
+                    if cr in combat.attacks_unblocked and combat.attacks[cr]:
+                        my_orders[cr] = [combat.attacks[cr]]
                     else:
-                        ord = phase.damage_orders.get(cr, [])
-                        if cr in phase.attackers and phase.attacks[cr] and cr.has_keyword("trample"):
+                        ord = combat.damage_orders.get(cr, [])
+                        if cr in combat.attackers and combat.attacks[cr] and cr.has_keyword("trample"):
                             # todo: trample over pws
                             # also is this correct for a cr pw blocking an attack to itself?
-                            ord = ord + [phase.attacks[cr]]
+                            ord = ord + [combat.attacks[cr]]
                         if ord:
                             my_orders[cr] = ord
             # todo: split assignment into independent parts
-            if self.one_possible_assignment(my_orders) or ((assign := pl.decide_damage(my_orders)) == None):
+            assign = None
+            if not self.one_possible_assignment(my_orders):
+                stats.count_decision("damage")
+                assign = pl.decide_damage(my_orders)
+            if assign is None:
                 assign = self.default_assignment(my_orders)
             assert self.is_legal_assignment(assign, my_orders)
-            print(f"{pl=}, {my_orders=}, {assign=}")
             overall_assign += assign
 
         with effects.simultaneously:
@@ -663,6 +773,34 @@ class DamageStep(Step):
 
         super().start()
 
+    def vanilla_damage(self, combat, in_combat):
+        """
+        Returns the combat damage events, as (src, target, amt, combat) tuples, if every creature in combat deals all
+        its damage to one thing and nothing changes how that damage is dealt or what it does, or else None.
+        The damage is then what the general path would assign, without asking anyone.
+        """
+        from abilities import TriggeredAbility
+        if replacement.active(replacement.DAMAGE) or replacement.active(replacement.COUNTERS):
+            return None
+        if any(isinstance(a, TriggeredAbility) for o in game.battlefield for a in o.abilities):
+            return None
+        events = []
+        for cr in in_combat:
+            if any(cr.has_keyword(k) for k in self.special_keywords):
+                return None
+            if cr in combat.attacks_unblocked and combat.attacks[cr]:
+                target = combat.attacks[cr]
+            else:
+                ord = combat.damage_orders.get(cr, [])
+                if len(ord) > 1:
+                    return None
+                if not ord:
+                    continue
+                target = ord[0]
+            if cr.power > 0 and cr.controller in game.players:
+                events.append((cr, target, cr.power, True))
+        return events
+
     @staticmethod
     def one_possible_assignment(orders):
         for src, ord in orders.items():
@@ -741,5 +879,33 @@ class DamageStep(Step):
 class EndPhase(Phase):
     name = "end"
 
-    def init_steps(self):
-        return [Step("end"), Step("cleanup")]
+
+class CleanupStep(Step):
+    name = "cleanup"
+
+    def start(self):
+        # 514.2. Second, the following actions happen simultaneously: all damage marked on permanents
+        # (including phased-out permanents) is removed and all "until end of turn" and "this turn" effects
+        # end. This turn-based action doesn’t use the stack.
+        with effects.simultaneously:
+            for perm in game.battlefield:
+                effects.set_permstate(perm, layers.DAMAGE, damage=0, deathtouch_damage=False)
+            layers.end_of_turn()
+        super().start()
+
+
+PHASES = (BeginningPhase(UntapStep(), Step("upkeep"), DrawStep()),
+          PrecombatMainPhase(Step("main")),
+          CombatPhase(Step("begin_combat"), AttackStep(), BlockStep(), DamageStep(first_strike=True), DamageStep(),
+                      Step("end_combat")),
+          PostcombatMainPhase(Step("main")),
+          EndPhase(Step("end"), CleanupStep()))
+# the steps of every turn, in order, and the phase each is in
+STEPS = tuple(st for ph in PHASES for st in ph.steps)
+STEP_PHASES = tuple(ph for ph in PHASES for st in ph.steps)
+# a bit for each step with the given name
+_step_masks = defaultdict(int)
+for _i, _st in enumerate(STEPS):
+    _st.idx = _i
+    STEP_PHASES[_i].mask |= 1 << _i
+    _step_masks[_st.name] |= 1 << _i
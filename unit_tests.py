@@ -1,63 +1,20 @@
 import game
-from objectsets import ObjectSet
 from players import *
 from cards import *
 from actions import start_game, do_turn
 
 
-def card_named(name, zone):
-    return [c for c in zone if c.name == name][0]
-
-
-class TestPlayer(Player):
-    def __init__(self, name: str, actions, verbose):
-        super().__init__(name)
-        self.actions = iter(actions)
-        self.wait = None
-        self.verbose = verbose
-
-    def decide_action(self):
-        if self.verbose:
-            print_board()
-        if self.wait:
-            t, st = self.wait
-            if not (t == game.turn_idx and st == game.turn.step.name):
-                return None
-            self.wait = None
-        try:
-            actd = next(self.actions)
-        except StopIteration:
-            return None
-        if actd is None:
-            return None
-        if type(actd) == tuple:
-            self.wait = actd
-            return None
-
-        _actd = actd
-        kind = actd[0]
-        actd = actd[1:].strip()
-        ab = 0
-        if '>' in actd:
-            actd, target = actd.split(">")
-            self.target = target.split(";")
-        if '.' in actd:
-            actd, ab = actd.split('.')
-            ab = int(ab.strip())
-        actd = actd.strip()
-        if kind == "p":
-            act = PlayCard(card_named(actd, self.hand))
-        elif kind == "a":
-            act = ActivateAbility(card_named(
-                actd, game.battlefield).abilities[ab])
-        if self.verbose:
-            print(actd, act)
-        assert act.can_take_action(self, None), _actd
-        return act
-
-    def decide_objects(self, obs: ObjectSet, reason=None, min: int = 1, max: int = None, order_matters=False):
-        ts, self.target = self.target, None
-        return [card_named(t, obs) for t in ts]
+def game_state():
+    """A summary of the game state that can be compared for equality"""
+    def ref(o):
+        return o.id if isinstance(o, game.GameObject) else o
+    obs = [(o.id, o.name, o.zone.name if o.zone else None, o.dead, dict(o.counters),
+            {k: ref(v) for k, v in vars(o.permstate).items()} if o.permstate else None) for o in game.objects.values()]
+    pls = [(p.id, p.life, str(p.mana_pool)) for p in game.players]
+    zones = [[o.id for o in z] for z in [game.battlefield, game.stack] + [z for p in game.players for z in (p.hand, p.library, p.graveyard)]]
+    combat = game.turn.combat
+    return (obs, pls, zones, game.turn_idx, game.turn.position, game.next_id,
+            sorted(o.id for o in combat.attackers) if combat else [], str(game.winner))
 
 
 def test1_cast(verbose=False):
@@ -134,3 +91,1304 @@ def test3_targets_fizzle(verbose=False):
 
 
 test3_targets_fizzle()
+
+
+def test4_goldfish(verbose=False):
+    import goldfish
+
+    kills = goldfish.kill_turns([memnite]*7, games=100)
+    assert (kills == 4).all()
+
+    # with everything in hand, a bolt each turn speeds the memnites up by a turn
+    kills = goldfish.kill_turns([memnite]*7 + [mountain, lightning_bolt]*3, games=100, hand_size=13)
+    assert (kills == 3).all()
+
+    try:
+        goldfish.compile_deck([black_lotus])
+        assert False
+    except goldfish.UnsupportedCard:
+        pass
+
+    if verbose:
+        print(goldfish.kill_turn_distribution([mountain]*8 + [lightning_bolt]*12, games=1000))
+
+
+test4_goldfish()
+
+
+def test5_layers(verbose=False):
+    import layers
+    from abilities import ContinuousAbility
+    game.clear_state()
+
+    p0 = Goldfish("Test5")
+    p1 = Goldfish("Goldfish5")
+
+    class SetPT(layers.ContinuousEffect):
+        layer = layers.PT_SET
+
+        def applies_to(self, obj, chars):
+            return obj.zone == game.battlefield and "creature" in chars.types
+
+        def apply(self, obj, chars):
+            chars.power, chars.toughness = 0, 1
+
+    class Anthem(layers.ContinuousEffect):
+        layer = layers.PT_MODIFY
+        applied = 0
+
+        def applies_to(self, obj, chars):
+            return obj.zone == game.battlefield and "creature" in chars.types and chars.controller == self.src.controller
+
+        def apply(self, obj, chars):
+            Anthem.applied += 1
+            chars.power += 1
+            chars.toughness += 1
+
+    class AnthemAbility(ContinuousAbility):
+        def effects(self):
+            return [Anthem()]
+
+    bears = Card(zone=game.battlefield, chars=grizzly_bears, owner=p0)
+    anthem = Card(zone=game.battlefield, chars=Characteristics(
+        name="Anthem", types="enchantment", abilities=[AnthemAbility()]), owner=p0)
+    layers.add_effect(SetPT())
+
+    # the newer set effect still applies before the anthem
+    assert (bears.power, bears.toughness) == (1, 2)
+    for _ in range(10):
+        bears.power
+    assert Anthem.applied == 1
+
+    put_counters(bears, "+1/+1", 2)
+    assert (bears.power, bears.toughness) == (3, 4)
+
+    anthem.move_to(p0.graveyard)
+    assert (bears.power, bears.toughness) == (2, 3)
+
+    # a change to one object only invalidates its own characteristics, unless an effect reads that kind of change
+    import effects
+    other = Card(zone=game.battlefield, chars=grizzly_bears, owner=p1)
+    epoch = layers.epoch
+    effects.tap(bears)
+    put_counters(bears, "+1/+1", 1)
+    assert layers.epoch == epoch and (bears.power, bears.toughness) == (3, 4)
+
+    class PerTapped(layers.ContinuousEffect):
+        reads = frozenset([layers.TAPPED])
+
+        def applies_to(self, obj, chars):
+            return obj.zone == game.battlefield and "creature" in chars.types
+
+        def apply(self, obj, chars):
+            chars.power += sum(1 for o in game.battlefield if o.permstate.tapped)
+
+    layers.add_effect(PerTapped())
+    assert (bears.power, other.power) == (4, 1)
+    effects.tap(other)
+    assert (bears.power, other.power) == (5, 2)
+
+    # removing damage in the cleanup step is a change too
+    import turn
+
+    class Enraged(layers.ContinuousEffect):
+        def applies_to(self, obj, chars):
+            return obj.zone == game.battlefield and obj.permstate.damage
+
+        def apply(self, obj, chars):
+            chars.power += 1
+
+    layers.add_effect(Enraged())
+    damage(bears, other, 1)
+    assert other.power == 3
+    game.turn = turn.Turn(p0)
+    turn.CleanupStep().start()
+    assert other.permstate.damage == 0 and other.power == 2
+
+    class Toy(layers.ContinuousEffect):
+        def __init__(self, name, ts, deps=()):
+            self.name, self.timestamp, self.deps = name, ts, deps
+
+        def depends_on(self, other):
+            return other.name in self.deps
+
+        def __repr__(self):
+            return self.name
+
+    a, b, c = Toy("a", 1, "b"), Toy("b", 2, "a"), Toy("c", 0, "a")
+    order = {interp: "".join(map(repr, layers.order_effects([a, b, c], interp)))
+             for interp in [layers.INITIAL, layers.LOOPS, layers.FIXED_LOOPS]}
+    assert order == {layers.INITIAL: "cab",
+                     layers.LOOPS: "acb", layers.FIXED_LOOPS: "abc"}, order
+
+    if verbose:
+        print_board()
+
+
+test5_layers()
+
+
+def test6_replacement(verbose=False):
+    import replacement
+    from abilities import ReplacementAbility
+    game.clear_state()
+
+    p0 = Goldfish("Test6")
+    p1 = Goldfish("Goldfish6")
+
+    class CreaturesEnterTapped(replacement.ReplacementEffect):
+        kind = replacement.MOVE
+        etb = True
+
+        def applies(self, ev):
+            return ev.entering is not None and ev.entering.has_type("creature")
+
+        def replace(self, ev):
+            ev.as_enters.append(lambda new: tap(new))
+            return [ev]
+
+    class EntersTapped(replacement.ReplacementEffect):
+        kind = replacement.MOVE
+        self_replacement = True
+
+        def applies(self, ev):
+            return ev.entering is not None and ev.entering.name == self.src.name
+
+        def replace(self, ev):
+            ev.as_enters.append(lambda new: tap(new))
+            return [ev]
+
+    class EntersTappedAbility(ReplacementAbility):
+        def effects(self):
+            return [EntersTapped()]
+
+    class PreventDamageTo(replacement.ReplacementEffect):
+        kind = replacement.DAMAGE
+
+        def __init__(self, pl):
+            self.pl = pl
+
+        def applies(self, ev):
+            return ev.target == self.pl
+
+        def replace(self, ev):
+            return []
+
+    tapland = Characteristics(name="Tapland", types="land", abilities=[
+                              SimpleManaAbility("U"), EntersTappedAbility()])
+    bears = Card(zone=p0.hand, chars=grizzly_bears, owner=p0)
+    land = Card(zone=p0.hand, chars=forest, owner=p0)
+    tland = Card(zone=p0.hand, chars=tapland, owner=p0)
+
+    replacement.register(CreaturesEnterTapped())
+    next_id = game.next_id
+    bears = bears.move_to(game.battlefield)
+    assert bears.id == next_id + 1
+    assert list(p0.hand) == [land, tland] and len(game.battlefield) == 1
+    land = land.move_to(game.battlefield)
+    tland = tland.move_to(game.battlefield)
+    assert bears.permstate.tapped and not land.permstate.tapped and tland.permstate.tapped
+
+    replacement.register(PreventDamageTo(p1))
+    damage(bears, p1, 2)
+    damage(bears, p0, 2)
+    assert (p0.life, p1.life) == (18, 20)
+
+    if verbose:
+        print_board()
+
+
+test6_replacement()
+
+
+def test7_journal(verbose=False):
+    import journal
+    game.clear_state()
+
+    p0 = Aggressive("Test7")
+    p1 = Aggressive("Aggressive7")
+    build_deck(p0, [mountain, memnite, lightning_bolt]*10)
+    build_deck(p1, [forest, grizzly_bears]*15)
+    start_game()
+
+    def play(n):
+        try:
+            for _ in range(n):
+                do_turn()
+        except game.GameOver:
+            pass
+
+    play(2)
+    before = game_state()
+    cp = journal.checkpoint()
+    play(3)
+    after = game_state()
+    assert game.winner is None
+    assert after != before
+
+    r = journal.rollback(cp)
+    assert game_state() == before
+    journal.redo(r)
+    assert game_state() == after
+
+    # rolling back and playing the same line again gives the same result
+    cp = journal.checkpoint()
+    play(1)
+    again = game_state()
+    journal.rollback(cp)
+    assert game_state() == after
+    play(1)
+    assert game_state() == again
+
+    # rolling back a move takes no longer on a bigger board, and leaves the zones in order
+    import time
+
+    def rollback_time(n):
+        game.clear_state()
+        p = Goldfish("Test7b")
+        obs = [Card(zone=game.battlefield, chars=memnite, owner=p) for _ in range(n)]
+        best = float("inf")
+        for _ in range(20):
+            cp = journal.checkpoint()
+            obs[0].move_to(p.graveyard)
+            t = time.perf_counter()
+            journal.rollback(cp)
+            best = min(best, time.perf_counter() - t)
+            assert list(game.battlefield) == obs and list(game.objects.values()) == [p] + obs
+        return best
+
+    assert rollback_time(5000) < 5 * rollback_time(50)
+
+    if verbose:
+        print_board()
+
+
+test7_journal()
+
+
+def test8_serialize(verbose=False):
+    import serialize
+    game.clear_state()
+
+    class Snapshot(Aggressive):
+        """Takes a snapshot when it has priority during the first declare blockers step with attackers"""
+        blob = None
+
+        def decide_action(self):
+            if Snapshot.blob is None and game.turn.step.name == "blocks" and game.turn.phase.attackers:
+                Snapshot.blob = serialize.dumps()
+                Snapshot.state = game_state()
+            return super().decide_action()
+
+    p0 = Snapshot("Test8")
+    p1 = Aggressive("Aggressive8")
+    build_deck(p0, [mountain, memnite, lightning_bolt]*10)
+    build_deck(p1, [forest, grizzly_bears]*15)
+    start_game()
+
+    def play_out():
+        try:
+            while True:
+                do_turn()
+        except game.GameOver:
+            pass
+        return game_state()
+
+    end = play_out()
+    blob = Snapshot.blob
+    assert blob
+
+    # resuming from the middle of combat gives the same result
+    serialize.loads(blob, [p0, p1])
+    assert game_state() == Snapshot.state
+    assert serialize.dumps() == blob
+    assert play_out() == end
+
+    # players are recreated from their class when not given
+    game.clear_state()
+    Goldfish("Goldfish8", verbose=verbose)
+    Aggressive("Aggressive8")
+    start_game()
+    do_turn()
+    blob = serialize.dumps()
+    serialize.loads(blob)
+    assert [type(p) for p in game.players] == [Goldfish, Aggressive]
+    assert game.players[0].verbose == verbose
+    assert serialize.dumps() == blob
+
+    if verbose:
+        print(len(blob), "bytes")
+        print_board()
+
+
+test8_serialize()
+
+
+def test9_masks(verbose=False):
+    import layers
+    import objectsets
+    from abilities import KeywordAbility
+    game.clear_state()
+
+    p0 = Goldfish("Test9")
+
+    golem = Characteristics(name="Golem", types="Artifact Creature", subtypes="Golem",
+                            abilities=[KeywordAbility("vigilance")])
+    assert golem.has_type("CREATURE") and golem.has_type("artifact") and not golem.has_type("land")
+    assert golem.has_subtype("golem") and golem.has_keyword("Vigilance") and not golem.has_keyword("flying")
+
+    class GrantFlying(layers.ContinuousEffect):
+        layer = layers.ABILITY
+
+        def applies_to(self, obj, chars):
+            return obj.zone == game.battlefield and chars.has_subtype("golem")
+
+        def apply(self, obj, chars):
+            chars.abilities.append(KeywordAbility("flying"))
+
+    class FliersGetBigger(layers.ContinuousEffect):
+        layer = layers.PT_MODIFY
+
+        def applies_to(self, obj, chars):
+            # the masks of chars aren't computed yet, so this checks the abilities granted so far
+            return chars.has_keyword("flying")
+
+        def apply(self, obj, chars):
+            chars.power += 1
+
+    g = Card(zone=game.battlefield, chars=golem, owner=p0)
+    bears = Card(zone=game.battlefield, chars=grizzly_bears, owner=p0)
+    fliers = objectsets.creatures.with_keyword("flying")
+    assert list(fliers) == [] and list(objectsets.creatures.without_keyword("flying")) == [g, bears]
+
+    layers.add_effect(GrantFlying())
+    layers.add_effect(FliersGetBigger())
+    assert list(fliers) == [g] and g.has_keyword("FLYING") and g.power == 1 and bears.power == 2
+    assert list(objectsets.permanents.with_subtype("bear")) == [bears]
+    assert list(objectsets.permanents.without_type("artifact")) == [bears]
+
+    # another process numbers the bits in its own order, so the masks are computed again when unpickled there
+    import os
+    import pickle
+    import subprocess
+    import sys
+    check = ("import pickle, sys, util; util.bit('zombie'); import players; c = pickle.load(sys.stdin.buffer); "
+             "print(c.has_type('creature'), c.has_subtype('golem'), c.has_keyword('vigilance'))")
+    out = subprocess.run([sys.executable, "-c", check], input=pickle.dumps(golem), capture_output=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    assert out.split() == [b"True"] * 3, out
+
+    if verbose:
+        print_board()
+
+
+test9_masks()
+
+
+def test10_permissions(verbose=False):
+    import permissions
+    from abilities import can_target, KeywordAbility, ProtectionAbility, RestrictionAbility
+    game.clear_state()
+
+    p0 = Goldfish("Test10")
+    p1 = Goldfish("Goldfish10")
+
+    class CantBlock(permissions.Restriction):
+        kind = permissions.BLOCK
+        checked = 0
+
+        def affected(self):
+            return [self.src]
+
+        def forbids(self, blk, atk):
+            CantBlock.checked += 1
+            return True
+
+    class CantBlockAbility(RestrictionAbility):
+        def effects(self):
+            return [CantBlock()]
+
+    class CantAttackYou(permissions.Restriction):
+        kind = permissions.ATTACK
+
+        def forbids(self, atk, df):
+            return df == self.src.controller
+
+    class CantAttackYouAbility(RestrictionAbility):
+        def effects(self):
+            return [CantAttackYou()]
+
+    def bear(name, *abs, owner=p0):
+        return Card(zone=game.battlefield, chars=Characteristics(
+            name=name, types="creature", cost="1G", power=2, toughness=2, abilities=list(abs)), owner=owner)
+
+    bolt = Card(zone=p0.hand, chars=lightning_bolt, owner=p0).abilities[0]
+    hexproof = bear("Hexproof", KeywordAbility("hexproof"), owner=p1)
+    pro_red = bear("Pro Red", ProtectionAbility("R"), owner=p1)
+    pro_green = bear("Pro Green", ProtectionAbility("G"))
+    flier = bear("Flier", KeywordAbility("flying"))
+    wall = bear("Wall", KeywordAbility("defender"), KeywordAbility("reach"), CantBlockAbility(), owner=p1)
+    plain = bear("Plain", owner=p1)
+
+    assert not can_target(bolt, p0, hexproof) and can_target(bolt, p1, hexproof)
+    assert not can_target(bolt, p0, pro_red) and can_target(bolt, p0, plain)
+    assert not permissions.can_block(plain, pro_green) and not permissions.can_block(plain, flier)
+    assert permissions.can_block(plain, hexproof)
+    assert not permissions.can_attack(wall) and permissions.can_attack(plain)
+
+    # the wall's restriction is only checked for the wall
+    assert not permissions.can_block(wall, flier) and CantBlock.checked == 1
+    permissions.can_block(pro_red, hexproof)
+    assert CantBlock.checked == 1
+
+    propaganda = Card(zone=game.battlefield, chars=Characteristics(
+        name="Propaganda", types="enchantment", abilities=[CantAttackYouAbility()]), owner=p1)
+    assert not permissions.can_attack(flier, p1) and permissions.can_attack(plain, p0)
+    propaganda.move_to(p1.graveyard)
+    assert permissions.can_attack(flier, p1)
+
+    if verbose:
+        print_board()
+
+
+test10_permissions()
+
+
+def test11_simultaneous(verbose=False):
+    import effects
+    import layers
+    import turn
+    from abilities import ContinuousAbility, KeywordAbility
+    game.clear_state()
+
+    p0 = Goldfish("Test11")
+    p1 = Goldfish("Goldfish11")
+
+    class Anthem(layers.ContinuousEffect):
+        layer = layers.PT_MODIFY
+
+        def applies_to(self, obj, chars):
+            return obj.zone == game.battlefield and obj != self.src and "creature" in chars.types
+
+        def apply(self, obj, chars):
+            chars.power += 1
+            chars.toughness += 1
+
+    class AnthemAbility(ContinuousAbility):
+        def effects(self):
+            return [Anthem()]
+
+    lord = Card(zone=game.battlefield, chars=Characteristics(name="Lord", types="creature", power=2, toughness=2,
+                                                            abilities=[AnthemAbility(), KeywordAbility("lifelink")]), owner=p0)
+    bears = Card(zone=game.battlefield, chars=grizzly_bears, owner=p0)
+
+    # lifelink from one source is a single life gain
+    gains = []
+    gain_life = effects.gain_life
+    effects.gain_life = lambda pl, amt: gains.append((pl, amt)) or gain_life(pl, amt)
+    try:
+        with effects.simultaneously:
+            damage(lord, p1, 1)
+            damage(lord, p1, 1)
+            damage(bears, bears, 2)
+            damage(lord, lord, 2)
+            assert bears.permstate.damage == 0 and p1.life == 20
+    finally:
+        effects.gain_life = gain_life
+    assert gains == [(p0, 4)] and (p0.life, p1.life) == (24, 18)
+    assert bears.permstate.damage == 2 and bears.toughness == 3
+
+    # the lord dies first, and then the bears have lethal damage
+    turn.check_sbas()
+    assert list(game.battlefield) == [] and len(p0.graveyard) == 2
+
+    # moves in a batch happen when it ends
+    bears = Card(zone=game.battlefield, chars=grizzly_bears, owner=p0)
+    with effects.simultaneously:
+        effects.destroy(bears)
+        assert bears.zone == game.battlefield
+    assert bears.dead and len(p0.graveyard) == 3
+
+    # what a batch changes is left for state-based actions to look at, and only that is looked at
+    bears = Card(zone=game.battlefield, chars=grizzly_bears, owner=p0)
+    turn.check_sbas()
+    assert not game.sba_dirty
+    with effects.simultaneously:
+        damage(bears, bears, 2)
+        assert not game.sba_dirty
+    assert game.sba_dirty == {bears}
+    turn.check_sbas()
+    assert bears.dead and not game.sba_dirty
+
+    # a change to an object's own state is looked at too, as effects can make it matter to its characteristics
+    class Shrink(layers.ContinuousEffect):
+        def applies_to(self, obj, chars):
+            return obj.zone == game.battlefield and obj.permstate.tapped
+
+        def apply(self, obj, chars):
+            chars.toughness -= 5
+
+    layers.add_effect(Shrink())
+    bears = Card(zone=game.battlefield, chars=grizzly_bears, owner=p0)
+    turn.check_sbas()
+    effects.tap(bears)
+    assert game.sba_dirty == {bears} and bears.toughness == -3
+    turn.check_sbas()
+    assert bears.dead
+    layers.clear()
+
+    # if all players lose at once, the game is a draw
+    p0.life = p1.life = 0
+    try:
+        turn.check_sbas()
+        assert False
+    except game.GameOver:
+        pass
+    assert game.winner is None and list(game.players) == []
+
+    if verbose:
+        print_board()
+
+
+test11_simultaneous()
+
+
+def test12_turn_order(verbose=False):
+    import journal
+    import turn
+    game.clear_state()
+
+    pls = [Goldfish(f"P{i}") for i in range(4)]
+    p0, p1, p2, p3 = pls
+    assert [game.next_player(p) for p in pls] == [p1, p2, p3, p0]
+    assert [game.prev_player(p) for p in pls] == [p3, p0, p1, p2]
+
+    t = turn.Turn(p1)
+    assert list(t.apnap_order()) == [p1, p2, p3, p0]
+
+    # an eliminated player leaves the turn order, but the player after them can still be found
+    cp = journal.checkpoint()
+    p2.life = 0
+    turn.check_sbas()
+    assert list(game.players) == [p0, p1, p3]
+    assert game.next_player(p1) == p3 and game.prev_player(p3) == p1
+    assert game.next_player(p2) == p3
+    assert list(t.apnap_order()) == [p1, p3, p0]
+    assert list(turn.Turn(p2).apnap_order()) == [p3, p0, p1]
+
+    journal.rollback(cp)
+    assert list(game.players) == pls and game.next_player(p1) == p2
+    assert list(t.apnap_order()) == [p1, p2, p3, p0]
+
+    # the active player bolts themself out of the game; the rest of the turn goes on without them
+    game.clear_state()
+    p0 = TestPlayer("P0", [None, "p Mountain", "a Mountain", "p Lightning Bolt>P0"], verbose)
+    p1, p2 = Goldfish("P1"), Goldfish("P2")
+    build_deck(p0, [mountain, lightning_bolt] * 10)
+    p0.life = 3
+    start_game()
+    do_turn()
+    assert list(game.players) == [p1, p2] and game.end_reason is None
+    assert game.turn.active_player == p1
+    do_turn()
+    assert game.turn.active_player == p2 and game.end_reason is None
+
+    if verbose:
+        print_board()
+
+
+test12_turn_order()
+
+
+def test13_async(verbose=False):
+    import asyncio
+    from async_engine import Agent, AsyncPlayer, AsyncGame, play_games
+    game.clear_state()
+    host = Goldfish("Host13")
+
+    class Passer(Agent):
+        def __init__(self, delay):
+            self.delay = delay
+            self.decisions = 0
+
+        def observe(self, player, kind, args):
+            return kind, game.turn_idx
+
+        async def decide(self, player, kind, observation):
+            self.decisions += 1
+            await asyncio.sleep(self.delay)
+            return None
+
+    fast, slow = Passer(0), Passer(10)
+
+    def setup_fast():
+        p0 = Aggressive("A")
+        AsyncPlayer("G", fast)
+        build_deck(p0, [memnite] * 7)
+
+    def setup_slow():
+        AsyncPlayer("S", slow)
+        Goldfish("T")
+
+    games = [AsyncGame(setup_fast), AsyncGame(setup_slow, timeout=0.001, max_turns=2)]
+    winners = asyncio.run(play_games(games))
+
+    # the same game as a synchronous one against a goldfish; and a game whose agent always times out
+    assert winners[0].name == "A" and winners[1] is None
+    assert fast.decisions > 0 and slow.decisions > 0
+    with games[0].view():
+        assert game.turn_idx == 6 and list(game.players) == [winners[0]]
+    with games[1].view():
+        assert game.turn_idx == 2
+    # the state that was current before is untouched
+    assert list(game.players) == [host] and not game.objects.keys() - {host.id}
+
+    if verbose:
+        print_board()
+
+
+test13_async()
+
+
+def test14_server(verbose=False):
+    import asyncio
+    import objectsets
+    import protocol
+    import server
+    import turn
+    game.clear_state()
+
+    stats = asyncio.run(server.bench(games=4, concurrency=2))
+    assert stats["games"] == 4 and stats["decisions"] > 0 and stats["draws"] == 0
+    assert sum(n for _, n in stats["wins"]) == 4
+    assert game.objects == {}
+
+    # answers that aren't legal decisions are treated as no answer
+    p0 = Goldfish("Test14")
+    Goldfish("Goldfish14")
+    build_deck(p0, [memnite])
+    start_game()
+    game.turn.start()
+    while not isinstance(game.turn.phase, turn.MainPhase):
+        game.turn.pass_priority()
+    obs = protocol.observe(p0, "action", ())
+    assert obs["options"] == [["play", p0.hand.get_top().id]] and obs["hand"] == [[p0.hand.get_top().id, "Memnite"]]
+    assert protocol.interpret(p0, "action", (), 0).card == p0.hand.get_top()
+    for bad in [1, -1, "0", [0]]:
+        assert protocol.interpret(p0, "action", (), bad) is None
+    choices = objectsets.zone(p0.hand)
+    assert protocol.interpret(p0, "objects", (choices, None, 1, 1, False), [p0.id]) is None
+
+    if verbose:
+        print_board()
+
+
+test14_server()
+
+
+def test15_subprocess_agent(verbose=False):
+    import asyncio
+    import subprocess_agent
+    game.clear_state()
+
+    stats = asyncio.run(subprocess_agent.bench(games=8, concurrency=8))
+    assert stats["games"] == 8 and sum(stats["wins"].values()) == 8 and None not in stats["wins"]
+    # decisions are held until every game is waiting for one, so each message carries several
+    assert stats["decisions_per_message"] >= 3, stats
+    assert game.objects == {}
+
+    if verbose:
+        print(stats)
+
+
+test15_subprocess_agent()
+
+
+def test16_carddefs(verbose=False):
+    import json
+    import os
+    import tempfile
+    import carddefs
+    import serialize
+    game.clear_state()
+    pool = carddefs.load()
+
+    p0 = TestPlayer("Test16", [None, "p Mountain", "a Mountain", "p Shock>Goldfish16", None,
+                               "p Lotus Petal", None, "a Lotus Petal.3", "p Lava Spike>Goldfish16"], verbose)
+    p1 = Goldfish("Goldfish16")
+    build_deck(p0, [wastes]*10 + [pool[n] for n in ["Lava Spike", "Lotus Petal", "Shock"]] + [mountain])
+    start_game()
+    do_turn()
+    assert p1.life == 15 and [c.name for c in p0.graveyard] == ["Shock", "Lotus Petal", "Lava Spike"]
+
+    # defined cards are prototypes, so games with them can be serialized
+    state = game_state()
+    serialize.loads(serialize.dumps(), players=[p0, p1])
+    assert game_state() == state
+
+    # later steps see what an earlier step targeted as it last existed
+    import effects
+    bears = Card(zone=game.battlefield, chars=grizzly_bears, owner=p1)
+    effects.put_counters(bears, "+1/+1", 1)
+    pool["Swords to Plowshares"].abilities[0].effect(p0, {"targets": {(0, 0): bears}})
+    assert p1.life == 18 and p0.life == 20 and not [ob for ob in game.battlefield if ob.name == "Grizzly Bears"]
+
+    # definitions are cached until their file changes, and bad ones are rejected
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "test.json")
+        with open(path, "w") as f:
+            json.dump([{"name": "Test Bolt", "cost": "R", "types": "instant",
+                        "spell": [{"effect": "damage", "amount": 3, "target": "damagable"}]}], f)
+        assert carddefs.load(path)["Test Bolt"].abilities[0].steps == [carddefs.DamageEffect("damagable", amount=3)]
+        assert os.path.exists(carddefs._cache_path(path))
+        assert "Test Bolt" in carddefs.load(path)
+        for bad in [{"name": "X", "cost": "T"}, {"name": "X", "spell": [{"effect": "damage", "amount": 1}]},
+                    {"name": "X", "types": "instant", "spell": [{"effect": "explode"}]},
+                    {"name": "X", "types": "instant", "spell": [{"effect": "gain_life", "amount": "its_power"}]},
+                    {"name": "X", "activated": [{"cost": "T", "effects": [{"effect": "destroy", "target": "nothing"}]}]}]:
+            with open(path, "w") as f:
+                json.dump([bad], f)
+            os.utime(path, ns=(1, 1))
+            try:
+                carddefs.load(path)
+                assert False, bad
+            except carddefs.CardDefinitionError:
+                pass
+
+    if verbose:
+        print_board()
+
+
+test16_carddefs()
+
+
+def test17_cardpool(verbose=False):
+    import carddefs
+    import cardpool
+    pool = cardpool.CardPool()
+    pool.add_file(carddefs.DEFAULT_FILE)
+
+    assert pool.query(types="creature", max_mv=1) == ["Ornithopter", "Raging Goblin", "Savannah Lions"]
+    assert pool.query(types="instant", colours="R") == ["Lightning Bolt", "Shatter", "Shock", "Zap"]
+    assert pool.query(keywords=["flying", "lifelink"]) == ["Vampire Nighthawk"]
+    assert pool.query(supertypes="legendary", colourless=True, min_mv=0) == ["Mox Emerald"]
+    # nothing is built until it's used
+    assert not pool._cards
+    c = pool.get("Serra Angel")
+    assert pool.get("Serra Angel") is c and c.has_keyword("vigilance") and list(pool._cards) == ["Serra Angel"]
+
+    # replacing a card updates its indexes
+    d = dict(carddefs.definitions(carddefs.DEFAULT_FILE)[0], keywords=["flying"])
+    pool.add(d)
+    assert d["name"] in pool.query(keywords="flying") and len(pool) == len(carddefs.load())
+    # a card has every colour asked for
+    pool.add(carddefs.normalize({"name": "Test Gold", "cost": "WU", "types": "instant"}))
+    assert pool.query(colours="UW") == ["Test Gold"] and "Test Gold" in pool.query(types="instant", colours="U")
+    try:
+        pool.get("Nonexistent")
+        assert False
+    except KeyError:
+        pass
+    pool.close()
+
+
+test17_cardpool()
+
+
+def test18_deck_search(verbose=False):
+    import deck_search
+    pool = [memnite, grizzly_bears, forest, mountain, lightning_bolt]
+    decks = [{pool[i].name for i in idxs} for idxs in deck_search.candidates(pool)]
+    # bears need two mana including green, and bolt needs red
+    assert {"Grizzly Bears", "Forest", "Mountain"} in decks and {"Grizzly Bears", "Forest", "Memnite"} not in decks
+    assert {"Memnite", "Lightning Bolt", "Forest"} not in decks and len(decks) == 4
+    assert deck_search.castable(grizzly_bears, [black_lotus]) and not deck_search.castable(grizzly_bears, [mountain, island])
+
+    res = deck_search.search(pool, [[memnite] * 3], top=3, workers=2)
+    assert len(res) == 3 and [r.score for r in res] == sorted((r.score for r in res), reverse=True)
+    assert all(r.games == 2 and r.interval()[0] <= r.score <= r.interval()[1] for r in res)
+
+    # games that raise count for nothing, and keep the deck out of the top
+    class Crashing(Aggressive):
+        def decide_action(self):
+            raise RuntimeError("crash")
+
+    errors = []
+    assert deck_search.search(pool, [[memnite] * 3], player=Crashing, workers=2, errors=errors) == []
+    assert len(errors) == 4 and all(r.errors and not r.games and not r.draws for r in errors)
+    lo, hi = deck_search.wilson_interval(5, 10)
+    assert abs(lo - 0.2366) < 1e-3 and abs(hi - 0.7634) < 1e-3
+
+    if verbose:
+        for r in res:
+            print(r)
+
+
+test18_deck_search()
+
+
+def test19_sequential_matchups(verbose=False):
+    import match
+    sprt = match.SPRT(0.4, 0.6, 0.05, 0.05)
+    for _ in range(7):
+        sprt.update(1)
+    # each win adds log(1.5), and it takes log(19) to accept H1
+    assert not sprt.done() and sprt.decision() is None
+    sprt.update(1)
+    assert sprt.done() and sprt.decision() == 1
+    ci = match.ConfidenceStop(width=0.3, decide=False)
+    while not ci.done():
+        ci.update(ci.games % 2)
+    assert ci.decision() is None and 30 < ci.games < 50
+
+    strong = [memnite] * 3
+    # the bears can't be cast with one forest
+    weak = [forest, grizzly_bears, grizzly_bears]
+    res = match.play_matchups([(strong, weak), (strong, strong)], max_games=20, workers=2)
+    # the one sided matchup is decided quickly, and the mirror gets the games
+    assert res[0].decision == 1 and res[0].losses == 0 and res[0].games < 10
+    assert res[1].games == 20 and res[1].decision is None
+
+    # games that raise have no outcome, and don't decide anything
+    class Crashing(Aggressive):
+        def decide_action(self):
+            raise RuntimeError("crash")
+
+    r, = match.play_matchups([(strong, weak)], max_games=6, player=Crashing, workers=2)
+    assert r.errors == 6 and r.reasons["error"] == 6 and r.games == 0 and r.decision is None and not r.rule.games
+
+    if verbose:
+        for r in res:
+            print(r)
+
+
+test19_sequential_matchups()
+
+
+def test20_scenarios(verbose=False):
+    import scenarios
+    corpus = scenarios.load()
+    # the budgets are for a quiet machine; this only checks the end states
+    results = scenarios.run(corpus, workers=2, repeat=1, scale=100)
+    assert all(r.passed for r in results), "\n".join(map(str, results))
+    assert all(r.peak_bytes > 0 and r.blocks > 0 for r in results)
+
+    s = dict(corpus[0], budget=0, expect={"turn": 4, "life": {"P1": 19}, "zones": {"P0": {"hand": 0}}})
+    res = scenarios.run_scenario(s, repeat=1, memory=False)
+    assert not res.passed and len(res.failures) == 4 and "budget" in res.failures[-1]
+
+    if verbose:
+        for r in results:
+            print(r)
+
+
+test20_scenarios()
+
+
+def test21_fast_combat(verbose=False):
+    import carddefs
+    import turn
+    defined = carddefs.load()
+
+    class Blocker(PlayCards):
+        """Doesn't attack, and blocks each attacker with up to per of its creatures"""
+        per = 1
+
+        def decide_blocks(self, atks):
+            free = list(game.turn.phase.legal_blockers(self))
+            blks = []
+            for atk in atks:
+                for blk in [b for b in free if permissions.can_block(b, atk)][:self.per]:
+                    free.remove(blk)
+                    blks.append((atk, blk))
+            return blks
+
+    class DoubleBlocker(Blocker):
+        per = 2
+
+    bears = [forest] * 3 + [grizzly_bears] * 4
+    knights = [plains] * 3 + [defined["White Knight"], defined["Savannah Lions"]] * 2
+    matchups = [(Aggressive, bears, Blocker, bears), (Aggressive, [memnite] * 7, Blocker, bears),
+                (Aggressive, bears, DoubleBlocker, [memnite] * 7), (Aggressive, knights, Blocker, bears),
+                (Aggressive, bears, Aggressive, [memnite] * 7)]
+    fast = [0]
+    orig = turn.DamageStep.vanilla_damage
+
+    def counted(self, *args):
+        res = orig(self, *args)
+        fast[0] += res is not None
+        return res
+
+    def states(cls0, deck0, cls1, deck1):
+        game.clear_state()
+        # so that the objects in both games get the same ids
+        game.next_id = 0
+        p0, p1 = cls0("P0"), cls1("P1")
+        build_deck(p0, deck0)
+        build_deck(p1, deck1)
+        start_game()
+        res = []
+        try:
+            for _ in range(20):
+                do_turn()
+                res.append(game_state())
+        except game.GameOver:
+            res.append(game_state())
+        return res
+
+    turn.DamageStep.vanilla_damage = counted
+    try:
+        for m in matchups:
+            turn.fast_combat = True
+            with_fast = states(*m)
+            turn.fast_combat = False
+            assert with_fast == states(*m), matchups.index(m)
+    finally:
+        turn.fast_combat = True
+        turn.DamageStep.vanilla_damage = orig
+    assert fast[0] > 0
+
+    if verbose:
+        print(f"{fast[0]} combats resolved directly")
+
+
+test21_fast_combat()
+
+
+def test22_step_table(verbose=False):
+    import carddefs
+    import turn
+    defined = carddefs.load()
+    game.clear_state()
+
+    class Recorder(Aggressive):
+        """Records the steps in which it gets priority, and a copy of the turn in the first damage step"""
+        steps = []
+        copy = None
+
+        def decide_action(self):
+            Recorder.steps.append((game.turn_idx, game.turn.step.name))
+            if game.turn.step.name == "damage" and Recorder.copy is None:
+                Recorder.copy = (game.turn, game.turn.copy())
+            return super().decide_action()
+
+    p0 = Recorder("Test22")
+    p1 = Goldfish("Goldfish22")
+    build_deck(p0, [plains, defined["White Knight"]] * 4)
+    build_deck(p1, [forest] * 10)
+    start_game()
+    t = game.turn
+    # the turn is only a position in the shared step table, and nothing has attacked yet
+    assert t.step is turn.STEPS[0] and t.combat is None and not turn.PHASES[2].attackers
+    assert t.position == (t.skipped << 8) and turn.STEPS[t.skipped.bit_length() - 1].name == "draw"
+    for _ in range(5):
+        do_turn()
+
+    # without first strikers, there's no first strike damage step, and without attackers, no damage at all
+    assert (0, "blocks") not in Recorder.steps and (0, "damage") not in Recorder.steps
+    assert (4, "first strike damage") in Recorder.steps and (4, "damage") in Recorder.steps
+    orig, c = Recorder.copy
+    assert c.combat.first_strikers == c.combat.attackers and c.combat.attackers
+    assert c.combat.attackers is not orig.combat.attackers and c.step.name == "damage" and orig.finished
+
+    if verbose:
+        print(Recorder.steps)
+
+
+test22_step_table()
+
+
+def test23_mana_vectors(verbose=False):
+    import pickle
+    from cost import ManaCost, can_pay_all, VECTORIZE_AT
+    import mana
+    assert ManaCost("1G") is ManaCost({"G": 1, "gen": 1}) is ManaCost("G") + ManaCost(1)
+    assert ManaCost("10").mana_value() == 10 and str(ManaCost("10UU")) == "10UU"
+    assert pickle.loads(pickle.dumps(ManaCost("2WW"))) is ManaCost("2WW")
+
+    game.clear_state()
+    p = Goldfish("Test23")
+    p.mana_pool += "RRG"
+    p.mana_pool += 1
+    assert p.mana_pool["R"] == 2 and str(p.mana_pool) == "1RRG"
+    costs = [ManaCost(s) for s in ["R", "RRR", "1G", "3G", "2RG", "GG", "4", "5", "C"]] * (VECTORIZE_AT // 9 + 1)
+    want = [c.can_pay(p) for c in costs]
+    assert want[:9] == [True, False, True, True, True, False, True, False, True]
+    assert can_pay_all(costs, p) == want and can_pay_all(costs[:9], p) == want[:9]
+
+    p.mana_pool.spend("gen", 2, None)
+    assert p.mana_pool.amounts == mana.vector("RG")[:mana.GEN] and not ManaCost("2RG").can_pay(p)
+    p.mana_pool.empty()
+    assert str(p.mana_pool) == "0"
+
+
+test23_mana_vectors()
+
+
+def test24_tablebase(verbose=False):
+    import os
+    import tempfile
+    import numpy as np
+    from tablebase import Tablebase, TablebasePlayer, TablebaseError, result
+    tb = Tablebase.generate([memnite, grizzly_bears], max_creatures=2, max_life=6)
+    assert result(tb.probe(["Grizzly Bears"], [], 5, 2)) == ("win", 1)
+    assert result(tb.probe([], [("Grizzly Bears", False)], 2, 5)) == ("loss", 2)
+    # chump blocking twice puts the loss off as long as it can be
+    assert result(tb.probe(["Memnite"], [("Grizzly Bears", False)], 3, 3)) == ("loss", 6)
+    assert result(tb.probe(["Memnite"], [("Memnite", False)], 3, 3)) == ("draw", None)
+    assert tb.probe(["Memnite"], [], 7, 3) is None and tb.probe(["Tim"], [], 3, 3) is None
+    try:
+        Tablebase([tim], 1, 1)
+        assert False
+    except TablebaseError:
+        pass
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "memnite.npy")
+        tb = Tablebase.generate([memnite], max_creatures=3, max_life=20, path=path)
+        assert isinstance(tb.table, np.memmap)
+        assert (Tablebase.open(path).table == Tablebase.generate([memnite], 3, 20).table).all()
+
+        for n0, n1 in [(3, 2), (2, 3)]:
+            game.clear_state()
+            pls = [TablebasePlayer("P0", tb), Aggressive("P1")]
+            build_deck(pls[0], [memnite] * n0)
+            build_deck(pls[1], [memnite] * n1)
+            start_game(pls[0])
+            do_turn()
+            do_turn()
+            outcome, n = result(tb.probe_game(pls[0]))
+            try:
+                while game.turn_idx < 60:
+                    do_turn()
+            except game.GameOver:
+                pass
+            if verbose:
+                print(n0, n1, outcome, n, game.winner, game.turn_idx)
+            if outcome == "win":
+                assert game.winner == pls[0] and game.turn_idx <= 1 + n
+            else:
+                # the opponent attacks with everything, which is the fastest win, and the loss is put off until then
+                assert game.winner == pls[1] and game.turn_idx == 1 + n
+        del tb
+
+
+test24_tablebase()
+
+
+def test25_game_limits(verbose=False):
+    import limits
+    from match import play_game
+
+    def play(decks, player=Goldfish, **kwargs):
+        game.clear_state()
+        pls = [player("P0"), player("P1")]
+        for p, d in zip(pls, decks):
+            build_deck(p, d)
+        try:
+            with limits.limited(**kwargs):
+                start_game()
+                while True:
+                    do_turn()
+        except game.GameOver:
+            pass
+        if verbose:
+            print(game.end_reason, game.winner, game.turn_idx)
+        return game.end_reason, game.winner, game.turn_idx
+
+    # with nothing to draw, P0's turn 0 position comes back on turns 2 and 4
+    assert play([[], []]) == ("repetition", None, 4)
+    assert play([[], []], repetitions=2) == ("repetition", None, 2)
+    # drawing changes the position, but not the board
+    assert play([[forest] * 20, [forest] * 20], stall_turns=6) == ("stall", None, 6)
+    assert play([[forest] * 20, [forest] * 20], stall_turns=None, max_turns=9) == ("turn limit", None, 9)
+    assert play([[forest] * 20, [forest] * 20], max_priority=5)[0] == "priority limit"
+    reason, winner, _ = play([[memnite] * 3, []], Aggressive)
+    assert reason == "loss" and winner.name == "P0"
+
+    assert play_game([memnite] * 3, [memnite] * 3, max_turns=4) is None and game.end_reason == "turn limit"
+    assert limits.settings == limits.Limits()
+
+
+test25_game_limits()
+
+
+def test26_engine_stats(verbose=False):
+    import os
+    import tempfile
+    import stats
+    from match import play_matchups, FixedGames
+
+    game.clear_state()
+    stats.reset()
+    p0 = Aggressive("P0")
+    p1 = Goldfish("P1")
+    build_deck(p0, [memnite] * 3 + [forest])
+    build_deck(p1, [])
+    start_game()
+    try:
+        while True:
+            do_turn()
+    except game.GameOver:
+        pass
+    s = stats.current.copy()
+    if verbose:
+        print(s.to_prometheus())
+    # a land and three memnites are drawn and played
+    assert s.get("moves", **{"from": "library", "to": "hand"}) == 4
+    assert s.get("moves", **{"from": "hand", "to": "battlefield"}) == 1
+    assert s.get("moves", **{"from": "hand", "to": "stack"}) == 3
+    assert s.get("moves") == 11 and s.get("objects_created") == 11 + 4 + 2
+    # Aggressive also taps its forest for mana every turn
+    assert s.get("actions") == 4 + 8 and s.get("stack_resolutions") == 3
+    # each active player is asked for attacks, and P1 for blocks on each of P0's attacks
+    assert s.get("decisions", hook="attacks") == game.turn_idx + 1 and s.get("decisions", hook="blocks") == 7
+    assert s.get("priority_passes") > s.get("decisions", hook="attacks") and s.get("sba_checks") > 0
+    assert s.get("sba_actions") == 0 and s.get("objectset_iterations") > 0
+
+    text = s.to_prometheus(deck="mem\"nite")
+    assert "# TYPE mtg_moves_total counter" in text
+    assert 'mtg_moves_total{deck="mem\\"nite",from="hand",to="stack"} 3' in text
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "engine.prom")
+        (s + s).write_prometheus(path)
+        with open(path) as f:
+            assert "mtg_actions_total 24\n" in f.read()
+        assert os.listdir(d) == ["engine.prom"]
+
+    res, = play_matchups([([memnite] * 3, [grizzly_bears])], lambda: FixedGames(3), workers=2)
+    assert res.stats.get("games") == res.games and res.stats.get("decisions", hook="attacks") > 0
+    assert res.reasons["loss"] == res.games
+    stats.reset()
+    assert not stats.current.counts
+
+    # each game kept in a GameState counts into its own stats
+    stats.count(stats.key("actions"))
+    other = game.GameState()
+    other.swap()
+    assert not stats.current.counts
+    stats.count(stats.key("actions"), 2)
+    other.swap()
+    assert stats.current.get("actions") == 1 and other.values["stats", "current"].get("actions") == 2
+    stats.reset()
+
+
+test26_engine_stats()
+
+
+def test27_memory_across_games(verbose=False):
+    import benchmark
+
+    game.clear_state()
+    p0 = Aggressive("P0")
+    build_deck(p0, [lightning_bolt, mountain])
+    build_deck(Goldfish("P1"), [])
+    start_game()
+    do_turn()
+    bolt = p0.graveyard.get_top()
+    game.clear_state()
+    # a player that's still held on to doesn't keep its cards
+    assert not p0.hand and not p0.graveyard and not p0.library and bolt.dead
+    assert game.next_id == 0 and not game.objects
+    del p0, bolt
+
+    report = benchmark.memory(games=6, warmup=2, top=2)
+    if verbose:
+        print(report)
+    assert report.live == [0] * 6 and len(report.top) == 6 and all(len(t) == 2 for t in report.top)
+    assert report.failures(max_growth=1024) == []
+
+    kept = []
+
+    class Hoarder(Aggressive):
+        def decide_attacks(self):
+            kept.extend(game.battlefield)
+            return super().decide_attacks()
+
+    report = benchmark.memory(games=4, warmup=1, top=1, player=Hoarder)
+    assert kept and report.live[-1] > 0 and any("outlived" in f for f in report.failures(max_growth=1e9))
+    del kept[:]
+
+
+test27_memory_across_games()
+
+
+def test28_vector_env(verbose=False):
+    from actions import legal_actions
+    from async_engine import Agent, AsyncPlayer
+    from vecenv import VectorEnv, drive
+    game.clear_state()
+    host = Goldfish("Host28")
+
+    class Indices(Agent):
+        """Offers the legal actions and attackers by index"""
+
+        def observe(self, player, kind, args):
+            if kind == "action":
+                return len(list(legal_actions(player)))
+            if kind == "attacks":
+                return len(game.turn.phase.legal_attackers(player))
+
+        def interpret(self, player, kind, args, answer):
+            if kind == "action":
+                return None if answer is None else list(legal_actions(player))[answer]
+            if kind == "attacks":
+                return list(game.turn.phase.legal_attackers(player))[:answer]
+            return answer
+
+    agent = Indices()
+
+    def setup(n):
+        def f():
+            build_deck(AsyncPlayer("A", agent), [memnite] * n)
+            build_deck(AsyncPlayer("B", agent), [memnite] * 2)
+        return f
+
+    env = VectorEnv([setup(n) for n in (1, 3, 7)], max_turns=40)
+    reqs = env.reset()
+    assert [r.game for r in reqs] == [0, 1, 2] and {r.kind for r in reqs} == {"action"}
+    steps = 0
+    dones = [False] * 3
+    while not all(dones):
+        # the whole batch is answered at once: play the first action, and attack with everything
+        answers = [None if r is None or not r.observation else
+                   0 if r.kind == "action" else r.observation for r in reqs]
+        reqs, rewards, dones, infos = env.step(answers)
+        steps += 1
+        assert all((r is None) == d for r, d in zip(reqs, dones))
+    if verbose:
+        print(steps, infos, rewards)
+    # the side with more memnites wins the race; the same number is a race the first player wins
+    assert [i["winner"] for i in infos] == ["B", "A", "A"] and all(i["end_reason"] == "loss" for i in infos)
+    # every seat gets its reward when a game ends
+    assert [i["rewards"] for i in infos] == [[-1, 1], [1, -1], [1, -1]] and infos[0]["winner_seat"] == 1
+
+    # players are told apart by seat, not name
+    def same_names():
+        build_deck(AsyncPlayer("X", agent), [memnite] * 3)
+        build_deck(AsyncPlayer("X", agent), [memnite])
+
+    env2 = VectorEnv([same_names], max_turns=40)
+    reqs = env2.reset()
+    last = None
+    while reqs[0] is not None:
+        last = reqs[0]
+        reqs, rewards, dones, infos = env2.step([0 if last.kind == "action" and last.observation else
+                                                 last.observation if last.kind == "attacks" else None])
+    assert infos[0]["rewards"] == [1, -1] and rewards[0] == infos[0]["rewards"][last.seat]
+    env2.close()
+    with env.results[2].view():
+        assert game.turn_idx == 6
+
+    # abandoning a game part way through unwinds its thread
+    gen = drive(setup(7))
+    req = next(gen)
+    for _ in range(20):
+        req = gen.send(0 if req.kind == "action" and req.observation else None)
+    gen.close()
+    env.close()
+    # the state that was current before is untouched
+    assert list(game.players) == [host] and not game.objects.keys() - {host.id}
+
+
+test28_vector_env()
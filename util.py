@@ -5,3 +5,30 @@ def copy_excluding(x, attrs):
         if v not in attrs:
             y.__dict__[k] = v
     return y
+
+
+_bits = {}
+_num_bits = 0
+
+
+def bit(name: str) -> int:
+    """Returns the bit that represents a type, supertype, subtype or keyword in the masks of Characteristics.
+    Names are case insensitive, and are interned the first time they are seen."""
+    global _num_bits
+    b = _bits.get(name)
+    if b is None:
+        key = name.lower()
+        b = _bits.get(key)
+        if b is None:
+            b = _bits[key] = 1 << _num_bits
+            _num_bits += 1
+        _bits[name] = b
+    return b
+
+
+def mask(names) -> int:
+    """Returns the mask with the bits of each of the given names"""
+    m = 0
+    for n in names:
+        m |= bit(n)
+    return m
@@ -0,0 +1,189 @@
+"""
+Playing many games in lockstep, for players whose decisions are made in batches, such as by a model.
+
+The engine asks for decisions from deep inside the rules code, so a game is driven the same way as in async_engine:
+it's played in a thread of its own, with its state swapped in while it runs. drive turns that into a generator, which
+yields a Request each time an AsyncPlayer must decide, and is sent the answer. The requests' observations, and the
+answers' interpretation, come from the players' agents (see async_engine.Agent); their decide is never called.
+
+A VectorEnv steps a number of such games together. reset starts them and returns the first request of each; step
+takes an answer for each game still going, advances every game to its next request, and returns the new requests,
+along with rewards, whether each game is done, and how it ended. Players are identified by their seats, the order in
+which they joined their game, as names needn't be unique; a game that's done gives a reward to every seat. The answers to a whole batch of requests can be
+worked out at once, such as by scoring every observation with one call to a model.
+"""
+
+import queue
+import threading
+from dataclasses import dataclass
+import game
+from async_engine import AsyncGame
+
+
+@dataclass
+class Request:
+    """A decision an AsyncPlayer must make: kind is the name of the Player method that asked, without "decide_", and
+    observation is what its agent's observe returned. seat is the player's seat in their game, and game is the index of
+    the game in a VectorEnv."""
+    player: str
+    kind: str
+    observation: object
+    seat: int = None
+    game: int = None
+
+
+class _Abandoned(BaseException):
+    """Raised in a game's thread to unwind it when its driver is closed"""
+    pass
+
+
+_ABANDON = object()
+
+
+class GameDriver(AsyncGame):
+    """A game whose decisions are handed back to whoever is driving it, one at a time"""
+
+    def __init__(self, setup, max_turns: int = None):
+        super().__init__(self._setup, max_turns=max_turns)
+        self._make = setup
+        # the game's players by seat; they're kept after they leave the game
+        self.players = []
+        self.error = None
+        self._answers = queue.Queue()
+        self._requests = queue.Queue()
+        self._thread = None
+
+    def _setup(self):
+        self._make()
+        self.players = list(game.players)
+
+    def rewards(self) -> list:
+        """Returns the reward for each seat once the game has ended: 1 for the winner, -1 for the other players if
+        there is a winner, and 0 for everyone if there isn't"""
+        if self.winner is None:
+            return [0] * len(self.players)
+        return [1 if p is self.winner else -1 for p in self.players]
+
+    def _request(self, pl, kind: str, obs):
+        self._suspend()
+        try:
+            self._requests.put(Request(pl.name, kind, obs, self.players.index(pl)))
+            answer = self._answers.get()
+        finally:
+            self._resume()
+        if answer is _ABANDON:
+            raise _Abandoned()
+        return answer
+
+    def _main(self):
+        try:
+            self._run()
+        except _Abandoned:
+            pass
+        except BaseException as e:
+            self.error = e
+        finally:
+            self._requests.put(None)
+
+    def start(self) -> Request:
+        """Starts the game, returning its first request, or None if it ended without one"""
+        self._thread = threading.Thread(target=self._main, daemon=True)
+        self._thread.start()
+        return self._next()
+
+    def send(self, answer) -> Request:
+        """Answers the last request, returning the next one, or None if the game has ended"""
+        self._answers.put(answer)
+        return self._next()
+
+    def _next(self):
+        req = self._requests.get()
+        if req is None and self.error is not None:
+            raise self.error
+        return req
+
+    def close(self):
+        """Abandons the game if it's waiting for an answer"""
+        if self._thread is not None and not self.finished:
+            self._answers.put(_ABANDON)
+            self._thread.join()
+
+
+def drive(setup, max_turns: int = None):
+    """
+    Plays a game, created by setup as for an AsyncGame, yielding a Request each time an AsyncPlayer must decide; the
+    answer is sent back in. Returns the game's driver once it has ended, from which its winner can be read.
+    Closing the generator abandons the game.
+    """
+    d = GameDriver(setup, max_turns)
+    try:
+        req = d.start()
+        while req is not None:
+            req = d.send((yield req))
+    finally:
+        d.close()
+    return d
+
+
+class VectorEnv:
+    """A batch of games stepped together; setups[i] creates the players and cards of game i"""
+
+    def __init__(self, setups: list, max_turns: int = None):
+        self.setups = list(setups)
+        self.max_turns = max_turns
+        self.games = [None] * len(self.setups)
+        self.requests = [None] * len(self.setups)
+        self.results = [None] * len(self.setups)
+
+    def __len__(self):
+        return len(self.setups)
+
+    def _advance(self, i: int, answer=None, first=False):
+        try:
+            req = next(self.games[i]) if first else self.games[i].send(answer)
+            req.game = i
+            self.requests[i] = req
+        except StopIteration as stop:
+            self.requests[i] = None
+            self.results[i] = stop.value
+
+    def reset(self, indices=None) -> list:
+        """Starts the games with the given indices, or all of them, over; returns every game's request"""
+        for i in range(len(self)) if indices is None else indices:
+            if self.games[i] is not None:
+                self.games[i].close()
+            self.games[i] = drive(self.setups[i], self.max_turns)
+            self.results[i] = None
+            self._advance(i, first=True)
+        return list(self.requests)
+
+    def step(self, answers: list) -> tuple:
+        """
+        Answers each game's request with the answer at its index, which is ignored for games that are done, and
+        advances them to their next requests. Returns (requests, rewards, dones, infos): each game's next request, or
+        None once it's done; the reward for the seat whose request was answered, from the game's rewards if it ended
+        and 0 otherwise; whether the game is done; and for a game that's done, its winner's name and seat, why it
+        ended, and "rewards", the reward for every seat (see GameDriver.rewards). The other seats get their terminal
+        rewards only through that.
+        """
+        rewards = [0] * len(self)
+        for i, req in enumerate(self.requests):
+            if req is None:
+                continue
+            self._advance(i, answers[i])
+            if self.requests[i] is None:
+                rewards[i] = self.results[i].rewards()[req.seat]
+        dones = [r is None for r in self.requests]
+        infos = [{} if r is None else {"winner": r.winner.name if r.winner else None,
+                                       "winner_seat": r.players.index(r.winner) if r.winner else None,
+                                       "end_reason": r.end_reason, "rewards": r.rewards()}
+                 for r in self.results]
+        return list(self.requests), rewards, dones, infos
+
+    def close(self):
+        """Abandons every game that's still going"""
+        for g in self.games:
+            if g is not None:
+                g.close()
+        self.games = [None] * len(self)
+        self.requests = [None] * len(self)